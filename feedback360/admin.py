@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth import get_user_model
 from .models import Role, UserRole, SurveyTemplate, Question, Survey, RaterGroup, Respondent, Rater, \
-    Response, User
+    Response, User, TemplateVersion, Report, allocate_sort_orders
 from django.contrib import admin
 from .models import SurveyTemplate
 
@@ -35,6 +35,15 @@ class CustomUserAdmin(BaseUserAdmin):
     inlines = [UserRoleInline]
 
 
+class QuestionInline(admin.TabularInline):
+    model = Question
+    fk_name = 'template'
+    fields = ('text', 'answer_type', 'is_required', 'sort_order')
+    extra = 1
+    verbose_name = 'Вопрос шаблона'
+    verbose_name_plural = 'Вопросы шаблона'
+
+
 # Админки для остальных моделей
 @admin.register(Role)
 class RoleAdmin(admin.ModelAdmin):
@@ -48,14 +57,35 @@ class SurveyTemplateAdmin(admin.ModelAdmin):
     list_display = ('name', 'created_by', 'is_active', 'created_at')
     list_filter = ('is_active', 'created_by')
     actions = ['activate_templates', 'deactivate_templates']
+    inlines = [QuestionInline]
+
+    def save_formset(self, request, form, formset, change):
+        instances = formset.save(commit=False)
+        if formset.model is Question:
+            # Новым вопросам без порядка выдаём номера одним блоком
+            new_questions = [question for question in instances if not question.pk and not question.sort_order]
+            sort_orders = allocate_sort_orders(len(new_questions), template_id=form.instance.pk)
+            for question, sort_order in zip(new_questions, sort_orders):
+                question.sort_order = sort_order
+        for obj in formset.deleted_objects:
+            obj.delete()
+        for instance in instances:
+            instance.save()
+        formset.save_m2m()
+
+    @staticmethod
+    def set_templates_active(queryset, is_active):
+        # Массовое обновление не вызывает сигналы: версию и updated_at (ETag списка
+        # шаблонов и ключ кэша каталога) поднимаем тем же UPDATE
+        SurveyTemplate.bump_version(*queryset.values_list('pk', flat=True), is_active=is_active)
 
     def activate_templates(self, request, queryset):
-        queryset.update(is_active=True)
+        self.set_templates_active(queryset, True)
 
     activate_templates.short_description = "Активировать выбранные шаблоны"
 
     def deactivate_templates(self, request, queryset):
-        queryset.update(is_active=False)
+        self.set_templates_active(queryset, False)
 
     deactivate_templates.short_description = "Деактивировать выбранные шаблоны"
 
@@ -66,6 +96,12 @@ class SurveyTemplateAdmin(admin.ModelAdmin):
         return request.user.is_superuser
 
 
+@admin.register(TemplateVersion)
+class TemplateVersionAdmin(admin.ModelAdmin):
+    list_display = ('template', 'number', 'created_at')
+    list_filter = ('template',)
+
+
 @admin.register(Question)
 class QuestionAdmin(admin.ModelAdmin):
     list_display = ('text', 'template', 'answer_type')
@@ -108,5 +144,12 @@ class ResponseAdmin(admin.ModelAdmin):
     search_fields = ('rater__user__username',)
 
 
+@admin.register(Report)
+class ReportAdmin(admin.ModelAdmin):
+    list_display = ('respondent', 'survey', 'generated_at', 'generated_by')
+    list_filter = ('survey',)
+    search_fields = ('respondent__user__username',)
+
+
 # Регистрируем кастомную модель User последней
 admin.site.register(User, CustomUserAdmin)
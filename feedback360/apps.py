@@ -7,4 +7,4 @@ class Feedback360Config(AppConfig):
 
     def ready(self):
         # Импортируем сигналы здесь, если они есть
-        pass
\ No newline at end of file
+        from . import signals  # noqa: F401
\ No newline at end of file
@@ -0,0 +1,70 @@
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.cache import CacheMiddleware
+
+CACHE_VERSION_KEY = 'feedback360:cache_version:{namespace}'
+
+# Страницы, которые отдаются анонимным пользователям (форма оценки по ссылке)
+PUBLIC_PAGES = 'public_pages'
+
+
+def get_cache_version(namespace):
+    """Текущая версия группы ключей кэша.
+
+    Версия хранится в самом кэше, поэтому при CACHE_BACKEND=locmem она своя
+    у каждого процесса: смена версии в одном процессе другим не видна. Для
+    данных, которые должны сбрасываться во всех процессах, ключ строится из
+    значений в БД (см. cache_public_page, навигацию в base.html). Начальное
+    значение берётся от времени, чтобы после вытеснения ключа версии из кэша
+    не вернуться к старым записям.
+    """
+    return cache.get_or_set(CACHE_VERSION_KEY.format(namespace=namespace), time.time_ns, None)
+
+
+def bump_cache_version(namespace):
+    """Делает все ключи группы неактуальными (в общем кэше - во всех процессах)"""
+    key = CACHE_VERSION_KEY.format(namespace=namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def cache_public_page(get_stamp, timeout=None):
+    """Кэширует страницу целиком, но только для анонимных пользователей.
+
+    Для вошедших пользователей страница содержит их навигацию и сообщения,
+    поэтому она всегда строится заново. get_stamp(request, *args, **kwargs)
+    возвращает строку из БД, которая меняется вместе с содержимым страницы;
+    она входит в ключ, поэтому изменения видны во всех процессах без сброса
+    кэша. None - страница не кэшируется. Как обычный cache_page, ключ
+    учитывает заголовок Vary.
+
+    Страница с CSRF-токеном отдаётся с Vary: Cookie, а cookie csrftoken у
+    каждого браузера своя, поэтому такой кэш фактически личный: он ускоряет
+    повторные открытия ссылки тем же браузером, а первое открытие всегда
+    строит страницу. Ответы с never_cache (например, LoginView) не
+    кэшируются вовсе.
+    """
+    if timeout is None:
+        timeout = settings.CACHE_MIDDLEWARE_SECONDS
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.user.is_authenticated:
+                return view_func(request, *args, **kwargs)
+            stamp = get_stamp(request, *args, **kwargs)
+            if stamp is None:
+                return view_func(request, *args, **kwargs)
+            middleware = CacheMiddleware(
+                lambda request: view_func(request, *args, **kwargs),
+                page_timeout=timeout,
+                key_prefix=f'{PUBLIC_PAGES}:{stamp}'
+            )
+            return middleware(request)
+        return wrapper
+    return decorator
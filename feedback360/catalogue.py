@@ -0,0 +1,52 @@
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import SurveyTemplate
+
+CATALOGUE_CACHE_KEY = 'feedback360:template_catalogue:{variant}:{stamp}'
+CATALOGUE_CACHE_TIMEOUT = 60 * 60
+
+
+def catalogue_stamp():
+    """Отметка состояния шаблонов из БД: количество и время последнего изменения.
+
+    Правка шаблона или его вопросов сдвигает updated_at (сигналы и
+    bump_version), удаление - количество. Отметка одинакова во всех
+    процессах, поэтому по ней строятся и ETag списка, и ключ кэша каталога.
+    """
+    stamp = SurveyTemplate.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+    updated = stamp['updated'].timestamp() if stamp['updated'] else 0
+    return f"{stamp['count']}-{updated}"
+
+
+def catalogue_cache_key(can_manage, stamp):
+    return CATALOGUE_CACHE_KEY.format(variant='manage' if can_manage else 'view', stamp=stamp)
+
+
+def get_template_catalogue():
+    """Шаблоны с количеством вопросов, посчитанным в том же запросе"""
+    return SurveyTemplate.objects.annotate(question_count=Count('template_questions'))
+
+
+def render_template_catalogue(can_manage, stamp=None):
+    """Возвращает готовый HTML списка шаблонов.
+
+    Список одинаков для всех пользователей с одинаковыми правами, поэтому он
+    хранится в кэше в двух вариантах (с кнопками управления и без). Ключ
+    содержит отметку catalogue_stamp(): после изменения шаблонов любой
+    процесс обращается к новому ключу, даже если кэш у процессов свой
+    (locmem), а устаревшие записи истекают сами.
+    """
+    if stamp is None:
+        stamp = catalogue_stamp()
+    key = catalogue_cache_key(can_manage, stamp)
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string('feedback360/partials/template_catalogue.html', {
+            'templates': get_template_catalogue(),
+            'can_manage': can_manage,
+        })
+        cache.set(key, html, CATALOGUE_CACHE_TIMEOUT)
+    return mark_safe(html)
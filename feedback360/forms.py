@@ -3,9 +3,10 @@ from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from .models import Survey, Respondent, Question, Response, SurveyTemplate, Rater
+from .search import get_user_labels, user_label
 import logging
 logger = logging.getLogger(__name__)
-from django.forms import inlineformset_factory
+from django.forms import inlineformset_factory, BaseInlineFormSet
 
 
 User = get_user_model()
@@ -57,10 +58,91 @@ class RespondentForm(forms.ModelForm):
             'user': forms.Select(attrs={'autocomplete': 'off'}),
         }
 
+    def __init__(self, *args, users=None, user_labels=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.users = users
+        self.user_labels = user_labels
+        if users is not None:
+            # Пользователи уже загружены формсетом - не ходим в БД для каждой формы
+            self.fields['user'].to_python = self._user_from_preloaded
+        # В списке только выбранный пользователь, остальных подбирает поиск (user_search)
+        self.fields['user'].choices = self._selected_user_choices()
+
+    def _selected_user_id(self):
+        if self.is_bound:
+            value = self.data.get(self.add_prefix('user'))
+            return int(value) if value and str(value).isdigit() else None
+        return self.instance.user_id
+
+    def _selected_user_choices(self):
+        choices = [('', self.fields['user'].empty_label)]
+        user_id = self._selected_user_id()
+        if user_id is None:
+            return choices
+
+        if self.user_labels is not None:
+            # Подписи общие для всего формсета
+            label = self.user_labels.get(user_id)
+        else:
+            user = self.users.get(user_id) if self.users is not None else User.objects.filter(pk=user_id).first()
+            label = user_label(user) if user is not None else None
+        if label is not None:
+            choices.append((user_id, label))
+        return choices
+
+    def _user_from_preloaded(self, value):
+        field = self.fields['user']
+        if value in field.empty_values:
+            return None
+        try:
+            return self.users[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(
+                field.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        if self.users is not None:
+            # Существование пользователя уже проверено при загрузке
+            exclude.add('user')
+        return exclude
+
+
+class BaseRespondentFormSet(BaseInlineFormSet):
+    """Загружает всех выбранных пользователей одним запросом на весь формсет.
+
+    Подписи для списков выбора тоже считаются один раз и передаются всем
+    формам, поэтому формсет из N форм строится за линейное время.
+    """
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['user'].queryset = User.objects.all()
-        self.fields['user'].label_from_instance = lambda obj: obj.get_display_name()
+        self.users = self._load_selected_users() if self.is_bound else None
+        self.user_labels = self._load_user_labels()
+
+    def _load_user_labels(self):
+        if self.users is not None:
+            return get_user_labels(self.users.keys(), self.users)
+        return get_user_labels(
+            user_id for user_id in self.get_queryset().values_list('user_id', flat=True)
+        )
+
+    def _load_selected_users(self):
+        user_ids = set()
+        for i in range(self.total_form_count()):
+            value = self.data.get(f'{self.add_prefix(i)}-user')
+            if value and str(value).isdigit():
+                user_ids.add(int(value))
+        return User.objects.in_bulk(user_ids) if user_ids else {}
+
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        kwargs['users'] = self.users
+        kwargs['user_labels'] = self.user_labels
+        return kwargs
 
 class CustomDeleteCheckbox(forms.CheckboxInput):
     template_name = 'feedback360/custom_delete_checkbox.html'
@@ -104,6 +186,14 @@ class QuestionForm(forms.ModelForm):
             return cleaned_data
 
 
+
+class TemplateQuestionForm(forms.ModelForm):
+    """Добавление и правка одного вопроса шаблона через JSON API"""
+
+    class Meta:
+        model = Question
+        fields = ['text', 'answer_type', 'is_required']
+
 QuestionFormSet = inlineformset_factory(
     SurveyTemplate,
     Question,
@@ -122,7 +212,10 @@ RespondentFormSet = inlineformset_factory(
     Survey,
     Respondent,
     form=RespondentForm,
+    formset=BaseRespondentFormSet,
     extra=1,
+    max_num=5000,
+    absolute_max=5000,
     can_delete=True,
     fields=('user',),
     widgets={
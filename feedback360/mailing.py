@@ -0,0 +1,162 @@
+import logging
+import smtplib
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Rater, Survey
+from .tokens import build_rater_access_url
+from .utils import InvitationRenderer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INVITATION_BATCH_SIZE = 200
+
+# Сервер отклонил одно письмо, но соединение осталось рабочим
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+def get_batch_size():
+    return getattr(settings, 'INVITATION_BATCH_SIZE', DEFAULT_INVITATION_BATCH_SIZE)
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class DeliveryStats:
+    """Итоги рассылки: отправлено, ошибок и скорость в письмах в секунду"""
+
+    def __init__(self, sent=0, failed=0, elapsed=0.0):
+        self.sent = sent
+        self.failed = failed
+        self.elapsed = elapsed
+
+    @property
+    def rate(self):
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+    def __add__(self, other):
+        return DeliveryStats(
+            self.sent + other.sent,
+            self.failed + other.failed,
+            self.elapsed + other.elapsed
+        )
+
+    def __str__(self):
+        return (f"отправлено {self.sent}, ошибок {self.failed}, "
+                f"{self.elapsed:.2f} с, {self.rate:.1f} писем/с")
+
+    def as_dict(self):
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'elapsed': self.elapsed,
+            'rate': self.rate,
+        }
+
+
+def claim_invitations(rater_ids):
+    """Захватывает оценивающих для рассылки и возвращает ID, доставшиеся этому вызову.
+
+    Отметка invitation_sent ставится до отправки условным UPDATE каждой
+    строки, поэтому из пересекающихся пачек и повторов задачи письмо
+    уходит только один раз. Если процесс упал после захвата, письма этих
+    оценивающих не уйдут: их досылает send_invitations --resend.
+    """
+    claimed_at = timezone.now()
+    with transaction.atomic():
+        return [
+            rater_id for rater_id in rater_ids
+            if Rater.objects.filter(pk=rater_id, invitation_sent=False).update(
+                invitation_sent=True, invitation_date=claimed_at
+            )
+        ]
+
+
+def deliver_invitations(survey, raters, connection=None, claimed=False):
+    """Отправляет приглашения пачке оценивающих через одно соединение.
+
+    Соединение с почтовым сервером открывается один раз на пачку, а не на
+    каждое письмо. Ошибка отправки одного письма не прерывает пачку: она
+    учитывается в статистике. Соединение переоткрывается только при сбое
+    самого соединения (OSError), а не при отказе в отдельном адресате -
+    иначе бэкенд открывал бы новое соединение на каждое следующее письмо.
+    Каждый оценивающий получает личную подписанную ссылку на форму оценки.
+    Для оценивающих, захваченных claim_invitations (claimed=True), с
+    недоставленных писем отметка снимается, и следующая рассылка их повторит.
+    """
+    stats = DeliveryStats()
+    started = time.perf_counter()
+    connection = connection or get_connection()
+    renderer = InvitationRenderer(survey)
+    delivered = []
+    failed = []
+
+    with connection:
+        for rater in raters:
+            message = renderer.build_message(
+                rater.user,
+                connection=connection,
+                access_url=build_rater_access_url(rater, survey)
+            )
+            try:
+                sent = connection.send_messages([message])
+            except MESSAGE_ERRORS:
+                logger.exception("Сервер отклонил приглашение %s (опрос %s)", rater.user.email, survey.pk)
+                sent = 0
+            except OSError:
+                logger.exception("Сбой соединения при отправке %s (опрос %s)", rater.user.email, survey.pk)
+                sent = 0
+                # Одно переподключение, дальше пачка идёт через новое соединение
+                connection.close()
+                try:
+                    connection.open()
+                except OSError:
+                    logger.exception("Не удалось переподключиться к почтовому серверу (опрос %s)", survey.pk)
+            except Exception:
+                logger.exception("Не удалось отправить приглашение %s (опрос %s)", rater.user.email, survey.pk)
+                sent = 0
+            if sent:
+                stats.sent += 1
+                delivered.append(rater.pk)
+            else:
+                stats.failed += 1
+                failed.append(rater.pk)
+
+    Rater.objects.filter(pk__in=delivered).update(invitation_sent=True, invitation_date=timezone.now())
+    if claimed and failed:
+        Rater.objects.filter(pk__in=failed).update(invitation_sent=False, invitation_date=None)
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+
+def enqueue_survey_invitations(survey_id):
+    """Ставит рассылку приглашений по опросу в очередь Celery - один раз.
+
+    Вызывается после фиксации перехода опроса из черновика в активные.
+    Условный UPDATE отметки invitations_enqueued_at пропускает только первый
+    вызов, даже если опрос активировали одновременно в двух запросах. Если
+    очередь недоступна, отметка снимается и рассылку можно выполнить командой
+    send_invitations. Возвращает True, если рассылка поставлена в очередь.
+    """
+    claimed = Survey.objects.filter(
+        pk=survey_id,
+        status='active',
+        invitations_enqueued_at__isnull=True
+    ).update(invitations_enqueued_at=timezone.now())
+    if not claimed:
+        return False
+
+    try:
+        from .tasks import send_survey_emails
+        send_survey_emails.delay(survey_id)
+    except Exception:
+        logger.exception("Не удалось поставить в очередь рассылку по опросу %s", survey_id)
+        Survey.objects.filter(pk=survey_id).update(invitations_enqueued_at=None)
+        return False
+    return True
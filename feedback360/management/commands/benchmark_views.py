@@ -0,0 +1,271 @@
+import json
+import logging
+import statistics
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.db.models import Count
+from django.template import TemplateDoesNotExist
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from feedback360 import urls as feedback360_urls
+from feedback360.management.commands.load_test_data import SCALE_TEMPLATE_NAME
+from feedback360.models import Rater, Report, Survey, SurveyTemplate, User
+from feedback360.reports import generate_reports
+from feedback360.tokens import make_rater_token
+
+# Маршруты, которые не замеряются: их нельзя повторять на общих данных
+# или их представления ссылаются на шаблоны, которых нет в проекте.
+# Отсутствие шаблона у остальных маршрутов - ошибка проверки
+SKIPPED_ROUTES = {
+    'add_question': 'нет шаблона feedback360/question_create.html',
+    'leader_survey_edit': 'нет шаблона feedback360/survey_update.html',
+    'logout': 'завершает сессию клиента',
+    'survey_progress': 'бесконечный поток событий (SSE)',
+    'template_delete': 'GET - страница подтверждения, POST удаляет шаблон',
+    'template_question_delete': 'удаляет вопрос шаблона',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет все маршруты feedback360 тестовым клиентом на больших данных: '
+        'p50/p95 времени ответа, число SQL-запросов и прочитанных строк. '
+        'Превышение бюджета запросов (признак N+1) завершает команду с ошибкой'
+    )
+
+    # Максимум SQL-запросов на прогретый запрос (роли и навигация уже в кэше,
+    # форма оценки с ответами не кэшируется);
+    # сессия и пользователь - 2 запроса, BEGIN/COMMIT транзакции тоже считаются
+    QUERY_BUDGETS = {
+        'dashboard': 2,
+        'login': 0,
+        'profile': 2,
+        'survey_list': 3,
+        'template_create': 3,
+        'survey_create': 3,
+        'survey_detail': 4,
+        'survey_scores': 4,
+        'leader_survey_create': 3,
+        'get_template_questions': 5,
+        'template_list': 3,
+        'template_edit': 4,
+        'template_questions': 7,
+        'user_search': 3,
+        'report': 5,
+        'rater_answers': 12,
+        'rater_form': 2,
+        'rater_token_answers': 12,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int,
+                            help='Перед замером пересоздать данные: load_test_data --scale N '
+                                 '(удаляет текущие опросы)')
+        parser.add_argument('--surveys', type=int, default=5, help='Опросов при --scale')
+        parser.add_argument('--requests', type=int, default=20, help='Запросов на маршрут')
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+        parser.add_argument('--compare', help='JSON предыдущего запуска для сравнения')
+
+    def handle(self, *args, **options):
+        if options['scale']:
+            call_command('load_test_data', scale=options['scale'], surveys=options['surveys'],
+                         stdout=self.stdout)
+
+        setup_test_environment()
+        # Ошибки маршрутов попадают в отчёт, трассировки django.request не нужны
+        request_logger = logging.getLogger('django.request')
+        request_logger.disabled = True
+        try:
+            fixtures = self.get_fixtures(create_reports=bool(options['scale']))
+            routes = self.get_routes(fixtures)
+            results = [self.measure(route, options['requests']) for route in routes]
+        finally:
+            request_logger.disabled = False
+            teardown_test_environment()
+
+        previous = {}
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = {result['route']: result for result in json.load(f)['results']}
+        for result in results:
+            self.report(result, previous.get(result['route']))
+
+        covered = {route['route'] for route in routes} | SKIPPED_ROUTES.keys()
+        uncovered = sorted(
+            pattern.name for pattern in feedback360_urls.urlpatterns
+            if pattern.name and pattern.name not in covered
+        )
+        for name, reason in SKIPPED_ROUTES.items():
+            self.stdout.write(f"{name}: пропущен - {reason}")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'vendor': connection.vendor, 'requests': options['requests'], 'results': results},
+                          f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Результаты сохранены в {options['output']}"))
+
+        failures = [
+            f"{result['route']}: {problem}"
+            for result in results for problem in result['problems']
+        ] + [f"{name}: маршрут не входит в набор" for name in uncovered]
+        if failures:
+            raise CommandError('Проверка не пройдена:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Все маршруты уложились в бюджет запросов'))
+
+    @staticmethod
+    def get_fixtures(create_reports=False):
+        """Объекты, на которых запрашиваются маршруты: самый крупный идущий опрос и т.п.
+
+        Замер только читает данные: отчёты для маршрута report создаются
+        лишь вместе с пересозданными данными (create_reports при --scale).
+        """
+        template = SurveyTemplate.objects.filter(name=SCALE_TEMPLATE_NAME).first()
+        surveys = Survey.objects.filter(status='active').annotate(n=Count('respondents')).order_by('-n')
+        # Редактировать опрос может только создавший его руководитель
+        survey = surveys.filter(created_by__userrole__role__name='Руководитель').first() or surveys.first()
+        if template is None or survey is None:
+            raise CommandError('Нет данных для замера: запустите с --scale N или load_test_data --scale N')
+
+        rater = Rater.objects.filter(
+            respondent__survey=survey, status='completed'
+        ).select_related('user').order_by('pk').first()
+        report = Report.objects.filter(survey=survey).first()
+        if report is None:
+            if not create_reports:
+                raise CommandError(
+                    f'Нет отчётов опроса "{survey.name}": запустите с --scale N '
+                    f'или generate_reports --survey {survey.pk}'
+                )
+            respondent_ids = survey.respondents.order_by('pk').values_list('pk', flat=True)[:5]
+            report = generate_reports(survey, respondent_ids)[0]
+
+        answers = [
+            {'question': response.question_id, 'value': str(response.answer_value)}
+            if response.answer_value is not None else
+            {'question': response.question_id, 'text': response.answer_text}
+            for response in rater.responses.all()
+        ]
+        return {
+            'admin': User.objects.filter(is_superuser=True).order_by('pk').first(),
+            'leader': survey.created_by,
+            'survey': survey,
+            'template': template,
+            'question_ids': list(template.template_questions.order_by('sort_order').values_list('pk', flat=True)),
+            'report': report,
+            'rater': rater,
+            'token': make_rater_token(rater, survey),
+            'answers': {'answers': answers, 'complete': True},
+        }
+
+    @staticmethod
+    def get_routes(fixtures):
+        """Маршруты feedback360.urls: (имя, метод, URL, пользователь, тело запроса, ожидаемый статус).
+
+        POST-запросы идемпотентны: тот же порядок вопросов, те же ответы.
+        """
+        admin, leader, rater = fixtures['admin'], fixtures['leader'], fixtures['rater']
+        survey, template, token = fixtures['survey'], fixtures['template'], fixtures['token']
+        routes = [
+            ('dashboard', 'get', reverse('dashboard'), admin, None, 200),
+            ('login', 'get', reverse('login'), None, None, 200),
+            ('profile', 'get', reverse('profile'), admin, None, 200),
+            ('survey_list', 'get', reverse('survey_list'), admin, None, 200),
+            ('template_create', 'get', reverse('template_create'), admin, None, 200),
+            ('survey_create', 'get', reverse('survey_create'), leader, None, 200),
+            ('survey_detail', 'get', reverse('survey_detail', args=[survey.pk]), admin, None, 200),
+            ('survey_scores', 'get', reverse('survey_scores', args=[survey.pk]), admin, None, 200),
+            ('leader_survey_create', 'get', reverse('leader_survey_create'), leader, None, 200),
+            ('get_template_questions', 'get', reverse('get_template_questions', args=[template.pk]), admin, None, 200),
+            ('template_list', 'get', reverse('template_list'), admin, None, 200),
+            ('template_edit', 'get', reverse('template_edit', args=[template.pk]), admin, None, 200),
+            ('template_questions', 'post', reverse('template_questions', args=[template.pk]), admin,
+             {'action': 'reorder', 'order': fixtures['question_ids']}, 200),
+            ('user_search', 'get', f"{reverse('user_search')}?q=Ив&exclude_survey={survey.pk}", admin, None, 200),
+            ('report', 'get', reverse('report', args=[fixtures['report'].pk]), admin, None, 200),
+            ('rater_answers', 'post', reverse('rater_answers', args=[rater.pk]), rater.user, fixtures['answers'], 200),
+            ('rater_form', 'get', reverse('rater_form', args=[token]), None, None, 200),
+            ('rater_token_answers', 'post', reverse('rater_token_answers', args=[token]), None,
+             fixtures['answers'], 200),
+        ]
+        return [
+            {'route': name, 'method': method, 'url': url, 'user': user, 'data': data, 'status': status}
+            for name, method, url, user, data, status in routes
+        ]
+
+    def measure(self, route, requests):
+        client = Client()
+        if route['user'] is not None:
+            client.force_login(route['user'])
+
+        def send():
+            if route['method'] == 'post':
+                return client.post(route['url'], json.dumps(route['data']), content_type='application/json')
+            return client.get(route['url'])
+
+        result = {'route': route['route'], 'url': route['url'], 'problems': []}
+        try:
+            # Первый запрос прогревает кэши, бюджет проверяется на втором
+            send()
+            # Каждый запрос очищает журнал запросов (request_started), начинаем с нуля
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                response = send()
+        except TemplateDoesNotExist as e:
+            result['problems'].append(f'нет шаблона {e}')
+            return result
+
+        timings = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            send()
+            timings.append((time.perf_counter() - started) * 1000)
+
+        statements = [query['sql'] for query in queries.captured_queries]
+        budget = self.QUERY_BUDGETS.get(route['route'])
+        result.update({
+            'status': response.status_code,
+            'queries': len(statements),
+            'budget': budget,
+            'rows': sum(self.count_rows(sql) for sql in statements),
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(
+                statistics.quantiles(timings, n=20, method='inclusive')[-1] if len(timings) > 1 else timings[0], 3
+            ),
+        })
+        if response.status_code != route['status']:
+            result['problems'].append(f"статус {response.status_code} вместо {route['status']}")
+        if budget is None:
+            result['problems'].append('не задан бюджет запросов')
+        elif len(statements) > budget:
+            result['problems'].append(f"{len(statements)} SQL-запросов при бюджете {budget}")
+        return result
+
+    @staticmethod
+    def count_rows(sql):
+        """Сколько строк вернул SELECT (запрос повторяется как подзапрос COUNT)"""
+        if not sql.lstrip().upper().startswith('SELECT'):
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM ({sql}) benchmark_rows')
+            return cursor.fetchone()[0]
+
+    def report(self, result, previous):
+        if 'p50_ms' not in result:
+            self.stdout.write(self.style.ERROR(f"{result['route']}: не замерен"))
+            for problem in result['problems']:
+                self.stdout.write(self.style.ERROR(f"  {problem}"))
+            return
+        line = (
+            f"{result['route']}: p50 {result['p50_ms']:.1f} мс, p95 {result['p95_ms']:.1f} мс, "
+            f"запросов {result['queries']}/{result['budget']}, строк {result['rows']}"
+        )
+        if previous and 'p50_ms' in previous:
+            line += f"; было p50 {previous['p50_ms']:.1f} мс, запросов {previous['queries']}"
+        style = self.style.ERROR if result['problems'] else self.style.MIGRATE_HEADING
+        self.stdout.write(style(line))
+        for problem in result['problems']:
+            self.stdout.write(self.style.ERROR(f"  {problem}"))
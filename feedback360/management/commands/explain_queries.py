@@ -0,0 +1,148 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from feedback360.models import Rater, Respondent, Survey
+from feedback360.reports import DEFAULT_REPORT_CHUNK_SIZE, _summarize, compute_scores
+from feedback360.scores import _actual_aggregates
+from feedback360.views import SurveyListView
+
+
+class Command(BaseCommand):
+    help = (
+        'Планы выполнения (EXPLAIN) и время горячих запросов views.py, admin.py и команд. '
+        'Для сравнения до/после миграции с индексами: '
+        'migrate feedback360 0009 && explain_queries --output before.json, '
+        'затем migrate && explain_queries --compare before.json'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--survey', type=int,
+                            help='ID опроса (по умолчанию запущенный опрос с наибольшим числом участников)')
+        parser.add_argument('--respondents', type=int, default=DEFAULT_REPORT_CHUNK_SIZE,
+                            help='Участников в пачке для запросов отчётов')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов каждого запроса')
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+        parser.add_argument('--compare', help='JSON предыдущего запуска для сравнения времени')
+        parser.add_argument('--no-plans', action='store_true', help='Не выводить планы запросов')
+
+    def handle(self, *args, **options):
+        survey = self.get_survey(options['survey'])
+        respondent_ids = list(
+            survey.respondents.order_by('id').values_list('id', flat=True)[:options['respondents']]
+        )
+        self.stdout.write(
+            f"Опрос #{survey.pk}: участников в пачке {len(respondent_ids)}, "
+            f"оценивающих в БД {Rater.objects.count()}, повторов {options['repeat']}"
+        )
+
+        previous = {}
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = {case['name']: case for case in json.load(f)['cases']}
+
+        results = []
+        for name, description, run in self.get_cases(survey, respondent_ids):
+            result = self.measure(name, description, run, options['repeat'])
+            results.append(result)
+            self.report(result, previous.get(name), show_plans=not options['no_plans'])
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'vendor': connection.vendor, 'survey': survey.pk, 'cases': results},
+                          f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Результаты сохранены в {options['output']}"))
+
+    @staticmethod
+    def get_survey(survey_id):
+        surveys = Survey.objects.annotate(n=Count('respondents')).order_by('-n', '-pk')
+        if survey_id:
+            survey = surveys.filter(pk=survey_id).first()
+        else:
+            # В черновиках ещё нет ответов - запросы отчётов на них ничего не покажут
+            survey = surveys.exclude(status='draft').first() or surveys.first()
+        if survey is None:
+            raise CommandError('Нет опроса для проверки запросов')
+        return survey
+
+    @staticmethod
+    def get_cases(survey, respondent_ids):
+        """(имя, описание, функция) - каждая функция выполняет запросы так же, как их источник"""
+        return [
+            ('survey_list', 'Список опросов со счётчиками (SurveyListView)',
+             lambda: list(SurveyListView.with_stats(Survey.objects.order_by('-created_at', '-pk'))[:11])),
+            ('admin_surveys_by_status', 'Опросы по статусу (SurveyAdmin)',
+             lambda: list(Survey.objects.filter(status='active').order_by('-created_at')[:100])),
+            ('admin_respondents', 'Участники опроса по статусу (RespondentAdmin)',
+             lambda: list(Respondent.objects.filter(survey=survey, status='completed').order_by('-pk')[:100])),
+            ('admin_raters', 'Оценивающие по статусу и типу (RaterAdmin)',
+             lambda: list(Rater.objects.filter(status='pending', relationship_type='peer').order_by('-pk')[:100])),
+            ('reset_raters', 'Начатые оценки (reset_raters)',
+             lambda: list(Rater.objects.filter(status='started').values_list('id', flat=True))),
+            ('pending_invitations', 'Неотправленные приглашения (send_invitations)',
+             lambda: list(Rater.objects.filter(respondent__survey=survey, invitation_sent=False)
+                          .values_list('id', flat=True))),
+            ('report_scores', 'Гистограмма ответов пачки (reports.compute_scores)',
+             lambda: compute_scores(respondent_ids)),
+            ('report_summary', 'Оценивающие пачки по типам (reports._summarize)',
+             lambda: _summarize(respondent_ids, {})),
+            ('reconcile_scores', 'Суммы оценок опроса (reconcile_scores)',
+             lambda: _actual_aggregates(survey)),
+        ]
+
+    def measure(self, name, description, run, repeat):
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+
+        statements = list(dict.fromkeys(
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].lstrip().upper().startswith('SELECT')
+        ))
+        return {
+            'name': name,
+            'description': description,
+            'queries': len(queries.captured_queries),
+            'min_ms': round(min(timings), 3),
+            'median_ms': round(statistics.median(timings), 3),
+            'plans': [self.explain(sql) for sql in statements],
+        }
+
+    @staticmethod
+    def explain(sql):
+        prefix = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {sql}')
+            rows = cursor.fetchall()
+        if connection.vendor == 'sqlite':
+            # (id, parent, notused, detail) - отступ по глубине вложенности
+            depth = {0: -1}
+            lines = []
+            for node_id, parent, _, detail in rows:
+                depth[node_id] = depth.get(parent, -1) + 1
+                lines.append('  ' * depth[node_id] + detail)
+            return lines
+        return [' '.join(str(column) for column in row) for row in rows]
+
+    def report(self, result, previous, show_plans):
+        line = (
+            f"{result['name']}: {result['median_ms']:.2f} мс (мин. {result['min_ms']:.2f}), "
+            f"запросов {result['queries']}"
+        )
+        if previous:
+            speedup = previous['median_ms'] / result['median_ms'] if result['median_ms'] else 0.0
+            line += f"; было {previous['median_ms']:.2f} мс, x{speedup:.1f}"
+        self.stdout.write(self.style.MIGRATE_HEADING(line))
+        self.stdout.write(f"  {result['description']}")
+        if show_plans:
+            for plan in result['plans']:
+                for plan_line in plan:
+                    self.stdout.write(f"    {plan_line}")
@@ -1,14 +1,113 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from feedback360.models import Report
+from django.db import connections
+from feedback360.mailing import chunked
+from feedback360.models import Respondent, Survey
+from feedback360.reports import DEFAULT_REPORT_CHUNK_SIZE, generate_report_chunk
+from feedback360.routers import read_from_replica
 
 
 class Command(BaseCommand):
-    help = 'Генерирует отчеты для всех существующих записей'
+    help = 'Генерирует отчеты по участникам опросов пачками в нескольких процессах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--survey', type=int, action='append', dest='surveys',
+                            help='ID опроса (можно указать несколько раз, по умолчанию все опросы)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_REPORT_CHUNK_SIZE,
+                            help='Участников в одной пачке')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Число процессов (1 - без пула, в текущем процессе)')
+        parser.add_argument('--checkpoint', default=os.path.join(settings.BASE_DIR, 'generate_reports.checkpoint'),
+                            help='Файл с уже обработанными пачками; для --survey к имени '
+                                 'добавляется ключ набора опросов')
+        parser.add_argument('--restart', action='store_true',
+                            help='Не продолжать с контрольной точки, а пересчитать всё заново')
 
     def handle(self, *args, **options):
-        reports = Report.objects.all()
-        for report in reports:
-            report.generate_report_data()
-            self.stdout.write(f"Обновлен отчет #{report.id}")
+        checkpoint = self.checkpoint_path(options['checkpoint'], options['surveys'])
+        done = set()
+        if not options['restart'] and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                done = set(json.load(f))
+            self.stdout.write(f"Продолжение с контрольной точки: готово пачек {len(done)}")
+
+        surveys = Survey.objects.all()
+        if options['surveys']:
+            surveys = surveys.filter(id__in=options['surveys'])
+        respondents = {}
+        with read_from_replica():
+            for survey_id, respondent_id in Respondent.objects.filter(
+                survey__in=surveys
+            ).order_by('survey_id', 'id').values_list('survey_id', 'id'):
+                respondents.setdefault(survey_id, []).append(respondent_id)
+
+        # Ключ пачки - диапазон ID участников, он не зависит от порядка выполнения
+        chunks = [
+            (f"{survey_id}:{chunk[0]}-{chunk[-1]}", survey_id, chunk)
+            for survey_id, ids in respondents.items()
+            for chunk in chunked(ids, options['chunk_size'])
+        ]
+        pending = [chunk for chunk in chunks if chunk[0] not in done]
+        self.stdout.write(f"Пачек к обработке: {len(pending)} из {len(chunks)}")
+
+        started = time.monotonic()
+        total = 0
+        for key, survey_id, count in self._run(pending, options['workers']):
+            done.add(key)
+            self._save_checkpoint(checkpoint, done)
+            total += count
+            elapsed = time.monotonic() - started
+            rate = total / elapsed if elapsed else 0.0
+            self.stdout.write(f"Опрос #{survey_id}, пачка {key}: {count} отчетов, всего {total} ({rate:.1f} отчетов/с)")
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        elapsed = time.monotonic() - started
+        rate = total / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Обработано {total} отчетов за {elapsed:.1f} с ({rate:.1f} отчетов/с)"
+        ))
+
+    @staticmethod
+    def checkpoint_path(path, survey_ids):
+        """Контрольная точка своя для каждого набора опросов.
+
+        Запуск с другим --survey не подхватывает и не удаляет в конце
+        контрольную точку прерванного запуска.
+        """
+        if not survey_ids:
+            return path
+        key = ','.join(str(survey_id) for survey_id in sorted(set(survey_ids)))
+        return f"{path}.{hashlib.sha1(key.encode()).hexdigest()[:12]}"
+
+    def _run(self, chunks, workers):
+        """Выполняет пачки и отдаёт (ключ, опрос, число отчетов) по мере готовности"""
+        if workers <= 1 or len(chunks) <= 1:
+            for key, survey_id, respondent_ids in chunks:
+                yield key, survey_id, generate_report_chunk(survey_id, respondent_ids)
+            return
+
+        # Соединения с БД не должны наследоваться дочерними процессами
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+            futures = {
+                executor.submit(generate_report_chunk, survey_id, respondent_ids): (key, survey_id)
+                for key, survey_id, respondent_ids in chunks
+            }
+            for future in as_completed(futures):
+                key, survey_id = futures[future]
+                yield key, survey_id, future.result()
 
-        self.stdout.write(self.style.SUCCESS(f"Обработано {reports.count()} отчетов"))
\ No newline at end of file
+    @staticmethod
+    def _save_checkpoint(path, done):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(sorted(done), f)
+        os.replace(tmp_path, path)
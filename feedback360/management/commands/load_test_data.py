@@ -1,34 +1,97 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connections, router, transaction
 from django.db.models import Q
+from django.utils import timezone
 
+from feedback360.mailing import chunked
 from feedback360.models import (
     Role, SurveyTemplate, Question,
     Survey, Respondent, Rater, Report, Response,
-    UserRole
+    UserRole, allocate_sort_orders
 )
+from feedback360.scores import reconcile_survey
+from collections import defaultdict
 from datetime import date, timedelta
 import logging
+import random
+import time
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
+# Пользователи, созданные в режиме --scale
+SCALE_USERNAME_PREFIX = 'scale_'
+SCALE_TEMPLATE_NAME = 'Нагрузочный шаблон 360°'
+
+FIRST_NAMES = [
+    'Александр', 'Алексей', 'Андрей', 'Анна', 'Дмитрий', 'Екатерина', 'Елена', 'Иван',
+    'Ирина', 'Мария', 'Михаил', 'Наталья', 'Николай', 'Ольга', 'Павел', 'Сергей',
+    'Светлана', 'Татьяна', 'Юлия', 'Владимир',
+]
+LAST_NAMES = [
+    'Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов',
+    'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов', 'Егоров',
+    'Павлов', 'Козлов', 'Степанов', 'Николаев', 'Орлов', 'Андреев', 'Макаров', 'Никитин',
+    'Захаров', 'Зайцев', 'Соловьев', 'Борисов', 'Яковлев', 'Григорьев',
+]
+TEXT_ANSWERS = [
+    'Хорошо держит сроки и помогает коллегам',
+    'Стоит чаще делиться информацией с командой',
+    'Уверенно принимает решения в сложных ситуациях',
+    'Иногда не хватает обратной связи по задачам',
+    'Открыт к предложениям и критике',
+]
+# Доли статусов оценивающих по статусу опроса: (завершил, начал, остальные ожидают)
+RATER_STATUS_SHARES = {
+    'completed': (0.85, 0.05),
+    'active': (0.4, 0.2),
+    'draft': (0.0, 0.0),
+}
+
+
 class Command(BaseCommand):
-    help = 'Загружает тестовые данные: пользователей, роли, шаблоны опросов и демо-опрос'
+    help = (
+        'Загружает тестовые данные: пользователей, роли, шаблоны опросов и демо-опрос. '
+        'С --scale N дополнительно генерирует N сотрудников с иерархией и опросы с ответами '
+        'для нагрузочных проверок'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=0,
+                            help='Сгенерировать столько сотрудников с отделами и руководителями')
+        parser.add_argument('--surveys', type=int, default=10, help='Опросов в режиме --scale')
+        parser.add_argument('--questions', type=int, default=20, help='Вопросов в нагрузочном шаблоне')
+        parser.add_argument('--department-share', type=float, default=0.3,
+                            help='Доля отделов, сотрудники которых оцениваются в одном опросе')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора случайных чисел')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Строк в одном bulk_create')
+        parser.add_argument('--password', default='test123', help='Пароль сгенерированных сотрудников')
 
     def clear_existing_data(self):
-        """Очистка существующих тестовых данных"""
+        """Очистка существующих тестовых данных.
+
+        Ответы и оценивающие удаляются отдельными запросами по каждому опросу,
+        чтобы каскадное удаление не загружало в память миллионы строк.
+        """
+        for survey in Survey.objects.only('pk'):
+            Response.objects.filter(rater__respondent__survey=survey).delete()
+            Rater.objects.filter(respondent__survey=survey).delete()
         Response.objects.all().delete()
         Rater.objects.all().delete()
-        Respondent.objects.all().delete()
         Report.objects.all().delete()
+        # Участники удаляются каскадом вместе с опросами
         Survey.objects.all().delete()
+        Respondent.objects.all().delete()
         Question.objects.all().delete()
         SurveyTemplate.objects.all().delete()
         UserRole.objects.all().delete()
 
         test_usernames = [user['username'] for user in self.get_test_users()]
-        User.objects.filter(username__in=test_usernames).delete()
+        User.objects.filter(
+            Q(username__in=test_usernames) | Q(username__startswith=SCALE_USERNAME_PREFIX)
+        ).delete()
 
     def get_test_users(self):
         return [
@@ -182,7 +245,9 @@ class Command(BaseCommand):
                 start_date=date.today(),
                 end_date=date.today() + timedelta(days=14),
                 status='active',
-                created_by=admin_user
+                created_by=admin_user,
+                # Демо-данные: автоматическая рассылка приглашений не нужна
+                invitations_enqueued_at=timezone.now()
             )
 
             respondent = Respondent.objects.create(
@@ -200,6 +265,265 @@ class Command(BaseCommand):
         except Exception as e:
             logger.error(f"Ошибка создания демо-опроса: {str(e)}")
 
+    def generate_users(self, rng, count, password, batch_size):
+        """Сотрудники с отделами и иерархией руководителей.
+
+        Первый сотрудник - генеральный директор, за ним руководители отделов,
+        остальные распределяются по отделам и командам по 5-9 человек с
+        руководителем группы во главе. Возвращает (пользователи, отдел по
+        индексу сотрудника, руководитель по индексу, подчинённые по индексу).
+        """
+        department_count = max(1, round(count / 60))
+        departments = [f'Отдел {number}' for number in range(1, department_count + 1)]
+        department_of = [None] * count
+        manager_of = [None] * count
+        positions = ['Специалист'] * count
+
+        positions[0] = 'Генеральный директор'
+        heads = list(range(1, min(count, department_count + 1)))
+        members = defaultdict(list)
+        for department, index in enumerate(heads):
+            department_of[index] = department
+            members[department].append(index)
+            manager_of[index] = 0
+            positions[index] = 'Руководитель отдела'
+        for index in range(len(heads) + 1, count):
+            department_of[index] = rng.randrange(len(heads))
+            members[department_of[index]].append(index)
+
+        for department, (head, *staff) in members.items():
+            start = 0
+            while start < len(staff):
+                team = staff[start:start + rng.randint(5, 9)]
+                start += len(team)
+                lead, *team_staff = team
+                manager_of[lead] = head
+                positions[lead] = 'Руководитель группы'
+                for index in team_staff:
+                    manager_of[index] = lead
+
+        reports_of = defaultdict(list)
+        for index, manager in enumerate(manager_of):
+            if manager is not None:
+                reports_of[manager].append(index)
+
+        password_hash = make_password(password)
+        users = [
+            User(
+                username=f'{SCALE_USERNAME_PREFIX}{index:06d}',
+                email=f'{SCALE_USERNAME_PREFIX}{index:06d}@example.com',
+                first_name=rng.choice(FIRST_NAMES),
+                last_name=rng.choice(LAST_NAMES),
+                position=positions[index],
+                department='Руководство' if department_of[index] is None else departments[department_of[index]],
+                password=password_hash,
+            )
+            for index in range(count)
+        ]
+        users = User.objects.bulk_create(users, batch_size=batch_size)
+
+        roles = {role.name: role for role in Role.objects.filter(name__in=['Администратор', 'Руководитель', 'Сотрудник'])}
+        UserRole.objects.bulk_create([
+            UserRole(
+                user=user,
+                role=roles['Администратор' if index == 0 else 'Руководитель' if reports_of[index] else 'Сотрудник']
+            )
+            for index, user in enumerate(users)
+        ], batch_size=batch_size)
+        return users, department_of, manager_of, reports_of
+
+    def create_scale_template(self, question_count):
+        """Шаблон с заданным числом вопросов; каждый пятый вопрос - текстовый"""
+        template = SurveyTemplate.objects.create(name=SCALE_TEMPLATE_NAME)
+        sort_orders = allocate_sort_orders(question_count, template_id=template.pk)
+        Question.objects.bulk_create([
+            Question(
+                template=template,
+                text=f'Нагрузочный вопрос {sort_order}',
+                answer_type='text' if sort_order % 5 == 0 else 'scale',
+                sort_order=sort_order,
+            )
+            for sort_order in sort_orders
+        ])
+        return template, template.freeze()
+
+    @staticmethod
+    def pick_raters(rng, index, users, manager_of, reports_of):
+        """Оценивающие сотрудника: он сам, руководитель, коллеги, подчинённые и смежник"""
+        raters = {}
+        if rng.random() < 0.9:
+            raters[index] = 'self'
+        manager = manager_of[index]
+        if manager is not None:
+            raters.setdefault(manager, 'manager')
+            peers = [peer for peer in reports_of[manager] if peer != index]
+            for peer in rng.sample(peers, min(len(peers), rng.randint(2, 5))):
+                raters.setdefault(peer, 'peer')
+        subordinates = reports_of[index]
+        for subordinate in rng.sample(subordinates, min(len(subordinates), 5)):
+            raters.setdefault(subordinate, 'subordinate')
+        other = rng.randrange(len(users))
+        if other != index and rng.random() < 0.3:
+            raters.setdefault(other, 'other')
+        return raters
+
+    @staticmethod
+    def pick_status(rng, shares):
+        completed, started = shares
+        roll = rng.random()
+        if roll < completed:
+            return 'completed'
+        if roll < completed + started:
+            return 'started'
+        return 'pending'
+
+    def generate_survey(self, rng, number, status, template, version, creator, respondent_indexes,
+                        users, manager_of, reports_of, questions, batch_size):
+        """Опрос с участниками, оценивающими и ответами; возвращает число ответов"""
+        now = timezone.now()
+        today = date.today()
+        survey = Survey.objects.create(
+            name=f'Нагрузочный опрос {number}',
+            template=template,
+            template_version=version,
+            start_date=today - timedelta(days=30),
+            end_date=today + timedelta(days=14),
+            created_by=creator,
+        )
+        if status != 'draft':
+            # update вместо save - рассылка приглашений здесь не нужна
+            Survey.objects.filter(pk=survey.pk).update(status=status)
+
+        plans = []
+        for index in respondent_indexes:
+            raters = [
+                (rater_index, relationship, self.pick_status(rng, RATER_STATUS_SHARES[status]))
+                for rater_index, relationship in self.pick_raters(rng, index, users, manager_of, reports_of).items()
+            ]
+            statuses = {rater_status for _, _, rater_status in raters}
+            if statuses == {'completed'}:
+                respondent_status = 'completed'
+            elif statuses - {'pending'}:
+                respondent_status = 'in_progress'
+            else:
+                respondent_status = 'not_started'
+            plans.append((index, respondent_status, raters))
+
+        respondents = Respondent.objects.bulk_create([
+            Respondent(
+                survey=survey,
+                user=users[index],
+                manager=users[manager_of[index]] if manager_of[index] is not None else None,
+                status=respondent_status,
+                completion_date=now if respondent_status == 'completed' else None,
+            )
+            for index, respondent_status, _ in plans
+        ], batch_size=batch_size)
+
+        raters = Rater.objects.bulk_create([
+            Rater(
+                respondent=respondent,
+                user=users[rater_index],
+                relationship_type=relationship,
+                status=rater_status,
+                invitation_sent=status != 'draft',
+                invitation_date=now if status != 'draft' else None,
+                completed_at=now if rater_status == 'completed' else None,
+            )
+            for respondent, (_, _, rater_plans) in zip(respondents, plans)
+            for rater_index, relationship, rater_status in rater_plans
+        ], batch_size=batch_size)
+
+        # Уровень оценок свой у каждого участника, самооценка немного завышена
+        baseline = {respondent.pk: rng.gauss(3.6, 0.5) for respondent in respondents}
+        answered = [rater for rater in raters if rater.status != 'pending']
+        answered_at = connections[router.db_for_write(Response)].ops.adapt_datetimefield_value(now)
+        total = 0
+        for batch in chunked(answered, max(1, batch_size // len(questions))):
+            rows = []
+            for rater in batch:
+                complete = rater.status == 'completed'
+                level = baseline[rater.respondent_id] + (0.3 if rater.relationship_type == 'self' else 0.0)
+                for question in questions:
+                    if not complete and rng.random() < 0.5:
+                        continue
+                    if question.answer_type == 'scale':
+                        value = min(5, max(1, round(rng.gauss(level, 0.8))))
+                        rows.append((rater.pk, question.pk, value, None, answered_at))
+                    else:
+                        rows.append((rater.pk, question.pk, None, rng.choice(TEXT_ANSWERS), answered_at))
+            self.insert_responses(rows)
+            total += len(rows)
+
+        # bulk_create обходит Response.save - накопительные суммы считаются один раз
+        reconcile_survey(survey)
+        return len(respondents), len(raters), total
+
+    @staticmethod
+    def insert_responses(rows):
+        """Вставляет ответы (rater_id, question_id, answer_value, answer_text, answered_at).
+
+        На миллионах строк создание объектов модели и подготовка значений в
+        bulk_create занимают большую часть времени, поэтому строки уходят в БД
+        одним executemany.
+        """
+        connection = connections[router.db_for_write(Response)]
+        table = connection.ops.quote_name(Response._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {table} (rater_id, question_id, answer_value, answer_text, answered_at) "
+                f"VALUES (%s, %s, %s, %s, %s)",
+                rows
+            )
+
+    def generate_scale_data(self, options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        started = time.monotonic()
+
+        with transaction.atomic():
+            users, department_of, manager_of, reports_of = self.generate_users(
+                rng, options['scale'], options['password'], batch_size
+            )
+            template, version = self.create_scale_template(options['questions'])
+        questions = list(version.questions.order_by('sort_order'))
+        self.stdout.write(f"   Сотрудников: {len(users)}, вопросов в шаблоне: {len(questions)}")
+
+        departments = sorted({department for department in department_of if department is not None})
+        per_survey = max(1, round(len(departments) * options['department_share']))
+        creators = [users[0]] + [users[index] for index, reports in reports_of.items() if reports and index]
+
+        survey_count = options['surveys']
+        totals = [0, 0, 0]
+        for number in range(1, survey_count + 1):
+            # Старые опросы завершены, последние идут, самый новый - черновик
+            if number == survey_count and survey_count > 1:
+                status = 'draft'
+            elif number <= survey_count * 0.6:
+                status = 'completed'
+            else:
+                status = 'active'
+            chosen = set(rng.sample(departments, min(per_survey, len(departments))))
+            respondent_indexes = [index for index, department in enumerate(department_of) if department in chosen]
+
+            with transaction.atomic():
+                counts = self.generate_survey(
+                    rng, number, status, template, version, rng.choice(creators), respondent_indexes,
+                    users, manager_of, reports_of, questions, batch_size
+                )
+            totals = [total + count for total, count in zip(totals, counts)]
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"   Опрос {number}/{survey_count} ({status}): участников {counts[0]}, "
+                f"оценивающих {counts[1]}, ответов {counts[2]}; прошло {elapsed:.0f} с"
+            )
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"   Итого: участников {totals[0]}, оценивающих {totals[1]}, ответов {totals[2]} "
+            f"за {elapsed:.0f} с ({totals[2] / elapsed if elapsed else 0:.0f} ответов/с)"
+        )
+
     def handle(self, *args, **options):
         self.stdout.write("1. Очистка старых данных...")
         self.clear_existing_data()
@@ -213,6 +537,10 @@ class Command(BaseCommand):
         self.stdout.write("4. Создание демо-опроса...")
         self.create_demo_survey()
 
+        if options['scale']:
+            self.stdout.write(f"5. Генерация данных для нагрузочных проверок (--scale {options['scale']})...")
+            self.generate_scale_data(options)
+
         self.stdout.write(self.style.SUCCESS(
             "Тестовые данные успешно загружены!\n"
             "Администратор: admin1/admin123\n"
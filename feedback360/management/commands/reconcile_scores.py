@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from feedback360.models import Survey
+from feedback360.scores import reconcile_survey
+
+
+class Command(BaseCommand):
+    help = 'Сверяет накопительные суммы оценок с ответами и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--survey', type=int, help='ID опроса (по умолчанию все опросы)')
+
+    def handle(self, *args, **options):
+        surveys = Survey.objects.all()
+        if options['survey']:
+            surveys = surveys.filter(id=options['survey'])
+
+        total = 0
+        for survey in surveys:
+            fixed = reconcile_survey(survey)
+            total += fixed
+            if fixed:
+                self.stdout.write(self.style.WARNING(f"Опрос #{survey.id}: исправлено агрегатов {fixed}"))
+
+        self.stdout.write(self.style.SUCCESS(f"Сверка завершена, исправлено {total} агрегатов"))
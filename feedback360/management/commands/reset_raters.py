@@ -1,10 +1,19 @@
 from django.core.management.base import BaseCommand
-from feedback360.models import Rater, Response
+from feedback360.models import Rater, Response, ScoreAggregate
+from feedback360.progress import publish_progress
 
 class Command(BaseCommand):
     help = 'Сбрасывает статусы оценивающих'
 
     def handle(self, *args, **options):
-        Rater.objects.filter(status='started').update(status='pending')
+        started = Rater.objects.filter(status='started')
+        respondents = {}
+        for survey_id, respondent_id in started.values_list('respondent__survey_id', 'respondent_id').distinct():
+            respondents.setdefault(survey_id, []).append(respondent_id)
+        started.update(status='pending')
         Response.objects.all().delete()
-        self.stdout.write(self.style.SUCCESS("Все оценки сброшены!"))
\ No newline at end of file
+        ScoreAggregate.objects.all().delete()
+        # Открытые потоки прогресса опросов получат новые счётчики
+        for survey_id, respondent_ids in respondents.items():
+            publish_progress(survey_id, respondent_ids)
+        self.stdout.write(self.style.SUCCESS("Все оценки сброшены!"))
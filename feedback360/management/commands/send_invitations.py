@@ -0,0 +1,48 @@
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand, CommandError
+
+from feedback360.mailing import DeliveryStats, chunked, deliver_invitations, get_batch_size
+from feedback360.models import Survey, Rater
+
+
+class Command(BaseCommand):
+    help = 'Рассылает приглашения оценивающим опроса пачками и выводит скорость отправки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('survey_id', type=int)
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Писем на одно соединение (по умолчанию INVITATION_BATCH_SIZE)')
+        parser.add_argument('--email-backend', default=None,
+                            help='Почтовый бэкенд, например django.core.mail.backends.locmem.EmailBackend')
+        parser.add_argument('--resend', action='store_true',
+                            help='Отправить и тем, кто уже получил приглашение')
+        parser.add_argument('--async', action='store_true', dest='use_celery',
+                            help='Поставить пачки в очередь Celery вместо отправки в процессе')
+
+    def handle(self, *args, **options):
+        try:
+            survey = Survey.objects.get(pk=options['survey_id'])
+        except Survey.DoesNotExist:
+            raise CommandError(f"Опрос #{options['survey_id']} не найден")
+
+        if options['use_celery']:
+            from feedback360.tasks import send_survey_emails
+            send_survey_emails.delay(survey.pk)
+            self.stdout.write(self.style.SUCCESS(f"Рассылка по опросу #{survey.pk} поставлена в очередь"))
+            return
+
+        batch_size = options['batch_size'] or get_batch_size()
+        recipients = Rater.objects.filter(respondent__survey=survey)
+        if not options['resend']:
+            recipients = recipients.filter(invitation_sent=False)
+        rater_ids = list(recipients.values_list('id', flat=True))
+        total = DeliveryStats()
+
+        for number, batch in enumerate(chunked(rater_ids, batch_size), start=1):
+            connection = get_connection(options['email_backend'])
+            raters = Rater.objects.filter(id__in=batch).select_related('user')
+            stats = deliver_invitations(survey, raters, connection)
+            total += stats
+            self.stdout.write(f"Пачка {number}: {stats}")
+
+        self.stdout.write(self.style.SUCCESS(f"Итого: {total}"))
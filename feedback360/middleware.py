@@ -1,3 +1,16 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+profiling_logger = logging.getLogger('feedback360.profiling')
+
+
 class RoleMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
@@ -8,10 +21,109 @@ class RoleMiddleware:
             user = request.user
             # Проверяем аутентификацию
             if user.is_authenticated:
+                # Роли загружаются один раз и переиспользуются миксинами и permissions
                 user.is_employee = not (
                     user.is_superuser or
-                    user.userrole_set.filter(
-                        role__name__in=['Администратор', 'Руководитель']
-                    ).exists()
+                    user.has_role('Администратор', 'Руководитель')
                 )
-        return self.get_response(request)
\ No newline at end of file
+        return self.get_response(request)
+
+
+class ProfilingMiddleware:
+    """Профилирование выборки запросов: SQL, время представления и шаблона.
+
+    Доля профилируемых запросов задаётся PROFILING_SAMPLE_RATE (0 - выключено),
+    поэтому на остальных запросах middleware стоит одного вызова random().
+    Замеры уходят в заголовок Server-Timing (видны во вкладке Network
+    браузера) и строкой JSON в логгер feedback360.profiling.
+
+    Время шаблона измеряется для TemplateResponse (классовые представления);
+    шаблон, отрисованный через render() внутри функции, входит во время
+    представления. Должен стоять первым в MIDDLEWARE, чтобы total охватывал
+    остальные middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        if not self.sample_rate:
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        profile = request._profile = RequestProfile()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile.execute))
+            response = self.get_response(request)
+        profile.finish()
+
+        response.headers['Server-Timing'] = profile.server_timing()
+        profiling_logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': request.resolver_match.view_name if request.resolver_match else None,
+            'status': response.status_code,
+            **profile.as_dict(),
+        }, ensure_ascii=False))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, '_profile'):
+            request._profile.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            # Шаблон отрисовывается сразу после этого хука
+            profile.render_started = time.perf_counter()
+            response.add_post_render_callback(profile.rendered)
+        return response
+
+
+class RequestProfile:
+    """Замеры одного запроса, время в секундах от time.perf_counter()"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = self.render_started = self.render_finished = self.finished = None
+        self.sql_count = 0
+        self.sql_time = 0.0
+
+    def execute(self, execute, sql, params, many, context):
+        """Обёртка connection.execute_wrapper: считает запросы и их время"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_count += 1
+            self.sql_time += time.perf_counter() - started
+
+    def rendered(self, response):
+        self.render_finished = time.perf_counter()
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def as_dict(self):
+        total = self.finished - self.started
+        render = (self.render_finished or self.render_started or 0) - (self.render_started or 0)
+        view = (self.render_started or self.finished) - self.view_started if self.view_started else 0.0
+        return {
+            'total_ms': round(total * 1000, 2),
+            'view_ms': round(view * 1000, 2),
+            'render_ms': round(render * 1000, 2),
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'sql_count': self.sql_count,
+        }
+
+    def server_timing(self):
+        data = self.as_dict()
+        return ', '.join([
+            f'db;dur={data["sql_ms"]};desc="SQL x{data["sql_count"]}"',
+            f'view;dur={data["view_ms"]}',
+            f'render;dur={data["render_ms"]}',
+            f'total;dur={data["total_ms"]}',
+        ])
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback360', '0002_alter_question_sort_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TemplateVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(verbose_name='Номер версии')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('template', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='feedback360.surveytemplate')),
+            ],
+            options={
+                'verbose_name': 'Версия шаблона',
+                'verbose_name_plural': 'Версии шаблонов',
+                'ordering': ['template', '-number'],
+                'unique_together': {('template', 'number')},
+            },
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='template_version',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='questions', to='feedback360.templateversion'),
+        ),
+        migrations.AddField(
+            model_name='survey',
+            name='template_version',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='surveys', to='feedback360.templateversion', verbose_name='Версия шаблона'),
+        ),
+        migrations.AddField(
+            model_name='surveytemplate',
+            name='current_version',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='feedback360.templateversion'),
+        ),
+    ]
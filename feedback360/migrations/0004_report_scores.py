@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback360', '0003_template_versions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='report',
+            name='generated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='report',
+            name='report_data',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AlterUniqueTogether(
+            name='report',
+            unique_together={('survey', 'respondent')},
+        ),
+        migrations.CreateModel(
+            name='ReportScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('relationship_type', models.CharField(blank=True, choices=[('self', 'Сам себе'), ('manager', 'Руководитель'), ('peer', 'Коллега'), ('subordinate', 'Подчиненный'), ('other', 'Другое')], max_length=100)),
+                ('count', models.PositiveIntegerField()),
+                ('mean', models.FloatField()),
+                ('std', models.FloatField()),
+                ('distribution', models.JSONField(default=dict)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='report_scores', to='feedback360.question')),
+                ('rater_group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='feedback360.ratergroup')),
+                ('report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='feedback360.report')),
+            ],
+            options={
+                'verbose_name': 'Показатель отчета',
+                'verbose_name_plural': 'Показатели отчетов',
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, FloatField, Sum
+from django.db.models.functions import Cast
+
+
+def backfill_aggregates(apps, schema_editor):
+    Response = apps.get_model('feedback360', 'Response')
+    ScoreAggregate = apps.get_model('feedback360', 'ScoreAggregate')
+
+    value = Cast('answer_value', FloatField())
+    rows = Response.objects.filter(answer_value__isnull=False).values(
+        'rater__respondent__survey_id', 'rater__respondent_id', 'question_id', 'rater__relationship_type'
+    ).annotate(n=Count('id'), s=Sum(value), sq=Sum(value * value)).order_by()
+    ScoreAggregate.objects.bulk_create(
+        [
+            ScoreAggregate(
+                survey_id=row['rater__respondent__survey_id'],
+                respondent_id=row['rater__respondent_id'],
+                question_id=row['question_id'],
+                relationship_type=row['rater__relationship_type'],
+                count=row['n'],
+                total=row['s'] or 0,
+                total_sq=row['sq'] or 0
+            )
+            for row in rows
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback360', '0004_report_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('relationship_type', models.CharField(choices=[('self', 'Сам себе'), ('manager', 'Руководитель'), ('peer', 'Коллега'), ('subordinate', 'Подчиненный'), ('other', 'Другое')], max_length=100)),
+                ('count', models.IntegerField(default=0)),
+                ('total', models.FloatField(default=0)),
+                ('total_sq', models.FloatField(default=0)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_aggregates', to='feedback360.question')),
+                ('respondent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_aggregates', to='feedback360.respondent')),
+                ('survey', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_aggregates', to='feedback360.survey')),
+            ],
+            options={
+                'verbose_name': 'Накопленная оценка',
+                'verbose_name_plural': 'Накопленные оценки',
+                'unique_together': {('respondent', 'question', 'relationship_type')},
+            },
+        ),
+        migrations.RunPython(backfill_aggregates, migrations.RunPython.noop),
+    ]
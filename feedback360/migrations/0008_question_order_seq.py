@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback360', '0007_user_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='survey',
+            name='question_order_seq',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='surveytemplate',
+            name='question_order_seq',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
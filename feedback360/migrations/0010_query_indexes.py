@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback360', '0009_version_stamps'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rater',
+            index=models.Index(fields=['respondent', 'status', 'relationship_type'], name='rater_respondent_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rater',
+            index=models.Index(fields=['status', 'relationship_type'], name='rater_status_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['survey', 'generated_at'], name='report_survey_generated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='respondent',
+            index=models.Index(fields=['survey', 'status'], name='respondent_survey_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='survey',
+            index=models.Index(fields=['status', 'created_at'], name='survey_status_created_idx'),
+        ),
+    ]
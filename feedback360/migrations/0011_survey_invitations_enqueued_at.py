@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback360', '0010_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='survey',
+            name='invitations_enqueued_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,8 +1,16 @@
+import hashlib
+
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.contrib.auth.models import AbstractUser
 from django.shortcuts import redirect
 from django.contrib import messages
-from .models import UserRole
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .routers import read_from_replica
 
 
 class LeaderRequiredMixin(UserPassesTestMixin):
@@ -18,11 +26,7 @@ class LeaderRequiredMixin(UserPassesTestMixin):
 
 class LeaderAccessMixin(UserPassesTestMixin):
     def test_func(self):
-        return self.request.user.is_authenticated and (
-            self.request.user.userrole_set.filter(
-                role__name='Руководитель'
-            ).exists()
-        )
+        return self.request.user.is_authenticated and self.request.user.has_role('Руководитель')
 
     def handle_no_permission(self):
         messages.error(self.request, "Доступ только для руководителей")
@@ -32,9 +36,7 @@ class AdminRequiredMixin(UserPassesTestMixin):
     def test_func(self):
         return self.request.user.is_authenticated and (
             self.request.user.is_superuser or
-            self.request.user.userrole_set.filter(
-                role__name__in=['Администратор']
-            ).exists()
+            self.request.user.has_role('Администратор')
         )
 
     def handle_no_permission(self):
@@ -45,7 +47,135 @@ class AdminRequiredMixin(UserPassesTestMixin):
 def user_has_admin_access(user):
     return user.is_authenticated and (
         user.is_superuser
-        or user.userrole_set.filter(
-            role__name__in=['Администратор', 'Руководитель']
-        ).exists()
+        or user.has_role('Администратор', 'Руководитель')
     )
+
+
+class KeysetPaginationMixin:
+    """Постраничный вывод по ключу (курсору) вместо OFFSET.
+
+    Записи упорядочены по убыванию (cursor_field, id); ссылка на соседнюю
+    страницу несёт значения ключа крайней записи, поэтому любая страница
+    читается одним запросом по индексу независимо от её глубины.
+    """
+    cursor_field = 'created_at'
+    page_size = 10
+
+    @staticmethod
+    def encode_cursor(value, pk):
+        return f"{value.isoformat()},{pk}"
+
+    @staticmethod
+    def decode_cursor(cursor):
+        value, _, pk = (cursor or '').rpartition(',')
+        # Незакодированный '+' часового пояса приходит в GET как пробел
+        value = parse_datetime(value.replace(' ', '+')) if value else None
+        if value is None or not pk.isdigit():
+            return None
+        return value, int(pk)
+
+    def paginate_by_cursor(self, queryset):
+        field = self.cursor_field
+        after = self.decode_cursor(self.request.GET.get('after'))
+        before = None if after else self.decode_cursor(self.request.GET.get('before'))
+
+        if before:
+            value, pk = before
+            queryset = queryset.filter(
+                Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+            ).order_by(field, 'pk')
+        else:
+            if after:
+                value, pk = after
+                queryset = queryset.filter(
+                    Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk})
+                )
+            queryset = queryset.order_by(f'-{field}', '-pk')
+
+        objects = list(queryset[:self.page_size + 1])
+        has_more = len(objects) > self.page_size
+        objects = objects[:self.page_size]
+        if before:
+            objects.reverse()
+        has_next = bool(before) or has_more
+        has_previous = bool(after) or (bool(before) and has_more)
+
+        return {
+            'object_list': objects,
+            'next_cursor': (
+                self.encode_cursor(getattr(objects[-1], field), objects[-1].pk)
+                if objects and has_next else None
+            ),
+            'previous_cursor': (
+                self.encode_cursor(getattr(objects[0], field), objects[0].pk)
+                if objects and has_previous else None
+            ),
+        }
+
+
+class ConditionalGetMixin:
+    """Ответ 304 Not Modified, если страница не менялась с прошлого запроса.
+
+    Представление задаёт get_version_stamp() - строку, меняющуюся при
+    изменении данных (обычно из VersionStampedModel.version), и при желании
+    get_last_modified(). К ETag добавляются пользователь и его CSRF-токен,
+    потому что они тоже попадают в страницу. При совпадении страница не
+    строится совсем.
+
+    Пока в запросе есть неотображённые сообщения (messages), страница
+    строится заново и отдаётся без ETag/Last-Modified: иначе браузер показал
+    бы свою копию, а сообщение всплыло бы на другой странице.
+    """
+
+    def get_version_stamp(self):
+        raise NotImplementedError
+
+    def get_last_modified(self):
+        return None
+
+    def get_etag(self):
+        stamp = self.get_version_stamp()
+        if stamp is None:
+            return None
+        # get_token каждый раз маскирует токен по-новому, в ETag идёт сам секрет
+        get_token(self.request)
+        secret = self.request.META.get('CSRF_COOKIE', '')
+        token = hashlib.md5(secret.encode()).hexdigest()[:12]
+        return quote_etag(f"{stamp}-{self.request.user.pk}-{token}")
+
+    def get(self, request, *args, **kwargs):
+        # len() не помечает сообщения прочитанными
+        if len(messages.get_messages(request)):
+            response = super().get(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        etag = self.get_etag()
+        last_modified = self.get_last_modified()
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if etag:
+            response.headers['ETag'] = etag
+        if last_modified:
+            response.headers['Last-Modified'] = http_date(last_modified)
+        # Браузер хранит страницу, но каждый раз сверяет её с сервером
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class ReplicaReadMixin:
+    """Представление только для чтения: запросы к БД идут на реплику.
+
+    Ответ отрисовывается внутри того же блока, чтобы ленивые запросы из
+    шаблона тоже ушли на реплику.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with read_from_replica():
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
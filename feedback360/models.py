@@ -1,24 +1,58 @@
-from django.db import models, IntegrityError
+from django.db import models, IntegrityError, transaction
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
-from django.db.models import Max
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.db.models import F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from .roles import get_role_names
+
 
 class User(AbstractUser):
     position = models.CharField(max_length=100, blank=True, null=True)
     department = models.CharField(max_length=100, blank=True, null=True)
+    # Версия набора ролей: входит в ключ кэша ролей (feedback360.roles)
+    role_version = models.PositiveIntegerField(default=0, editable=False)
+    # Время изменения: входит в ключ кэша подписей (feedback360.search);
+    # сохранение с update_fields=['last_login'] при входе его не трогает
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def save(self, *args, **kwargs):
+        # role_version меняет только UPDATE в invalidate_user_roles: устаревший
+        # экземпляр (форма профиля, админка, set_password) не должен вернуть
+        # старую версию и вместе с ней ключ кэша с отозванными ролями
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'role_version'
+            ]
+        super().save(*args, **kwargs)
 
     def get_display_name(self):
         return f"{self.get_full_name()} ({self.position})" if self.position else self.get_full_name()
 
+    @property
+    def role_names(self):
+        return get_role_names(self)
+
+    def has_role(self, *names):
+        return not self.role_names.isdisjoint(names)
+
     @property
     def is_leader(self):
-        return self.userrole_set.filter(role__name='Руководитель').exists()
+        return self.has_role('Руководитель')
+
+    class Meta(AbstractUser.Meta):
+        # Индексы для поиска пользователей по префиксу (feedback360.search)
+        indexes = [
+            models.Index(fields=['last_name', 'first_name'], name='user_name_idx'),
+            models.Index(fields=['first_name'], name='user_first_name_idx'),
+            models.Index(fields=['position'], name='user_position_idx'),
+            models.Index(fields=['department'], name='user_department_idx'),
+        ]
 
 
 class Role(models.Model):
@@ -54,6 +88,14 @@ class Question(models.Model):
     ]
 
     template = models.ForeignKey('SurveyTemplate',on_delete=models.CASCADE,related_name='template_questions', null=True,blank=True)
+    template_version = models.ForeignKey(
+        'TemplateVersion',
+        on_delete=models.CASCADE,
+        related_name='questions',
+        null=True,
+        blank=True,
+        editable=False
+    )
     scale_choices = models.JSONField(default=list,blank=True,null=True,help_text="Формат: [['значение', 'описание'], ...]")
     text = models.TextField(verbose_name='Текст вопроса', blank=False, null=False, help_text="Обязательное поле")
     answer_type = models.CharField(max_length=50,choices=ANSWER_TYPES,verbose_name='Тип ответа',default='scale')
@@ -72,11 +114,10 @@ class Question(models.Model):
 
     def save(self, *args, **kwargs):
         # Для новых вопросов без указанного порядка
-        if not self.pk and self.sort_order == 0:
-            max_order = Question.objects.filter(
-                template=self.template
-            ).aggregate(Max('sort_order'))['sort_order__max'] or 0
-            self.sort_order = max_order + 1
+        if not self.pk and self.sort_order == 0 and (self.template_id or self.survey_id):
+            self.sort_order = allocate_sort_orders(
+                1, template_id=self.template_id, survey_id=self.survey_id
+            )[0]
 
         # Для scale вопросов устанавливаем значения по умолчанию
         if self.answer_type == 'scale':
@@ -98,24 +139,85 @@ class Question(models.Model):
     def __str__(self):
         return f"{self.text[:50]}..."
 
+    def get_scale_bounds(self):
+        """Границы шкалы, по которым проверяются ответы (пустые - 1..5)"""
+        return self.scale_min or 1, self.scale_max or 5
+
+    def clone(self, **fields):
+        """Несохранённая копия вопроса без привязки к шаблону, версии или опросу"""
+        values = {
+            'text': self.text,
+            'answer_type': self.answer_type,
+            'scale_choices': self.scale_choices,
+            'scale_min': self.scale_min,
+            'scale_max': self.scale_max,
+            'is_required': self.is_required,
+            'sort_order': self.sort_order,
+        }
+        values.update(fields)
+        return Question(**values)
+
+
+def allocate_sort_orders(count, template_id=None, survey_id=None):
+    """Резервирует непрерывный блок номеров sort_order для вопросов шаблона или опроса.
+
+    Счётчик владельца сдвигается одним UPDATE, который блокирует его строку
+    до конца транзакции, поэтому параллельные вставки получают разные блоки.
+    Номера, выставленные в обход счётчика (перестановки, вставка в середину),
+    учитываются через максимум уже существующих номеров.
+    """
+    if count <= 0:
+        return range(0)
+    if template_id:
+        model, owner_id, owner_field = SurveyTemplate, template_id, 'template'
+    else:
+        model, owner_id, owner_field = Survey, survey_id, 'survey'
+
+    last_order = Question.objects.filter(**{owner_field: OuterRef('pk')}).order_by().values(
+        owner_field
+    ).annotate(last=Max('sort_order')).values('last')
+    with transaction.atomic():
+        model.objects.filter(pk=owner_id).update(
+            question_order_seq=Greatest(F('question_order_seq'), Coalesce(Subquery(last_order), 0)) + count
+        )
+        end = model.objects.filter(pk=owner_id).values_list('question_order_seq', flat=True).get()
+    return range(end - count + 1, end + 1)
+
+
+class VersionStampedModel(models.Model):
+    """Номер версии и время изменения для условных GET-запросов (ETag/Last-Modified).
+
+    Версия увеличивается при каждом сохранении, а изменения зависимых строк
+    (вопросов, участников) поднимают её через bump_version.
+    """
+    version = models.PositiveIntegerField(default=1, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            super().save(*args, **kwargs)
+            return
+        # Инкремент в БД, чтобы параллельные сохранения не получили одну версию
+        self.version = F('version') + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version', 'updated_at'}
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['version'])
+
     @classmethod
-    def copy_from_template(cls, template, survey):
-        return cls.objects.bulk_create([
-            cls(
-                text=question.text,
-                answer_type=question.answer_type,
-                survey=survey,
-                is_required=question.is_required,
-                sort_order=question.sort_order,
-                scale_min=1,
-                scale_max=5,
-                scale_choices=question.scale_choices
-            )
-            for question in template.template_questions.all()
-        ])
+    def bump_version(cls, *pks, **fields):
+        """Поднимает версию строк одним UPDATE (fields - дополнительные поля для обновления)"""
+        return cls.objects.filter(pk__in=pks).update(
+            version=F('version') + 1,
+            updated_at=timezone.now(),
+            **fields
+        )
 
 
-class SurveyTemplate(models.Model):
+class SurveyTemplate(VersionStampedModel):
     name = models.CharField('Название шаблона', max_length=255)
     created_by = models.ForeignKey(
         User,
@@ -128,6 +230,16 @@ class SurveyTemplate(models.Model):
         'Активен',
         default=True,
     )
+    current_version = models.ForeignKey(
+        'TemplateVersion',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+'
+    )
+    # Последний выданный номер sort_order вопросов (см. allocate_sort_orders)
+    question_order_seq = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f"{self.name} {'(активен)' if self.is_active else '(неактивен)'}"
@@ -148,8 +260,100 @@ class SurveyTemplate(models.Model):
     def get_competencies(self):
         return self.template_competencies.all().prefetch_related('question_set')
 
+    def freeze(self):
+        """Возвращает неизменяемую версию текущего набора вопросов.
+
+        Новая версия создаётся только если вопросы шаблона менялись после
+        последней заморозки (сигналы сбрасывают current_version).
+        """
+        if self.current_version_id:
+            return self.current_version
+
+        with transaction.atomic():
+            template = SurveyTemplate.objects.select_for_update().get(pk=self.pk)
+            if template.current_version_id:
+                self.current_version = template.current_version
+                return self.current_version
+
+            last_number = self.versions.aggregate(Max('number'))['number__max'] or 0
+            version = TemplateVersion.objects.create(template=self, number=last_number + 1)
+            Question.objects.bulk_create([
+                question.clone(template_version=version)
+                for question in self.template_questions.all()
+            ])
+            SurveyTemplate.objects.filter(pk=self.pk).update(current_version=version)
+            self.current_version = version
+        return version
+
+    def lock(self):
+        """Блокирует строку шаблона до конца текущей транзакции"""
+        SurveyTemplate.objects.select_for_update().filter(pk=self.pk).values_list('pk').get()
+
+    def reorder_questions(self, question_ids):
+        """Расставляет вопросы шаблона в указанном порядке.
+
+        Перезаписываются только вопросы, чей номер изменился, одним
+        bulk_update. Строка шаблона блокируется, поэтому параллельные правки
+        порядка выполняются по очереди.
+        """
+        with transaction.atomic():
+            self.lock()
+            questions = {question.pk: question for question in self.template_questions.only('id', 'template_id', 'sort_order')}
+            if len(question_ids) != len(set(question_ids)) or set(question_ids) != questions.keys():
+                raise ValidationError('Порядок должен содержать каждый вопрос шаблона ровно один раз')
+
+            changed = []
+            for sort_order, question_id in enumerate(question_ids, start=1):
+                question = questions[question_id]
+                if question.sort_order != sort_order:
+                    question.sort_order = sort_order
+                    changed.append(question)
+            if changed:
+                Question.objects.bulk_update(changed, ['sort_order'])
+                # bulk_update не вызывает сигналы - версию сбрасываем сами
+                SurveyTemplate.bump_version(self.pk, current_version=None)
+                self.current_version = None
+        return len(changed)
+
+
+class TemplateVersion(models.Model):
+    """Замороженный снимок вопросов шаблона, на который ссылаются опросы"""
+    template = models.ForeignKey(SurveyTemplate, on_delete=models.CASCADE, related_name='versions')
+    number = models.PositiveIntegerField('Номер версии')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Версия шаблона'
+        verbose_name_plural = 'Версии шаблонов'
+        unique_together = ('template', 'number')
+        ordering = ['template', '-number']
+
+    def __str__(self):
+        return f"{self.template.name} v{self.number}"
+
+    def matches(self, questions):
+        """Совпадают ли переданные вопросы (по порядку) с вопросами версии.
+
+        Сравниваются все поля, которые Question.clone переносит в снимок.
+        sort_order сравнивается позицией в списке: при копировании в опрос
+        номера выдаются заново. Пустые границы шкалы равны 1..5, как при
+        проверке ответов.
+        """
+        def normalize(question):
+            return (
+                ' '.join(question.text.split()),
+                question.answer_type,
+                question.scale_choices or [],
+                question.get_scale_bounds(),
+                question.is_required,
+            )
+
+        return [normalize(q) for q in questions] == [
+            normalize(q) for q in self.questions.order_by('sort_order')
+        ]
 
-class Survey(models.Model):
+
+class Survey(VersionStampedModel):
     name = models.CharField(_('Название опроса'), max_length=255)
     description = models.TextField(_('Описание'), blank=True)
     template = models.ForeignKey(
@@ -166,7 +370,18 @@ class Survey(models.Model):
         on_delete=models.CASCADE,
         verbose_name=_('Создатель')
     )
+    template_version = models.ForeignKey(
+        TemplateVersion,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='surveys',
+        verbose_name=_('Версия шаблона')
+    )
     created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
+    # Последний выданный номер sort_order вопросов (см. allocate_sort_orders)
+    question_order_seq = models.PositiveIntegerField(default=0, editable=False)
 
     STATUS_CHOICES = [
         ('draft', _('Черновик')),
@@ -179,14 +394,75 @@ class Survey(models.Model):
         choices=STATUS_CHOICES,
         default='draft'
     )
+    # Рассылка приглашений поставлена в очередь (mailing.enqueue_survey_invitations);
+    # сбрасывается при возврате опроса в черновик
+    invitations_enqueued_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # Статус при загрузке из БД: post_save отличает переход draft -> active
+    # от повторного сохранения уже активного опроса
+    loaded_status = None
 
     def __str__(self):
         return f"{self.name} ({self.get_status_display()})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_status = dict(zip(field_names, values)).get('status')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Отметку рассылки меняют только условные UPDATE (mailing, signals):
+        # устаревший экземпляр не должен перезаписать её своим значением
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'invitations_enqueued_at'
+            ]
+        super().save(*args, **kwargs)
+        self.loaded_status = self.status
+
+    def get_questions(self):
+        """Вопросы опроса: из версии шаблона, пока опрос их не менял"""
+        if self.template_version_id:
+            return Question.objects.filter(template_version_id=self.template_version_id)
+        return self.questions.all()
+
+    @transaction.atomic
+    def customize_questions(self):
+        """Копирование при записи: переносит вопросы версии шаблона в сам опрос.
+
+        Вызывается перед первым изменением вопросов опроса. Уже данные ответы
+        и накопительные суммы оценок перепривязываются к копиям вопросов.
+        """
+        if not self.template_version_id:
+            return
+
+        originals = list(self.template_version.questions.order_by('sort_order'))
+        sort_orders = allocate_sort_orders(len(originals), survey_id=self.pk)
+        copies = Question.objects.bulk_create([
+            question.clone(survey=self, sort_order=sort_order)
+            for question, sort_order in zip(originals, sort_orders)
+        ])
+        answered = Response.objects.filter(rater__respondent__survey=self)
+        aggregates = ScoreAggregate.objects.filter(survey=self)
+        for original, copy in zip(originals, copies):
+            answered.filter(question=original).update(question=copy)
+            aggregates.filter(question=original).update(question=copy)
+
+        Survey.bump_version(self.pk, template_version=None)
+        self.template_version = None
+
     class Meta:
         verbose_name = _('Опрос')
         verbose_name_plural = _('Опросы')
         ordering = ['-created_at']
+        indexes = [
+            # Ключ постраничного вывода списка опросов
+            models.Index(fields=['created_at', 'id'], name='survey_created_keyset_idx'),
+            # Фильтр по статусу в админке с сортировкой по дате создания
+            models.Index(fields=['status', 'created_at'], name='survey_status_created_idx'),
+        ]
 
 
 class RaterGroup(models.Model):
@@ -219,6 +495,9 @@ class Respondent(models.Model):
         verbose_name = 'Оцениваемый'
         verbose_name_plural = 'Оцениваемые'
         unique_together = ('survey', 'user')
+        indexes = [
+            models.Index(fields=['survey', 'status'], name='respondent_survey_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.get_full_name()} ({self.survey.name})"
@@ -257,6 +536,12 @@ class Rater(models.Model):
         verbose_name = 'Оценивающий'
         verbose_name_plural = 'Оценивающие'
         unique_together = ('respondent', 'user')
+        indexes = [
+            # Счётчики списка опросов и сводка отчётов читаются только из индекса
+            models.Index(fields=['respondent', 'status', 'relationship_type'], name='rater_respondent_status_idx'),
+            # Фильтры админки и reset_raters
+            models.Index(fields=['status', 'relationship_type'], name='rater_status_type_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.get_full_name()} оценивает {self.respondent.user.get_full_name()}"
@@ -306,11 +591,105 @@ class Response(models.Model):
                     question=self.question
             ).exists():
                 raise IntegrityError("Ответ уже существует")
-        super().save(*args, **kwargs)
 
+        from .scores import apply_response_change
+        with transaction.atomic():
+            old_value = None
+            if self.pk is not None:
+                old_value = Response.objects.filter(pk=self.pk).values_list(
+                    'answer_value', flat=True
+                ).first()
+            super().save(*args, **kwargs)
+            # Накопительные агрегаты обновляются в той же транзакции
+            apply_response_change(self.rater_id, self.question_id, old_value, self.answer_value)
+
+    def delete(self, *args, **kwargs):
+        from .scores import apply_response_change
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            apply_response_change(self.rater_id, self.question_id, self.answer_value, None)
+        return result
+
+
+class Report(models.Model):
+    survey = models.ForeignKey(Survey, on_delete=models.CASCADE, related_name='reports')
+    respondent = models.ForeignKey(Respondent, on_delete=models.CASCADE, related_name='reports')
+    report_data = models.JSONField(default=dict)
+    generated_at = models.DateTimeField(auto_now=True)
+    generated_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='generated_reports'
+    )
+
+    class Meta:
+        verbose_name = 'Отчет'
+        verbose_name_plural = 'Отчеты'
+        unique_together = ('survey', 'respondent')
+        indexes = [
+            # Последний отчёт опроса в списке опросов
+            models.Index(fields=['survey', 'generated_at'], name='report_survey_generated_idx'),
+        ]
+
+    def __str__(self):
+        return f"Отчет по {self.respondent.user.get_full_name()} ({self.survey.name})"
+
+    def generate_report_data(self, generated_by=None):
+        from .reports import generate_reports
+        generate_reports(self.survey, respondent_ids=[self.respondent_id], generated_by=generated_by)
+        self.refresh_from_db()
+
+
+class ReportScore(models.Model):
+    """Материализованная статистика ответов на вопрос в отчёте.
+
+    Пустой relationship_type и пустая rater_group - итог по всем оценивающим;
+    заполненное одно из полей - разрез по типу отношений или группе.
+    """
+    report = models.ForeignKey(Report, on_delete=models.CASCADE, related_name='scores')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='report_scores')
+    relationship_type = models.CharField(max_length=100, choices=Rater.RELATIONSHIP_TYPES, blank=True)
+    rater_group = models.ForeignKey(RaterGroup, on_delete=models.CASCADE, null=True, blank=True)
+    count = models.PositiveIntegerField()
+    mean = models.FloatField()
+    std = models.FloatField()
+    distribution = models.JSONField(default=dict)
+
+    class Meta:
+        verbose_name = 'Показатель отчета'
+        verbose_name_plural = 'Показатели отчетов'
+
+
+class ScoreAggregate(models.Model):
+    """Накопительные суммы оценок по (участник, вопрос, тип отношений).
+
+    Обновляются в транзакции записи ответа, поэтому среднее и разброс можно
+    прочитать в любой момент без сканирования ответов. Массовые операции над
+    ответами в обход моделей сверяются командой reconcile_scores.
+    """
+    survey = models.ForeignKey(Survey, on_delete=models.CASCADE, related_name='score_aggregates')
+    respondent = models.ForeignKey(Respondent, on_delete=models.CASCADE, related_name='score_aggregates')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='score_aggregates')
+    relationship_type = models.CharField(max_length=100, choices=Rater.RELATIONSHIP_TYPES)
+    count = models.IntegerField(default=0)
+    total = models.FloatField(default=0)
+    total_sq = models.FloatField(default=0)
+
+    class Meta:
+        verbose_name = 'Накопленная оценка'
+        verbose_name_plural = 'Накопленные оценки'
+        unique_together = ('respondent', 'question', 'relationship_type')
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def std(self):
+        if not self.count:
+            return None
+        mean = self.total / self.count
+        return max(self.total_sq / self.count - mean * mean, 0.0) ** 0.5
 
-@receiver(post_save, sender=Survey)
-def handle_survey_status_change(sender, instance, **kwargs):
-    if instance.status == 'active' and instance.pk:
-        instance.send_invitations()
 
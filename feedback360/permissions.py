@@ -1,4 +1,3 @@
-from django.db.models import Q
 from rest_framework.permissions import BasePermission
 
 from feedback360.views import user_has_admin_access
@@ -10,7 +9,6 @@ class IsAdminUser(BasePermission):
 
 class HasSurveyCreationRights(BasePermission):
     def has_permission(self, request, view):
-        return request.user.userrole_set.filter(
-            Q(role__name='Администратор') |
-            Q(role__name='Руководитель')
-        ).exists()
\ No newline at end of file
+        return request.user.is_authenticated and request.user.has_role(
+            'Администратор', 'Руководитель'
+        )
\ No newline at end of file
@@ -0,0 +1,126 @@
+import json
+import threading
+
+from django.db import transaction
+from django.db.models import Count
+
+from .caching import bump_cache_version
+from .models import Rater, Respondent
+
+# Группа версий кэша для прогресса опроса: меняется при каждом изменении статусов
+PROGRESS_NAMESPACE = 'survey_progress:{survey_id}'
+
+# Раз в столько секунд поток отправляет комментарий, чтобы прокси не закрыли соединение
+PROGRESS_KEEPALIVE = 15
+
+
+def progress_namespace(survey_id):
+    return PROGRESS_NAMESPACE.format(survey_id=survey_id)
+
+
+def _rater_counts(raters):
+    """{respondent_id: {relationship_type: {'total': n, 'completed': n}}}"""
+    counts = {}
+    rows = raters.values('respondent_id', 'relationship_type', 'status').annotate(n=Count('pk')).order_by()
+    for row in rows:
+        by_type = counts.setdefault(row['respondent_id'], {}).setdefault(
+            row['relationship_type'], {'total': 0, 'completed': 0}
+        )
+        by_type['total'] += row['n']
+        if row['status'] == 'completed':
+            by_type['completed'] += row['n']
+    return counts
+
+
+def survey_progress(survey_id):
+    """Полный срез прогресса опроса: участники и оценки по типам отношений.
+
+    Два запроса независимо от размера опроса; счётчики читаются из индекса
+    rater_respondent_status_idx. Читается основная БД: срез с отстающей
+    реплики мог бы затереть уже отправленные события.
+    """
+    counts = _rater_counts(Rater.objects.filter(respondent__survey_id=survey_id))
+    respondents = Respondent.objects.filter(survey_id=survey_id).order_by('pk').values_list(
+        'pk', 'user__last_name', 'user__first_name', 'user__username'
+    )
+    return {
+        'survey': survey_id,
+        'relationship_types': dict(Rater.RELATIONSHIP_TYPES),
+        'respondents': [
+            {
+                'id': pk,
+                'name': f"{last_name} {first_name}".strip() or username,
+                'progress': counts.get(pk, {}),
+            }
+            for pk, last_name, first_name, username in respondents
+        ],
+    }
+
+
+def respondent_progress(respondent_id):
+    return _rater_counts(Rater.objects.filter(respondent_id=respondent_id)).get(respondent_id, {})
+
+
+class ProgressBroker:
+    """Рассылка событий прогресса подписчикам потоков в этом процессе.
+
+    Подписчик - asyncio.Queue потока SSE и его цикл событий. Публикация
+    приходит из потоков синхронных представлений, поэтому события кладутся
+    в очередь через loop.call_soon_threadsafe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, survey_id, loop, queue):
+        with self._lock:
+            self._subscribers.setdefault(survey_id, set()).add((loop, queue))
+
+    def unsubscribe(self, survey_id, loop, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(survey_id, set())
+            subscribers.discard((loop, queue))
+            if not subscribers:
+                self._subscribers.pop(survey_id, None)
+
+    def has_subscribers(self, survey_id):
+        return survey_id in self._subscribers
+
+    def publish(self, survey_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(survey_id, ()))
+        for loop, queue in subscribers:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+
+
+broker = ProgressBroker()
+
+
+def publish_progress(survey_id, respondent_ids):
+    """Сообщает потокам опроса новые счётчики участников.
+
+    Каждая смена версии в кэше сопровождается одним событием, поэтому поток
+    по разнице версий видит изменения из других процессов (общий кэш
+    CACHE_BACKEND=file) и отправляет для них полный срез. Счётчики
+    пересчитываются только при наличии подписчиков в этом процессе.
+    """
+    bump_cache_version(progress_namespace(survey_id))
+    if not broker.has_subscribers(survey_id):
+        return
+    broker.publish(survey_id, {
+        'respondents': [
+            {'id': respondent_id, 'progress': respondent_progress(respondent_id)}
+            for respondent_id in respondent_ids
+        ],
+    })
+
+
+def publish_progress_on_commit(survey_id, respondent_ids):
+    transaction.on_commit(lambda: publish_progress(survey_id, list(respondent_ids)))
+
+
+def format_event(event, data):
+    """Событие в формате text/event-stream"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
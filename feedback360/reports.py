@@ -0,0 +1,209 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Rater, Report, ReportScore, Response, Survey
+from .routers import read_from_replica
+
+NO_GROUP = -1
+DEFAULT_REPORT_CHUNK_SIZE = 200
+
+
+def _load_histogram(respondent_ids):
+    """Гистограмма ответов, посчитанная в БД.
+
+    Одна строка на (участник, вопрос, тип отношений, группа, значение) с
+    количеством таких ответов - сами объекты Response в Python не грузятся.
+    """
+    rows = list(
+        Response.objects.filter(
+            rater__respondent_id__in=respondent_ids,
+            answer_value__isnull=False
+        ).values_list(
+            'rater__respondent_id',
+            'question_id',
+            'rater__relationship_type',
+            'rater__rater_group_id',
+            'answer_value'
+        ).annotate(n=Count('id')).order_by()
+    )
+    relationship_types = [code for code, _ in Rater.RELATIONSHIP_TYPES]
+    rel_codes = {code: index for index, code in enumerate(relationship_types)}
+
+    if not rows:
+        empty = np.empty(0, dtype=np.int64)
+        return relationship_types, empty, empty, empty, empty, np.empty(0), empty
+
+    respondent, question, relationship, group, value, count = zip(*rows)
+    return (
+        relationship_types,
+        np.fromiter(respondent, dtype=np.int64),
+        np.fromiter(question, dtype=np.int64),
+        np.fromiter((rel_codes.get(code, len(rel_codes)) for code in relationship), dtype=np.int64),
+        np.fromiter((NO_GROUP if g is None else g for g in group), dtype=np.int64),
+        np.fromiter((float(v) for v in value), dtype=np.float64),
+        np.fromiter(count, dtype=np.int64),
+    )
+
+
+def _group_stats(keys, value, count):
+    """Количество, среднее, стандартное отклонение и распределение по ключам.
+
+    keys - двумерный массив (строка = составной ключ группы); каждая строка
+    гистограммы весит count ответов со значением value.
+    """
+    unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    size = len(unique_keys)
+
+    n = np.bincount(inverse, weights=count, minlength=size)
+    total = np.bincount(inverse, weights=count * value, minlength=size)
+    total_sq = np.bincount(inverse, weights=count * value * value, minlength=size)
+    mean = total / n
+    std = np.sqrt(np.maximum(total_sq / n - mean * mean, 0.0))
+
+    # Распределение: повторная группировка по (группа, значение)
+    pairs, pair_inverse = np.unique(
+        np.column_stack((inverse, value)), axis=0, return_inverse=True
+    )
+    pair_counts = np.bincount(pair_inverse.ravel(), weights=count, minlength=len(pairs))
+    distribution = [{} for _ in range(size)]
+    for (index, answer), pair_count in zip(pairs, pair_counts):
+        distribution[int(index)][f'{answer:g}'] = int(pair_count)
+
+    return unique_keys, n.astype(np.int64), mean, std, distribution
+
+
+def compute_scores(respondent_ids):
+    """Считает статистику по вопросам для участников опроса.
+
+    Возвращает словарь {respondent_id: [ReportScore без report]} с итогами по
+    каждому вопросу и разрезами по типу отношений и группе оценивающих.
+    """
+    relationship_types, respondent, question, relationship, group, value, count = (
+        _load_histogram(respondent_ids)
+    )
+    scores = {respondent_id: [] for respondent_id in respondent_ids}
+    if not len(respondent):
+        return scores
+
+    breakdowns = (
+        (np.ones(len(respondent), dtype=bool), None, lambda key: {}),
+        (
+            relationship < len(relationship_types),
+            relationship,
+            lambda key: {'relationship_type': relationship_types[key[2]]}
+        ),
+        (group != NO_GROUP, group, lambda key: {'rater_group_id': int(key[2])}),
+    )
+    for mask, column, breakdown in breakdowns:
+        if not mask.any():
+            continue
+        columns = [respondent[mask], question[mask]]
+        if column is not None:
+            columns.append(column[mask])
+
+        unique_keys, n, mean, std, distribution = _group_stats(
+            np.column_stack(columns), value[mask], count[mask]
+        )
+        for key, key_n, key_mean, key_std, key_distribution in zip(unique_keys, n, mean, std, distribution):
+            scores[int(key[0])].append(ReportScore(
+                question_id=int(key[1]),
+                count=int(key_n),
+                mean=float(key_mean),
+                std=float(key_std),
+                distribution=key_distribution,
+                **breakdown(key)
+            ))
+
+    return scores
+
+
+def _summarize(respondent_ids, scores):
+    """Сводка отчёта: оценивающие по типам отношений и общий средний балл"""
+    summary = {
+        respondent_id: {'raters': {}, 'raters_total': 0, 'raters_completed': 0}
+        for respondent_id in respondent_ids
+    }
+    raters = Rater.objects.filter(respondent_id__in=respondent_ids).values(
+        'respondent_id', 'relationship_type', 'status'
+    ).annotate(n=Count('id')).order_by()
+    for row in raters:
+        data = summary[row['respondent_id']]
+        by_type = data['raters'].setdefault(row['relationship_type'], {'total': 0, 'completed': 0})
+        by_type['total'] += row['n']
+        data['raters_total'] += row['n']
+        if row['status'] == 'completed':
+            by_type['completed'] += row['n']
+            data['raters_completed'] += row['n']
+
+    for respondent_id, respondent_scores in scores.items():
+        totals = [
+            score for score in respondent_scores
+            if not score.relationship_type and score.rater_group_id is None
+        ]
+        answers = sum(score.count for score in totals)
+        summary[respondent_id]['answers'] = answers
+        summary[respondent_id]['questions'] = len(totals)
+        summary[respondent_id]['mean'] = (
+            sum(score.mean * score.count for score in totals) / answers if answers else None
+        )
+    return summary
+
+
+def generate_reports(survey, respondent_ids=None, generated_by=None):
+    """Пересчитывает и сохраняет отчёты по участникам опроса.
+
+    Статистика считается агрегацией в БД и массивами NumPy и сохраняется
+    строками ReportScore, поэтому страницы отчётов не читают сырые ответы.
+    """
+    if respondent_ids is None:
+        respondent_ids = list(survey.respondents.values_list('id', flat=True))
+    respondent_ids = list(respondent_ids)
+    if not respondent_ids:
+        return []
+
+    scores = compute_scores(respondent_ids)
+    summary = _summarize(respondent_ids, scores)
+
+    with transaction.atomic():
+        Report.objects.bulk_create(
+            [
+                Report(
+                    survey=survey,
+                    respondent_id=respondent_id,
+                    report_data=summary[respondent_id],
+                    generated_by=generated_by
+                )
+                for respondent_id in respondent_ids
+            ],
+            update_conflicts=True,
+            unique_fields=['survey', 'respondent'],
+            update_fields=['report_data', 'generated_at', 'generated_by']
+        )
+        reports = {
+            report.respondent_id: report
+            for report in Report.objects.filter(survey=survey, respondent_id__in=respondent_ids)
+        }
+        ReportScore.objects.filter(report__in=reports.values()).delete()
+
+        rows = []
+        for respondent_id, respondent_scores in scores.items():
+            for score in respondent_scores:
+                score.report = reports[respondent_id]
+                rows.append(score)
+        ReportScore.objects.bulk_create(rows, batch_size=1000)
+
+    return list(reports.values())
+
+
+def generate_report_chunk(survey_id, respondent_ids):
+    """Точка входа для рабочих процессов generate_reports.
+
+    Принимает только идентификаторы, чтобы задание можно было передать в
+    другой процесс; возвращает число обновлённых отчётов.
+    """
+    # Тяжёлые чтения идут с реплики, запись отчётов и всё после неё - на основную БД
+    with read_from_replica():
+        survey = Survey.objects.get(pk=survey_id)
+        return len(generate_reports(survey, respondent_ids))
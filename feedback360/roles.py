@@ -0,0 +1,48 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import F
+
+# Ключ включает User.role_version: версия хранится в БД и читается вместе со
+# строкой пользователя, поэтому отзыв роли виден всем процессам сразу,
+# даже если у каждого свой кэш в памяти (locmem)
+ROLE_CACHE_KEY = 'feedback360:user_roles:{user_id}:{version}'
+ROLE_CACHE_TIMEOUT = 60 * 60
+
+
+def role_cache_key(user_id, version):
+    return ROLE_CACHE_KEY.format(user_id=user_id, version=version)
+
+
+def get_role_names(user):
+    """Возвращает множество названий ролей пользователя.
+
+    Результат запоминается на экземпляре пользователя (на время запроса)
+    и в кэше Django (между запросами), поэтому все проверки ролей в рамках
+    одного запроса обходятся одним запросом к БД или ни одним.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+
+    role_names = getattr(user, '_role_names', None)
+    if role_names is not None:
+        return role_names
+
+    key = role_cache_key(user.pk, user.role_version)
+    role_names = cache.get(key)
+    if role_names is None:
+        role_names = frozenset(
+            user.userrole_set.values_list('role__name', flat=True)
+        )
+        cache.set(key, role_names, ROLE_CACHE_TIMEOUT)
+
+    user._role_names = role_names
+    return role_names
+
+
+def invalidate_user_roles(*user_ids):
+    """Сбрасывает кэш ролей для указанных пользователей.
+
+    Увеличивает их role_version; записи со старой версией больше не читаются
+    ни одним процессом и истекают сами.
+    """
+    get_user_model().objects.filter(pk__in=user_ids).update(role_version=F('role_version') + 1)
@@ -0,0 +1,59 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_replica_state = ContextVar('feedback360_replica_state', default=None)
+
+
+class _ReplicaState:
+    def __init__(self):
+        self.wrote = False
+
+
+def get_replica_alias():
+    alias = getattr(settings, 'REPLICA_DATABASE_ALIAS', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+@contextmanager
+def read_from_replica():
+    """Чтение внутри блока идёт с реплики, если она настроена.
+
+    После первой записи в блоке все следующие чтения возвращаются на основную
+    БД, чтобы код видел только что записанные данные. Внутри транзакции на
+    основной БД чтения тоже остаются на ней.
+    """
+    token = _replica_state.set(_ReplicaState())
+    try:
+        yield
+    finally:
+        _replica_state.reset(token)
+
+
+class ReplicaRouter:
+    """Направляет чтения отчётов и страниц только для чтения на реплику"""
+
+    def db_for_read(self, model, **hints):
+        state = _replica_state.get()
+        replica = get_replica_alias()
+        if state is None or state.wrote or replica is None:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return replica
+
+    def db_for_write(self, model, **hints):
+        state = _replica_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика содержит те же данные, что и основная БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплики приходит вместе с данными основной БД
+        return db != get_replica_alias()
@@ -0,0 +1,158 @@
+from django.db import connections, router, transaction
+from django.db.models import Count, FloatField, Sum
+from django.db.models.functions import Cast
+
+from .models import Rater, Response, ScoreAggregate
+
+
+def _as_float(value):
+    return None if value is None else float(value)
+
+
+def _delta(old, new):
+    old, new = _as_float(old), _as_float(new)
+    return (
+        (new is not None) - (old is not None),
+        (new or 0.0) - (old or 0.0),
+        (new or 0.0) ** 2 - (old or 0.0) ** 2,
+    )
+
+
+def apply_score_changes(survey_id, respondent_id, relationship_type, changes):
+    """Применяет изменения ответов одного оценивающего к накопительным суммам.
+
+    changes - пары (question_id, старое значение, новое значение); None
+    означает отсутствие числового ответа. Все изменения применяются одним
+    upsert-запросом (INSERT ... ON CONFLICT DO UPDATE, SQLite и PostgreSQL).
+    """
+    params = []
+    for question_id, old, new in changes:
+        count, total, total_sq = _delta(old, new)
+        if count or total or total_sq:
+            params.append((survey_id, respondent_id, question_id, relationship_type, count, total, total_sq))
+    if not params:
+        return
+
+    connection = connections[router.db_for_write(ScoreAggregate)]
+    qn = connection.ops.quote_name
+    table = qn(ScoreAggregate._meta.db_table)
+    sql = (
+        f"INSERT INTO {table} (survey_id, respondent_id, question_id, relationship_type, "
+        f"{qn('count')}, total, total_sq) VALUES (%s, %s, %s, %s, %s, %s, %s) "
+        f"ON CONFLICT (respondent_id, question_id, relationship_type) DO UPDATE SET "
+        f"{qn('count')} = {table}.{qn('count')} + excluded.{qn('count')}, "
+        f"total = {table}.total + excluded.total, "
+        f"total_sq = {table}.total_sq + excluded.total_sq"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def apply_response_change(rater_id, question_id, old, new):
+    """Изменение одного ответа (сохранение или удаление через модель)"""
+    if _as_float(old) == _as_float(new):
+        return
+    respondent_id, survey_id, relationship_type = Rater.objects.filter(pk=rater_id).values_list(
+        'respondent_id', 'respondent__survey_id', 'relationship_type'
+    ).get()
+    apply_score_changes(survey_id, respondent_id, relationship_type, [(question_id, old, new)])
+
+
+def _actual_aggregates(survey):
+    """Суммы, посчитанные заново по сырым ответам опроса"""
+    value = Cast('answer_value', FloatField())
+    rows = Response.objects.filter(
+        rater__respondent__survey=survey,
+        answer_value__isnull=False
+    ).values(
+        'rater__respondent_id', 'question_id', 'rater__relationship_type'
+    ).annotate(
+        n=Count('id'),
+        s=Sum(value),
+        sq=Sum(value * value)
+    ).order_by()
+    return {
+        (row['rater__respondent_id'], row['question_id'], row['rater__relationship_type']):
+            (row['n'], row['s'] or 0.0, row['sq'] or 0.0)
+        for row in rows
+    }
+
+
+def _stats(count, total, total_sq):
+    mean = total / count
+    return {
+        'count': count,
+        'mean': mean,
+        'std': max(total_sq / count - mean * mean, 0.0) ** 0.5,
+    }
+
+
+def survey_scores(survey_id, respondent_id=None):
+    """Текущая статистика опроса по накопительным суммам, без чтения ответов.
+
+    Одна строка агрегатов на (участник, вопрос, тип отношений), поэтому
+    объём чтения не зависит от числа ответов. Возвращает по каждому вопросу
+    итог и разрез по типам отношений: {question_id: {'count', 'mean', 'std',
+    'relationship_types': {тип: {'count', 'mean', 'std'}}}}.
+    """
+    aggregates = ScoreAggregate.objects.filter(survey_id=survey_id, count__gt=0)
+    if respondent_id is not None:
+        aggregates = aggregates.filter(respondent_id=respondent_id)
+    rows = aggregates.values('question_id', 'relationship_type').annotate(
+        n=Sum('count'), s=Sum('total'), sq=Sum('total_sq')
+    ).order_by()
+
+    totals = {}
+    by_type = {}
+    for row in rows:
+        count, total, total_sq = totals.get(row['question_id'], (0, 0.0, 0.0))
+        totals[row['question_id']] = (count + row['n'], total + row['s'], total_sq + row['sq'])
+        by_type.setdefault(row['question_id'], {})[row['relationship_type']] = _stats(
+            row['n'], row['s'], row['sq']
+        )
+    return {
+        question_id: {**_stats(*sums), 'relationship_types': by_type[question_id]}
+        for question_id, sums in totals.items()
+    }
+
+
+def reconcile_survey(survey, tolerance=1e-6):
+    """Сверяет накопительные суммы опроса с сырыми ответами и исправляет расхождения.
+
+    Строки оценивающих опроса блокируются на время сверки: отправка ответов
+    сначала обновляет строку оценивающего, поэтому её дельты не попадут между
+    подсчётом и записью исправленных сумм. Возвращает число исправленных
+    строк агрегатов.
+    """
+    with transaction.atomic():
+        list(Rater.objects.select_for_update().filter(respondent__survey=survey).values_list('pk', flat=True))
+        return _reconcile_locked(survey, tolerance)
+
+
+def _reconcile_locked(survey, tolerance):
+    actual = _actual_aggregates(survey)
+    stored = {
+        (row.respondent_id, row.question_id, row.relationship_type): row
+        for row in ScoreAggregate.objects.filter(survey=survey)
+    }
+
+    to_create, to_update, to_delete = [], [], []
+    for key, (count, total, total_sq) in actual.items():
+        row = stored.pop(key, None)
+        if row is None:
+            to_create.append(ScoreAggregate(
+                survey=survey, respondent_id=key[0], question_id=key[1], relationship_type=key[2],
+                count=count, total=total, total_sq=total_sq
+            ))
+        elif (row.count != count or abs(row.total - total) > tolerance
+              or abs(row.total_sq - total_sq) > tolerance):
+            row.count, row.total, row.total_sq = count, total, total_sq
+            to_update.append(row)
+    # Оставшиеся строки не подкреплены ответами
+    to_delete = [row.pk for row in stored.values() if row.count or row.total or row.total_sq]
+
+    ScoreAggregate.objects.bulk_create(to_create, batch_size=1000)
+    ScoreAggregate.objects.bulk_update(to_update, ['count', 'total', 'total_sq'], batch_size=1000)
+    ScoreAggregate.objects.filter(pk__in=to_delete).delete()
+
+    return len(to_create) + len(to_update) + len(to_delete)
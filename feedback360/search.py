@@ -0,0 +1,108 @@
+import sys
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+
+from .models import User
+
+USER_SEARCH_FIELDS = ('last_name', 'first_name', 'username', 'position', 'department')
+MAX_SEARCH_TERMS = 3
+
+USER_LABEL_CACHE_KEY = 'feedback360:user_label:{stamp}:{user_id}'
+USER_LABEL_CACHE_TIMEOUT = 60 * 60
+
+
+def _prefix_variants(term):
+    """Варианты регистра для поиска по префиксу.
+
+    LIKE и UPPER в SQLite не знают регистра кириллицы, а выражение над
+    колонкой не может использовать её индекс, поэтому ищем сразу по
+    нескольким написаниям: как введено, строчными, с заглавной и прописными.
+    """
+    return {term, term.lower(), term.capitalize(), term.upper()}
+
+
+def _next_char(char):
+    code = ord(char) + 1
+    # Суррогаты не хранятся в UTF-8 - следующий допустимый символ после U+D7FF
+    if 0xD800 <= code <= 0xDFFF:
+        code = 0xE000
+    return chr(code)
+
+
+def _prefix_range(field, prefix):
+    """Диапазон [prefix, следующая строка) - читается по обычному B-tree индексу.
+
+    Последний символ U+10FFFF увеличить нельзя, поэтому верхняя граница
+    строится по символам перед ним; если префикс целиком из U+10FFFF,
+    остаётся только нижняя граница - больше префикса лишь строки, которые
+    с него начинаются.
+    """
+    condition = Q(**{f'{field}__gte': prefix})
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if stem:
+        condition &= Q(**{f'{field}__lt': stem[:-1] + _next_char(stem[-1])})
+    return condition
+
+
+def search_users(query):
+    """Пользователи, у которых каждое слово запроса начинает ФИО, логин, должность или отдел"""
+    matches = User.objects.filter(is_active=True)
+    for term in query.split()[:MAX_SEARCH_TERMS]:
+        condition = Q()
+        for field in USER_SEARCH_FIELDS:
+            for prefix in _prefix_variants(term):
+                condition |= _prefix_range(field, prefix)
+        matches = matches.filter(condition)
+    # Совпадения ищутся подзапросом без сортировки: иначе планировщик предпочитает
+    # полный проход по индексу сортировки вместо поиска по диапазонам
+    return User.objects.filter(pk__in=matches.order_by().values('pk')).order_by('last_name', 'first_name', 'id')
+
+
+def user_label(user):
+    """Подпись пользователя в списках выбора"""
+    return user.get_display_name() or user.username
+
+
+def user_labels_stamp():
+    """Отметка справочника пользователей из БД: количество и время последнего изменения.
+
+    Отметка одинакова во всех процессах, поэтому подписи, закэшированные по
+    ней, устаревают сразу везде, даже если кэш у процессов свой (locmem).
+    Максимум updated_at читается по индексу.
+    """
+    stamp = User.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+    updated = stamp['updated'].timestamp() if stamp['updated'] else 0
+    return f"{stamp['count']}-{updated}"
+
+
+def get_user_labels(user_ids, users=None):
+    """Подписи пользователей {id: подпись} одним обращением к кэшу.
+
+    Ключи кэша содержат отметку user_labels_stamp(), поэтому изменение
+    любого пользователя делает все сохранённые подписи неактуальными без
+    перебора ключей. Недостающие подписи берутся из уже загруженных users,
+    остальные догружаются одним запросом.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+    users = users or {}
+
+    stamp = user_labels_stamp()
+    keys = {USER_LABEL_CACHE_KEY.format(stamp=stamp, user_id=user_id): user_id for user_id in user_ids}
+    cached = cache.get_many(keys)
+    labels = {keys[key]: label for key, label in cached.items()}
+
+    missing = user_ids - labels.keys()
+    to_load = missing - users.keys()
+    if to_load:
+        users = {**users, **User.objects.in_bulk(to_load)}
+    fresh = {user_id: user_label(users[user_id]) for user_id in missing if user_id in users}
+    if fresh:
+        cache.set_many(
+            {USER_LABEL_CACHE_KEY.format(stamp=stamp, user_id=user_id): label for user_id, label in fresh.items()},
+            USER_LABEL_CACHE_TIMEOUT
+        )
+    labels.update(fresh)
+    return labels
@@ -1,15 +1,63 @@
-from django.core.mail import send_mail
-from django.db.models.signals import post_save
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from django.template.loader import render_to_string
-from django.urls import reverse
 
-from survey360 import settings
-from .models import Survey
-from .utils import send_survey_invitation
+from .models import Survey, Role, UserRole, Question, SurveyTemplate, Respondent
+from .mailing import enqueue_survey_invitations
+from .roles import invalidate_user_roles
 
 @receiver(post_save, sender=Survey)
-def handle_survey_status_change(sender, instance, **kwargs):
-    if instance.status == 'active' and instance.pk:
-        instance.send_invitations()
+def handle_survey_status_change(sender, instance, created, **kwargs):
+    """Приглашения рассылаются при переходе черновика в активный опрос
+    или при создании сразу активного опроса.
+
+    Повторные сохранения активного опроса рассылку не запускают; постановка
+    в очередь идёт после фиксации транзакции, поэтому сохранение не ждёт
+    почту, а откаченная активация ничего не отправляет. Опрос с уже
+    заполненным invitations_enqueued_at (например, из фикстуры) повторно
+    в очередь не ставится.
+    """
+    if created:
+        if instance.status == 'active':
+            transaction.on_commit(partial(enqueue_survey_invitations, instance.pk))
+        return
+    if instance.loaded_status == 'draft' and instance.status == 'active':
+        transaction.on_commit(partial(enqueue_survey_invitations, instance.pk))
+    elif instance.status == 'draft' and instance.loaded_status not in (None, 'draft'):
+        # Опрос вернули в черновик: следующая активация разошлёт приглашения новым оценивающим
+        Survey.objects.filter(pk=instance.pk).update(invitations_enqueued_at=None)
+
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+def handle_user_role_change(sender, instance, **kwargs):
+    invalidate_user_roles(instance.user_id)
+
+
+@receiver(post_save, sender=Role)
+def handle_role_change(sender, instance, created, **kwargs):
+    # Переименование роли затрагивает всех её владельцев
+    if not created:
+        user_ids = list(instance.userrole_set.values_list('user_id', flat=True))
+        invalidate_user_roles(*user_ids)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def handle_template_question_change(sender, instance, **kwargs):
+    # Следующий опрос по шаблону получит новую замороженную версию
+    if instance.template_id:
+        SurveyTemplate.bump_version(instance.template_id, current_version=None)
+    if instance.survey_id:
+        Survey.bump_version(instance.survey_id)
+
 
+@receiver(post_save, sender=Respondent)
+@receiver(post_delete, sender=Respondent)
+def handle_respondent_change(sender, instance, origin=None, **kwargs):
+    # Участники удаляются вместе с опросом - его версия уже не нужна
+    if isinstance(origin, Survey) or getattr(origin, 'model', None) is Survey:
+        return
+    Survey.bump_version(instance.survey_id)
@@ -1,9 +1,33 @@
+import logging
+
 from celery import shared_task
-from .models import Survey
-from .utils import send_survey_invitation
+from .mailing import chunked, claim_invitations, deliver_invitations, get_batch_size
+from .models import Survey, Rater
+
+logger = logging.getLogger(__name__)
+
 
 @shared_task
 def send_survey_emails(survey_id):
+    """Разбивает рассылку по опросу на пачки и ставит каждую в очередь"""
+    rater_ids = list(
+        Rater.objects.filter(
+            respondent__survey_id=survey_id,
+            invitation_sent=False
+        ).values_list('id', flat=True)
+    )
+    for batch in chunked(rater_ids, get_batch_size()):
+        send_invitation_batch.delay(survey_id, batch)
+    return len(rater_ids)
+
+
+@shared_task
+def send_invitation_batch(survey_id, rater_ids):
     survey = Survey.objects.get(id=survey_id)
-    for respondent in survey.respondents.all():
-        send_survey_invitation(survey, respondent.user)
\ No newline at end of file
+    # Строки захватываются до отправки: повтор задачи или пересекающаяся
+    # пачка не отправят то же приглашение ещё раз
+    claimed = claim_invitations(rater_ids)
+    raters = Rater.objects.filter(id__in=claimed).select_related('user')
+    stats = deliver_invitations(survey, raters, claimed=True)
+    logger.info("Приглашения по опросу %s: %s", survey_id, stats)
+    return stats.as_dict()
@@ -1,3 +1,1340 @@
-from django.test import TestCase
+import io
+import json
+import os
+import smtplib
+import sys
+import tempfile
+import types
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Count
+from django.template.loader import render_to_string
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from unittest import mock
+from django.urls import reverse
+
+from .catalogue import catalogue_stamp, render_template_catalogue
+from .forms import RespondentFormSet
+from .mailing import claim_invitations, deliver_invitations
+from .management.commands.benchmark_views import Command as BenchmarkViewsCommand
+from .management.commands.generate_reports import Command as GenerateReportsCommand
+from .models import (
+    Question, Rater, Report, Respondent, Response, Role, ScoreAggregate, Survey, SurveyTemplate, User, UserRole,
+    allocate_sort_orders
+)
+from .progress import publish_progress
+from .reports import generate_reports
+from .roles import role_cache_key
+from .routers import ReplicaRouter, read_from_replica
+from .scores import reconcile_survey
+from .search import get_user_labels
+from .tokens import make_rater_token
+from .utils import InvitationRenderer
+from .views import UserSearchView
+
+
+class SurveyDataMixin:
+    """Активный опрос с вопросом-шкалой, текстовым вопросом и одним оценивающим"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.rater_user = User.objects.create_user('rater', 'rater@example.com', 'password')
+        cls.respondent_user = User.objects.create_user('respondent', 'respondent@example.com', 'password')
+        cls.survey = Survey.objects.create(
+            name='Опрос',
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=30),
+            created_by=cls.admin,
+            status='active'
+        )
+        cls.scale_question = Question.objects.create(survey=cls.survey, text='Шкала', answer_type='scale')
+        cls.text_question = Question.objects.create(
+            survey=cls.survey, text='Комментарий', answer_type='text', is_required=False
+        )
+        cls.respondent = Respondent.objects.create(survey=cls.survey, user=cls.respondent_user)
+        cls.rater = Rater.objects.create(
+            respondent=cls.respondent, user=cls.rater_user, relationship_type='peer'
+        )
+
+
+class RaterAnswersValidationTests(SurveyDataMixin, TestCase):
+    def setUp(self):
+        self.client.force_login(self.rater_user)
+        self.url = reverse('rater_answers', args=[self.rater.pk])
+
+    def post(self, payload, url=None):
+        return self.client.post(url or self.url, json.dumps(payload), content_type='application/json')
+
+    def post_value(self, value, url=None):
+        return self.post({'answers': [{'question': self.scale_question.pk, 'value': value}]}, url)
+
+    def test_non_finite_values_rejected(self):
+        token_url = reverse('rater_token_answers', args=[make_rater_token(self.rater, self.survey)])
+        for value in ('NaN', 'sNaN', 'Infinity', '-Infinity'):
+            for url in (self.url, token_url):
+                with self.subTest(value=value, url=url):
+                    response = self.post_value(value, url)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn(str(self.scale_question.pk), response.json()['errors'])
+        self.assertFalse(Response.objects.exists())
+
+    def test_extra_precision_rejected(self):
+        response = self.post_value('4.55')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Response.objects.exists())
+        self.assertFalse(ScoreAggregate.objects.exists())
+
+    def test_value_stored_as_aggregated(self):
+        response = self.post_value('4.50')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Response.objects.get().answer_value, Decimal('4.5'))
+        aggregate = ScoreAggregate.objects.get()
+        self.assertEqual((aggregate.count, aggregate.total), (1, 4.5))
+
+    def test_out_of_range_rejected(self):
+        for value in ('0', '6', '1e30'):
+            with self.subTest(value=value):
+                self.assertEqual(self.post_value(value).status_code, 400)
+
+    def test_malformed_answers_rejected(self):
+        for answers in (5, 'answers', {'question': self.scale_question.pk}, [5], ['x'], None):
+            with self.subTest(answers=answers):
+                response = self.post({'answers': answers})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['message'], 'Некорректный формат запроса')
+        self.assertEqual(self.post([1, 2]).status_code, 400)
+
+    def test_complete_must_be_boolean(self):
+        answers = [{'question': self.scale_question.pk, 'value': 4}]
+        for complete in ('false', '0', 0, 1, None, []):
+            with self.subTest(complete=complete):
+                response = self.post({'answers': answers, 'complete': complete})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['message'], 'Некорректный формат запроса')
+        self.assertFalse(Response.objects.exists())
+
+        response = self.post({'answers': answers, 'complete': False})
+        self.assertEqual(response.json()['rater_status'], 'started')
+
+    def test_text_must_be_string(self):
+        for text in (['ответ'], {'text': 'ответ'}, 5, True):
+            with self.subTest(text=text):
+                response = self.post({'answers': [{'question': self.text_question.pk, 'text': text}]})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(str(self.text_question.pk), response.json()['errors'])
+        self.assertFalse(Response.objects.exists())
+
+
+class CountingEmailBackend(BaseEmailBackend):
+    """Считает открытия соединения и отказывает адресатам из errors"""
+
+    def __init__(self, errors=None, **kwargs):
+        super().__init__(**kwargs)
+        self.errors = errors or {}
+        self.opened = self.closed = 0
+        self.sent = []
+
+    def open(self):
+        self.opened += 1
+        return True
+
+    def close(self):
+        self.closed += 1
+
+    def send_messages(self, messages):
+        for message in messages:
+            error = self.errors.get(message.to[0])
+            if error is not None:
+                raise error
+            self.sent.append(message.to[0])
+        return len(messages)
+
+
+class InvitationRendererTests(SurveyDataMixin, TestCase):
+    def render_directly(self, template_name, user, access_url):
+        return render_to_string(template_name, {
+            'user': user,
+            'access_url': access_url,
+            'survey': self.survey,
+            'start_date': self.survey.start_date,
+            'end_date': self.survey.end_date,
+        })
+
+    def test_same_output_as_full_render(self):
+        self.rater_user.first_name = 'Анна <Мария>'
+        access_url = 'https://example.com/rate/abc/?a=1&b=2'
+        text, html = InvitationRenderer(self.survey).render(self.rater_user, access_url)
+        self.assertEqual(
+            text, self.render_directly(InvitationRenderer.text_template_name, self.rater_user, access_url)
+        )
+        self.assertEqual(
+            html, self.render_directly(InvitationRenderer.html_template_name, self.rater_user, access_url)
+        )
+        self.assertIn('Анна &lt;Мария&gt;', html)
+
+    def test_templates_rendered_once_per_survey(self):
+        with mock.patch('feedback360.utils.render_to_string', wraps=render_to_string) as render:
+            renderer = InvitationRenderer(self.survey)
+            messages = [renderer.build_message(user) for user in (self.rater_user, self.respondent_user)]
+        self.assertEqual(render.call_count, 2)
+        self.assertEqual([message.to for message in messages], [['rater@example.com'], ['respondent@example.com']])
+
+
+class DeliverInvitationsTests(SurveyDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for number in range(4):
+            user = User.objects.create_user(f'peer{number}', f'peer{number}@example.com', 'password')
+            Rater.objects.create(respondent=cls.respondent, user=user, relationship_type='peer')
+
+    def deliver(self, errors):
+        connection = CountingEmailBackend(errors)
+        raters = Rater.objects.filter(respondent=self.respondent).select_related('user').order_by('pk')
+        with self.assertLogs('feedback360.mailing', 'ERROR'):
+            stats = deliver_invitations(self.survey, raters, connection)
+        return connection, stats
+
+    def test_refused_recipient_keeps_connection(self):
+        connection, stats = self.deliver({
+            'peer1@example.com': smtplib.SMTPRecipientsRefused({'peer1@example.com': (550, b'No such user')})
+        })
+        self.assertEqual((connection.opened, connection.closed), (1, 1))
+        self.assertEqual((stats.sent, stats.failed), (4, 1))
+        self.assertFalse(Rater.objects.get(user__username='peer1').invitation_sent)
+        self.assertEqual(Rater.objects.filter(invitation_sent=True).count(), 4)
+
+    def test_connection_failure_reopens_once(self):
+        connection, stats = self.deliver({
+            'peer1@example.com': smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        })
+        # Открытие пачки и одно переподключение
+        self.assertEqual((connection.opened, connection.closed), (2, 2))
+        self.assertEqual((stats.sent, stats.failed), (4, 1))
+
+    def test_overlapping_batches_claim_each_rater_once(self):
+        rater_ids = list(Rater.objects.filter(respondent=self.respondent).order_by('pk').values_list('pk', flat=True))
+        Rater.objects.filter(pk=rater_ids[0]).update(invitation_sent=True)
+        first = claim_invitations(rater_ids[:3])
+        second = claim_invitations(rater_ids)
+        self.assertEqual(first, rater_ids[1:3])
+        self.assertEqual(second, rater_ids[3:])
+        self.assertEqual(claim_invitations(rater_ids), [])
+
+    def test_undelivered_claims_released(self):
+        rater_ids = list(Rater.objects.filter(respondent=self.respondent).values_list('pk', flat=True))
+        claimed = claim_invitations(rater_ids)
+        connection = CountingEmailBackend({
+            'peer1@example.com': smtplib.SMTPRecipientsRefused({'peer1@example.com': (550, b'No such user')})
+        })
+        raters = Rater.objects.filter(pk__in=claimed).select_related('user')
+        with self.assertLogs('feedback360.mailing', 'ERROR'):
+            stats = deliver_invitations(self.survey, raters, connection, claimed=True)
+        self.assertEqual((stats.sent, stats.failed), (4, 1))
+        # Повтор рассылки получает только недоставленное письмо
+        self.assertEqual(claim_invitations(rater_ids), [Rater.objects.get(user__username='peer1').pk])
+
+
+class ScoreAggregateTests(SurveyDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.manager_user = User.objects.create_user('manager', 'manager@example.com', 'password')
+        cls.manager_rater = Rater.objects.create(
+            respondent=cls.respondent, user=cls.manager_user, relationship_type='manager'
+        )
+
+    def submit(self, rater, value):
+        self.client.force_login(rater.user)
+        response = self.client.post(
+            reverse('rater_answers', args=[rater.pk]),
+            json.dumps({'answers': [{'question': self.scale_question.pk, 'value': value}]}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def get_scores(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('survey_scores', args=[self.survey.pk]))
+        self.assertEqual(response.status_code, 200)
+        return {row['question']: row for row in response.json()['questions']}
+
+    def test_scores_served_from_aggregates(self):
+        self.submit(self.rater, '2')
+        self.submit(self.manager_rater, '4')
+        self.submit(self.rater, '3')
+
+        score = self.get_scores()[self.scale_question.pk]
+        self.assertEqual(score['count'], 2)
+        self.assertAlmostEqual(score['mean'], 3.5)
+        self.assertAlmostEqual(score['std'], 0.5)
+        self.assertEqual(score['relationship_types']['peer']['mean'], 3.0)
+        self.assertEqual(score['relationship_types']['manager']['count'], 1)
+
+    def test_scores_require_admin_access(self):
+        self.client.force_login(self.rater_user)
+        response = self.client.get(reverse('survey_scores', args=[self.survey.pk]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_reconcile_fixes_drift(self):
+        self.submit(self.rater, '4')
+        ScoreAggregate.objects.update(count=5, total=1.0)
+        self.assertEqual(reconcile_survey(self.survey), 1)
+        aggregate = ScoreAggregate.objects.get()
+        self.assertEqual((aggregate.count, aggregate.total, aggregate.total_sq), (1, 4.0, 16.0))
+        self.assertEqual(reconcile_survey(self.survey), 0)
+
+    def test_customize_questions_moves_aggregates(self):
+        template = SurveyTemplate.objects.create(name='Шаблон')
+        Question.objects.create(template=template, text='Вопрос шаблона', answer_type='scale')
+        version = template.freeze()
+        shared_question = version.questions.get()
+        Survey.objects.filter(pk=self.survey.pk).update(template_version=version)
+        self.survey.refresh_from_db()
+
+        self.client.force_login(self.rater_user)
+        self.client.post(
+            reverse('rater_answers', args=[self.rater.pk]),
+            json.dumps({'answers': [{'question': shared_question.pk, 'value': '5'}]}),
+            content_type='application/json'
+        )
+        self.survey.customize_questions()
+
+        copy = self.survey.questions.get(text='Вопрос шаблона')
+        aggregate = ScoreAggregate.objects.get(survey=self.survey)
+        self.assertEqual(aggregate.question_id, copy.pk)
+        self.assertEqual(Response.objects.get(rater=self.rater).question_id, copy.pk)
+        self.assertEqual(reconcile_survey(self.survey), 0)
+
+
+class ReportEngineTests(SurveyDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        raters = [cls.rater] + [
+            Rater.objects.create(
+                respondent=cls.respondent,
+                user=User.objects.create_user(f'rater{n}'),
+                relationship_type=relationship_type,
+                status='completed'
+            )
+            for n, relationship_type in enumerate(('peer', 'manager'))
+        ]
+        for rater, value in zip(raters, ('3', '4', '5')):
+            Response.objects.create(rater=rater, question=cls.scale_question, answer_value=Decimal(value))
+
+    def scores(self, report):
+        return {score.relationship_type: score for score in report.scores.filter(rater_group__isnull=True)}
+
+    def test_scores_by_relationship_type(self):
+        report, = generate_reports(self.survey)
+        scores = self.scores(report)
+        self.assertEqual(scores.keys(), {'', 'peer', 'manager'})
+
+        total = scores['']
+        self.assertEqual((total.count, total.mean), (3, 4.0))
+        self.assertAlmostEqual(total.std, (2 / 3) ** 0.5)
+        self.assertEqual(total.distribution, {'3': 1, '4': 1, '5': 1})
+        self.assertEqual((scores['peer'].count, scores['peer'].mean), (2, 3.5))
+        self.assertEqual((scores['manager'].count, scores['manager'].mean), (1, 5.0))
+
+        self.assertEqual(report.report_data['raters']['peer'], {'total': 2, 'completed': 1})
+        self.assertEqual((report.report_data['answers'], report.report_data['mean']), (3, 4.0))
+
+    def test_regeneration_replaces_scores(self):
+        generate_reports(self.survey)
+        Response.objects.filter(rater=self.rater).update(answer_value=Decimal('5'))
+        report, = generate_reports(self.survey)
+        self.assertEqual(Report.objects.count(), 1)
+        self.assertEqual(report.scores.count(), 3)
+        self.assertEqual(self.scores(report)['peer'].mean, 4.5)
+
+
+class ExplainQueriesCommandTests(SurveyDataMixin, TestCase):
+    def test_hot_queries_use_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Проверяются планы SQLite')
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        output = os.path.join(output_dir.name, 'plans.json')
+        call_command('explain_queries', '--repeat', '1', '--output', output, stdout=io.StringIO())
+        with open(output) as f:
+            plans = {case['name']: '\n'.join(sum(case['plans'], [])) for case in json.load(f)['cases']}
+
+        expected = {
+            'admin_surveys_by_status': 'survey_status_created_idx',
+            'admin_respondents': 'respondent_survey_status_idx',
+            'admin_raters': 'rater_status_type_idx',
+            'reset_raters': 'rater_status_type_idx',
+            'report_summary': 'rater_respondent_status_idx',
+        }
+        for name, index in expected.items():
+            with self.subTest(name=name):
+                self.assertIn(index, plans[name])
+
+
+class GenerateReportsCommandTests(SurveyDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.second_respondent = Respondent.objects.create(survey=cls.survey, user=cls.rater_user)
+
+    def setUp(self):
+        checkpoint_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(checkpoint_dir.cleanup)
+        self.checkpoint = os.path.join(checkpoint_dir.name, 'checkpoint')
+
+    def run_command(self, *args):
+        call_command(
+            'generate_reports', '--workers', '1', '--chunk-size', '1', '--checkpoint', self.checkpoint,
+            *args, stdout=io.StringIO()
+        )
+
+    def test_resumes_from_checkpoint(self):
+        with open(self.checkpoint, 'w') as f:
+            json.dump([f'{self.survey.pk}:{self.respondent.pk}-{self.respondent.pk}'], f)
+        self.run_command()
+        self.assertEqual(
+            list(Report.objects.values_list('respondent_id', flat=True)), [self.second_respondent.pk]
+        )
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_checkpoint_kept_for_other_survey_set(self):
+        other = Survey.objects.create(
+            name='Другой опрос', start_date=date.today(), end_date=date.today(), created_by=self.admin
+        )
+        Respondent.objects.create(survey=other, user=self.admin)
+        # Прерванный запуск по первому опросу
+        survey_checkpoint = GenerateReportsCommand.checkpoint_path(self.checkpoint, [self.survey.pk])
+        with open(survey_checkpoint, 'w') as f:
+            json.dump([f'{self.survey.pk}:{self.respondent.pk}-{self.respondent.pk}'], f)
+
+        self.run_command('--survey', str(other.pk))
+        self.assertEqual(list(Report.objects.values_list('survey_id', flat=True)), [other.pk])
+        self.assertTrue(os.path.exists(survey_checkpoint))
+
+        self.run_command('--survey', str(self.survey.pk))
+        self.assertEqual(
+            list(Report.objects.filter(survey=self.survey).values_list('respondent_id', flat=True)),
+            [self.second_respondent.pk]
+        )
+        self.assertFalse(os.path.exists(survey_checkpoint))
+
+    def test_restart_ignores_checkpoint(self):
+        with open(self.checkpoint, 'w') as f:
+            json.dump([f'{self.survey.pk}:{self.respondent.pk}-{self.respondent.pk}'], f)
+        self.run_command('--restart')
+        self.assertEqual(Report.objects.filter(survey=self.survey).count(), 2)
+
+
+# Пароли демо-пользователей хешируются быстрым хешером, а не PBKDF2
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ScaleTestDataTests(TestCase):
+    def load(self):
+        call_command('load_test_data', scale=60, surveys=3, questions=4, stdout=io.StringIO())
+        return list(
+            Survey.objects.filter(name__startswith='Нагрузочный опрос').order_by('name').annotate(
+                respondent_count=Count('respondents', distinct=True),
+                aggregate_count=Count('score_aggregates', distinct=True)
+            ).values_list('status', 'respondent_count', 'aggregate_count')
+        )
+
+    def test_generates_consistent_data(self):
+        surveys = self.load()
+        self.assertEqual([status for status, _, _ in surveys], ['completed', 'active', 'draft'])
+        self.assertTrue(all(respondents for _, respondents, _ in surveys))
+        self.assertEqual(User.objects.filter(username__startswith='scale_').count(), 60)
+        self.assertTrue(Response.objects.exists())
+        # Накопительные суммы уже сведены с ответами
+        for survey in Survey.objects.filter(name__startswith='Нагрузочный опрос'):
+            self.assertEqual(reconcile_survey(survey), 0)
+
+    def test_same_seed_same_data(self):
+        first = self.load(), Response.objects.count()
+        self.assertEqual((self.load(), Response.objects.count()), first)
+
+    def test_benchmark_fixtures_do_not_write_reports(self):
+        self.load()
+        # Замер без --scale не пишет в измеряемую БД - просит подготовить отчёты
+        with self.assertRaisesMessage(CommandError, 'generate_reports'):
+            BenchmarkViewsCommand.get_fixtures()
+        self.assertFalse(Report.objects.exists())
+        fixtures = BenchmarkViewsCommand.get_fixtures(create_reports=True)
+        self.assertEqual(fixtures['report'].survey, fixtures['survey'])
+
+
+class RoleCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('leader', 'leader@example.com', 'password')
+        cls.role = Role.objects.create(name='Руководитель')
+
+    def fresh_user(self):
+        # Как в новом запросе: строка пользователя читается заново
+        return User.objects.get(pk=self.user.pk)
+
+    def test_role_grant_and_revoke(self):
+        self.assertFalse(self.fresh_user().is_leader)
+        user_role = UserRole.objects.create(user=self.user, role=self.role)
+        self.assertTrue(self.fresh_user().is_leader)
+        user_role.delete()
+        self.assertFalse(self.fresh_user().is_leader)
+
+    def test_revoked_role_ignores_stale_cache_of_other_process(self):
+        UserRole.objects.create(user=self.user, role=self.role)
+        user = self.fresh_user()
+        self.assertTrue(user.is_leader)
+        stale_key = role_cache_key(user.pk, user.role_version)
+        stale_roles = cache.get(stale_key)
+
+        UserRole.objects.filter(user=self.user).delete()
+        # Другой процесс со своим кэшем в памяти не узнал об отзыве роли
+        cache.set(stale_key, stale_roles)
+        self.assertFalse(self.fresh_user().is_leader)
+
+    def test_stale_instance_save_keeps_role_revoked(self):
+        UserRole.objects.create(user=self.user, role=self.role)
+        stale = self.fresh_user()
+        self.assertTrue(stale.is_leader)
+
+        UserRole.objects.filter(user=self.user).delete()
+        # Экземпляр загружен до отзыва роли: форма профиля, админка, смена пароля
+        stale.first_name = 'Иван'
+        stale.set_password('new-password')
+        stale.save()
+
+        user = self.fresh_user()
+        self.assertEqual(user.first_name, 'Иван')
+        self.assertTrue(user.check_password('new-password'))
+        self.assertGreater(user.role_version, stale.role_version)
+        self.assertFalse(user.is_leader)
+
+    def test_roles_cached_between_requests(self):
+        UserRole.objects.create(user=self.user, role=self.role)
+        self.assertTrue(self.fresh_user().is_leader)
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(user.is_leader)
+            self.assertTrue(user.has_role('Руководитель', 'Администратор'))
+
+
+class SurveyCreateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.leader = User.objects.create_user('leader', 'leader@example.com', 'password')
+        UserRole.objects.create(user=cls.leader, role=Role.objects.create(name='Руководитель'))
+        cls.users = [User.objects.create_user(f'employee{n}') for n in range(30)]
+
+    def setUp(self):
+        self.client.force_login(self.leader)
+
+    def post_survey(self, user_ids, questions=('Первый', 'Второй')):
+        data = {
+            'name': 'Новый опрос',
+            'start_date': date.today().isoformat(),
+            'end_date': (date.today() + timedelta(days=7)).isoformat(),
+            'respondents-TOTAL_FORMS': len(user_ids),
+            'respondents-INITIAL_FORMS': 0,
+            'questions-TOTAL_FORMS': len(questions),
+            'questions-INITIAL_FORMS': 0,
+        }
+        for index, user_id in enumerate(user_ids):
+            data[f'respondents-{index}-user'] = user_id
+        for index, text in enumerate(questions):
+            data.update({
+                f'questions-{index}-text': text,
+                f'questions-{index}-answer_type': 'scale',
+                f'questions-{index}-sort_order': 0,
+                f'questions-{index}-scale_min': 1,
+                f'questions-{index}-scale_max': 5,
+            })
+        return self.client.post(reverse('survey_create'), data)
+
+    def test_creates_survey_respondents_and_questions(self):
+        user_ids = [user.pk for user in self.users[:3]]
+        response = self.post_survey(user_ids + user_ids[:1])
+        survey = Survey.objects.get()
+        self.assertRedirects(response, reverse('survey_detail', args=[survey.pk]), fetch_redirect_response=False)
+        # Повторный участник отбрасывается
+        self.assertCountEqual(survey.respondents.values_list('user_id', flat=True), user_ids)
+        self.assertEqual(
+            list(survey.get_questions().values_list('text', 'sort_order')), [('Первый', 1), ('Второй', 2)]
+        )
+
+    def test_queries_independent_of_respondent_count(self):
+        with CaptureQueriesContext(connection) as few:
+            self.post_survey([user.pk for user in self.users[:2]])
+        with CaptureQueriesContext(connection) as many:
+            self.post_survey([user.pk for user in self.users])
+        self.assertEqual(len(few), len(many))
+
+    def test_invalid_respondent_rerenders_form(self):
+        response = self.post_survey([self.users[0].pk, 0])
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Survey.objects.exists())
+
+
+class RespondentChoiceLabelTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.users = [
+            User.objects.create_user(f'employee{n}', first_name='Сотрудник', last_name=f'Номер{n}')
+            for n in range(10)
+        ]
+        cls.survey = Survey.objects.create(
+            name='Опрос', start_date=date.today(), end_date=date.today(), created_by=cls.admin
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def render_formset(self):
+        formset = RespondentFormSet(instance=self.survey, prefix='respondents')
+        return ''.join(str(form['user']) for form in formset)
+
+    def test_formset_queries_independent_of_size(self):
+        Respondent.objects.bulk_create(Respondent(survey=self.survey, user=user) for user in self.users[:2])
+        with CaptureQueriesContext(connection) as few:
+            self.render_formset()
+        Respondent.objects.bulk_create(Respondent(survey=self.survey, user=user) for user in self.users[2:])
+        cache.clear()
+        with CaptureQueriesContext(connection) as many:
+            html = self.render_formset()
+        self.assertEqual(len(few), len(many))
+        self.assertIn('Сотрудник Номер9', html)
+
+    def test_labels_cached_until_user_changes(self):
+        user_ids = [user.pk for user in self.users]
+        get_user_labels(user_ids)
+        # Остаётся только запрос отметки справочника
+        with self.assertNumQueries(1):
+            labels = get_user_labels(user_ids)
+        self.assertEqual(labels[self.users[0].pk], self.users[0].get_display_name())
+
+        # Вход обновляет только last_login - кэш остаётся
+        user = self.users[0]
+        user.last_login = timezone.now()
+        user.save(update_fields=['last_login'])
+        with self.assertNumQueries(1):
+            get_user_labels(user_ids)
+
+        user.last_name = 'Переименован'
+        user.save()
+        self.assertEqual(get_user_labels([user.pk])[user.pk], user.get_display_name())
+
+    def test_rename_seen_without_cache_reset(self):
+        user = self.users[0]
+        get_user_labels([user.pk])
+        # UPDATE без сигналов и сброса кэша - как изменение в другом процессе со своим кэшем
+        User.objects.filter(pk=user.pk).update(last_name='Другой', updated_at=timezone.now())
+        user.refresh_from_db()
+        self.assertEqual(get_user_labels([user.pk])[user.pk], user.get_display_name())
+
+
+class SurveyListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.surveys = [
+            Survey.objects.create(
+                name=f'Опрос {n}', start_date=date.today(), end_date=date.today(), created_by=cls.admin
+            )
+            for n in range(23)
+        ]
+        # Одинаковое время создания у части опросов: порядок решает id
+        created_at = timezone.now() - timedelta(days=1)
+        Survey.objects.filter(pk__in=[survey.pk for survey in cls.surveys[5:15]]).update(created_at=created_at)
+        respondent = Respondent.objects.create(survey=cls.surveys[-1], user=cls.admin)
+        for n, status in enumerate(('completed', 'pending')):
+            Rater.objects.create(
+                respondent=respondent, user=User.objects.create_user(f'rater{n}'), status=status
+            )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def page(self, **params):
+        response = self.client.get(reverse('survey_list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_pages_cover_every_survey_once(self):
+        expected = list(Survey.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        pages, context = [], self.page()
+        while True:
+            pages.append([survey.pk for survey in context['surveys']])
+            if not context['next_cursor']:
+                break
+            context = self.page(after=context['next_cursor'])
+        self.assertEqual([pk for page in pages for pk in page], expected)
+        self.assertEqual([len(page) for page in pages], [10, 10, 3])
+
+        # Обратно по ссылке «Назад» - те же страницы
+        context = self.page(before=context['previous_cursor'])
+        self.assertEqual([survey.pk for survey in context['surveys']], pages[1])
+        context = self.page(before=context['previous_cursor'])
+        self.assertEqual([survey.pk for survey in context['surveys']], pages[0])
+        self.assertIsNone(context['previous_cursor'])
+
+    def test_queries_independent_of_page(self):
+        cursor = self.page(after=self.page()['next_cursor'])['next_cursor']
+        with CaptureQueriesContext(connection) as first:
+            self.page()
+        with CaptureQueriesContext(connection) as last:
+            self.assertEqual(len(self.page(after=cursor)['surveys']), 3)
+        self.assertEqual(len(first), len(last))
+
+    def test_row_counters_annotated(self):
+        # Неразборчивый курсор открывает первую страницу, последний опрос - первый в ней
+        survey = self.page(after='invalid')['surveys'][0]
+        self.assertEqual(survey.pk, self.surveys[-1].pk)
+        self.assertEqual((survey.respondent_count, survey.rater_count, survey.completed_count), (1, 2, 1))
+
+
+class UserSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.ivanov = User.objects.create_user(
+            'ivanov', first_name='Пётр', last_name='Иванов', department='Продажи'
+        )
+        cls.ivanova = User.objects.create_user(
+            'ivanova', first_name='Анна', last_name='Иванова', department='Маркетинг'
+        )
+        User.objects.create_user('sidorov', first_name='Иван', last_name='Сидоров', is_active=False)
+        User.objects.create_user('petrov', first_name='Олег', last_name='Петров')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def search(self, **params):
+        response = self.client.get(reverse('user_search'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def found(self, **params):
+        return [user['username'] for user in self.search(**params)['results']]
+
+    def test_prefix_in_any_case(self):
+        for query in ('иван', 'ИВАН', 'Иван'):
+            with self.subTest(query=query):
+                self.assertEqual(self.found(q=query), ['ivanov', 'ivanova'])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.found(q='иван марк'), ['ivanova'])
+        self.assertEqual(self.found(q='прод'), ['ivanov'])
+
+    def test_prefix_with_last_code_point(self):
+        User.objects.create_user('edge', last_name='Я\U0010FFFFz')
+        self.assertEqual(self.found(q='Я\U0010FFFF'), ['edge'])
+        self.assertEqual(self.found(q='\U0010FFFF'), [])
+        # Следующий символ после U+D7FF - U+E000, суррогаты пропускаются
+        self.assertEqual(self.found(q='\uD7FF'), [])
+
+    def test_exclude_survey_respondents(self):
+        survey = Survey.objects.create(
+            name='Опрос', start_date=date.today(), end_date=date.today(), created_by=self.admin
+        )
+        Respondent.objects.create(survey=survey, user=self.ivanov)
+        self.assertEqual(self.found(q='иван', exclude_survey=survey.pk), ['ivanova'])
+
+    def test_pages(self):
+        with mock.patch.object(UserSearchView, 'page_size', 1):
+            first = self.search(q='иван')
+            second = self.search(q='иван', page=2)
+        self.assertEqual([user['id'] for user in first['results']], [self.ivanov.pk])
+        self.assertTrue(first['has_more'])
+        self.assertEqual([user['id'] for user in second['results']], [self.ivanova.pk])
+        self.assertFalse(second['has_more'])
+
+    def test_requires_admin_access(self):
+        self.client.force_login(self.ivanov)
+        self.assertEqual(self.client.get(reverse('user_search'), {'q': 'иван'}).status_code, 403)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.template = SurveyTemplate.objects.create(name='Шаблон', created_by=cls.admin)
+        Question.objects.create(template=cls.template, text='Вопрос', answer_type='scale')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def assertRevalidates(self, url, change):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_template_list_etag_changes_with_templates(self):
+        def rename():
+            self.template.name = 'Новое название'
+            self.template.save()
+        self.assertRevalidates(reverse('template_list'), rename)
+
+    def test_template_questions_etag_changes_with_questions(self):
+        self.assertRevalidates(
+            reverse('get_template_questions', args=[self.template.pk]),
+            lambda: Question.objects.create(template=self.template, text='Ещё вопрос', answer_type='text')
+        )
+
+    def test_pending_message_bypasses_not_modified(self):
+        url = reverse('template_list')
+        etag = self.client.get(url)['ETag']
+        # Шаблон используется опросом - удаление вернёт на список с сообщением
+        Survey.objects.create(
+            name='Опрос', start_date=date.today(), end_date=date.today(),
+            created_by=self.admin, template_version=self.template.freeze()
+        )
+        response = self.client.post(reverse('template_delete', args=[self.template.pk]))
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertContains(response, 'Невозможно удалить шаблон')
+        # Сообщение показано один раз, дальше снова работает 304
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class TemplateQuestionsApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.template = SurveyTemplate.objects.create(name='Шаблон', created_by=cls.admin)
+        cls.questions = [
+            Question.objects.create(template=cls.template, text=f'Вопрос {n}', answer_type='text')
+            for n in range(3)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def post(self, payload):
+        return self.client.post(
+            reverse('template_questions', args=[self.template.pk]),
+            json.dumps(payload),
+            content_type='application/json'
+        )
+
+    def ordered_ids(self):
+        return list(self.template.template_questions.order_by('sort_order').values_list('pk', flat=True))
+
+    def test_reorder_writes_only_moved_questions(self):
+        first, second, third = (question.pk for question in self.questions)
+        version = SurveyTemplate.objects.get(pk=self.template.pk).version
+        response = self.post({'action': 'reorder', 'order': [first, third, second]})
+        self.assertEqual(response.json(), {'status': 'success', 'updated': 2})
+        self.assertEqual(self.ordered_ids(), [first, third, second])
+        self.assertEqual(SurveyTemplate.objects.get(pk=self.template.pk).version, version + 1)
+
+    def test_reorder_requires_every_question_once(self):
+        first, second, third = (question.pk for question in self.questions)
+        for order in ([first, second], [first, first, second, third], [first, second, third, 0]):
+            with self.subTest(order=order):
+                self.assertEqual(self.post({'action': 'reorder', 'order': order}).status_code, 400)
+
+    def test_add_at_position_shifts_following(self):
+        response = self.post({
+            'action': 'add', 'position': 2, 'question': {'text': 'Новый', 'answer_type': 'scale'}
+        })
+        self.assertEqual(response.status_code, 200)
+        added = response.json()['question']['id']
+        first, second, third = (question.pk for question in self.questions)
+        self.assertEqual(self.ordered_ids(), [first, added, second, third])
+
+    def test_edit_changes_only_given_fields(self):
+        question = self.questions[0]
+        response = self.post({'action': 'edit', 'id': question.pk, 'question': {'is_required': False}})
+        self.assertEqual(response.status_code, 200)
+        question.refresh_from_db()
+        self.assertEqual((question.text, question.is_required), ('Вопрос 0', False))
+
+    def test_delete_leaves_gap(self):
+        self.assertEqual(self.post({'action': 'delete', 'id': self.questions[1].pk}).status_code, 200)
+        self.assertEqual(
+            list(self.template.template_questions.values_list('sort_order', flat=True)), [1, 3]
+        )
+
+    def test_invalid_requests(self):
+        other = SurveyTemplate.objects.create(name='Другой', created_by=self.admin)
+        foreign = Question.objects.create(template=other, text='Чужой', answer_type='text')
+        self.assertEqual(self.post({'action': 'delete', 'id': foreign.pk}).status_code, 404)
+        self.assertEqual(self.post({'action': 'rename'}).status_code, 400)
+        self.assertEqual(self.post({'order': []}).status_code, 400)
+
+
+class TemplateVersionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.template = SurveyTemplate.objects.create(name='Шаблон', created_by=cls.admin)
+        cls.question = Question.objects.create(template=cls.template, text='Вопрос', answer_type='scale')
+
+    def create_survey(self, version):
+        return Survey.objects.create(
+            name='Опрос', start_date=date.today(), end_date=date.today(),
+            created_by=self.admin, template_version=version
+        )
+
+    def test_unchanged_template_reuses_version(self):
+        version = self.template.freeze()
+        template = SurveyTemplate.objects.get(pk=self.template.pk)
+        self.assertEqual(template.freeze(), version)
+        self.assertEqual(Question.objects.filter(template_version__isnull=False).count(), 1)
+
+    def test_surveys_keep_their_version_after_edit(self):
+        survey = self.create_survey(self.template.freeze())
+        self.question.text = 'Новый текст'
+        self.question.save()
+
+        template = SurveyTemplate.objects.get(pk=self.template.pk)
+        self.assertIsNone(template.current_version_id)
+        new_version = template.freeze()
+        self.assertEqual(new_version.number, 2)
+        self.assertEqual([question.text for question in survey.get_questions()], ['Вопрос'])
+        self.assertEqual([question.text for question in new_version.questions.all()], ['Новый текст'])
+
+    def test_matches_compares_all_snapshot_fields(self):
+        version = self.template.freeze()
+        # Как из формы опроса: границы шкалы не переданы, обязательность по умолчанию
+        self.assertTrue(version.matches([Question(text=' Вопрос ', answer_type='scale', scale_min=None)]))
+        for changed in (
+            {'text': 'Другой вопрос'},
+            {'answer_type': 'text'},
+            {'is_required': False},
+            {'scale_choices': [['1', 'Никогда']]},
+            {'scale_max': 10},
+        ):
+            with self.subTest(**changed):
+                question = self.question.clone(**changed)
+                self.assertFalse(version.matches([question]))
+        self.assertFalse(version.matches([self.question.clone(), self.question.clone()]))
+
+    def test_customize_copies_questions_into_survey(self):
+        version = self.template.freeze()
+        survey = self.create_survey(version)
+        survey.customize_questions()
+
+        self.assertIsNone(Survey.objects.get(pk=survey.pk).template_version_id)
+        questions = list(survey.get_questions())
+        self.assertEqual([(question.survey_id, question.text) for question in questions], [(survey.pk, 'Вопрос')])
+        # Версия шаблона остаётся для других опросов
+        self.assertEqual(version.questions.count(), 1)
+
+
+class SortOrderAllocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.template = SurveyTemplate.objects.create(name='Шаблон', created_by=cls.admin)
+        cls.survey = Survey.objects.create(
+            name='Опрос', start_date=date.today(), end_date=date.today(), created_by=cls.admin
+        )
+
+    def test_new_questions_numbered_in_order(self):
+        questions = [
+            Question.objects.create(template=self.template, text=f'Вопрос {n}', answer_type='text')
+            for n in range(3)
+        ]
+        self.assertEqual([question.sort_order for question in questions], [1, 2, 3])
+
+    def test_blocks_do_not_overlap(self):
+        self.assertEqual(list(allocate_sort_orders(3, template_id=self.template.pk)), [1, 2, 3])
+        self.assertEqual(list(allocate_sort_orders(2, template_id=self.template.pk)), [4, 5])
+        # Счётчик у каждого владельца свой
+        self.assertEqual(list(allocate_sort_orders(2, survey_id=self.survey.pk)), [1, 2])
+
+    def test_orders_written_past_counter_respected(self):
+        question = Question.objects.create(template=self.template, text='Вопрос', answer_type='text')
+        Question.objects.filter(pk=question.pk).update(sort_order=10)
+        self.assertEqual(list(allocate_sort_orders(2, template_id=self.template.pk)), [11, 12])
+
+    def test_empty_block(self):
+        self.assertEqual(list(allocate_sort_orders(0, template_id=self.template.pk)), [])
+
+
+class TemplateCatalogueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.template = SurveyTemplate.objects.create(name='Шаблон', created_by=cls.admin)
+        for n in range(3):
+            Question.objects.create(template=cls.template, text=f'Вопрос {n}', answer_type='text')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_question_count_annotated(self):
+        stamp = catalogue_stamp()
+        with self.assertNumQueries(1):
+            html = render_template_catalogue(can_manage=True, stamp=stamp)
+        self.assertIn('Вопросов: 3', html)
+        self.assertIn(reverse('template_edit', args=[self.template.pk]), html)
+        self.assertNotIn(reverse('template_edit', args=[self.template.pk]), render_template_catalogue(can_manage=False))
+
+    def test_cached_until_questions_change(self):
+        render_template_catalogue(can_manage=True)
+        # Из кэша - только запрос отметки
+        with self.assertNumQueries(1):
+            render_template_catalogue(can_manage=True)
+
+        # Кэш не сбрасывается (как в другом процессе с locmem) - новая отметка дает новый ключ
+        Question.objects.create(template=self.template, text='Ещё вопрос', answer_type='text')
+        self.assertIn('Вопросов: 4', render_template_catalogue(can_manage=True))
+
+    def test_deleted_template_leaves_catalogue(self):
+        other = SurveyTemplate.objects.create(name='Другой шаблон', created_by=self.admin)
+        self.assertIn('Другой шаблон', render_template_catalogue(can_manage=True))
+        other.delete()
+        self.assertNotIn('Другой шаблон', render_template_catalogue(can_manage=True))
+
+
+class TemplateAdminActionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.template = SurveyTemplate.objects.create(name='Шаблон', created_by=cls.admin)
+
+    def test_deactivate_invalidates_catalogue_and_etag(self):
+        self.client.force_login(self.admin)
+        url = reverse('template_list')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertContains(response, 'Статус: Активен')
+
+        response = self.client.post(reverse('admin:feedback360_surveytemplate_changelist'), {
+            'action': 'deactivate_templates',
+            '_selected_action': [self.template.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Статус: Неактивен')
+
+
+class PublicPageCacheTests(SurveyDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_rater_form_cached_per_browser(self):
+        url = reverse('rater_form', args=[make_rater_token(self.rater, self.survey)])
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('Cookie', first['Vary'])
+        # Из кэша - только запрос отметки
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).content, first.content)
+
+    def test_rater_form_changes_seen_without_cache_reset(self):
+        url = reverse('rater_form', args=[make_rater_token(self.rater, self.survey)])
+        self.client.get(url)
+        # Сигналы другого процесса сюда не дошли бы: меняем данные, минуя их
+        Question.objects.filter(pk=self.scale_question.pk).update(text='Новая формулировка')
+        Survey.bump_version(self.survey.pk)
+        self.assertContains(self.client.get(url), 'Новая формулировка')
+
+    def test_rater_form_with_answers_not_cached(self):
+        Rater.objects.filter(pk=self.rater.pk).update(status='started')
+        url = reverse('rater_form', args=[make_rater_token(self.rater, self.survey)])
+        self.client.get(url)
+        # Версия опроса не меняется - изменение видно, только если форма строится заново
+        Question.objects.filter(pk=self.scale_question.pk).update(text='Новая формулировка')
+        self.assertContains(self.client.get(url), 'Новая формулировка')
+
+    def test_login_page_not_cached(self):
+        response = self.client.get(reverse('login'))
+        self.assertIn('no-cache', response['Cache-Control'])
+
+
+class NavigationCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password', first_name='Иван')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_changes_seen_without_cache_reset(self):
+        url = reverse('profile')
+        templates_link = f'href="{reverse("template_list")}"'
+        response = self.client.get(url)
+        self.assertContains(response, templates_link)
+        self.assertContains(response, 'Иван')
+
+        # UPDATE в обход сигналов - как изменение, сделанное другим процессом
+        User.objects.filter(pk=self.user.pk).update(first_name='Пётр', is_superuser=False)
+        response = self.client.get(url)
+        self.assertContains(response, 'Пётр')
+        self.assertNotContains(response, templates_link)
+
+    def test_role_change_seen_without_cache_reset(self):
+        key_before = self.client.get(reverse('profile')).wsgi_request.user.role_version
+        UserRole.objects.create(user=self.user, role=Role.objects.create(name='Руководитель'))
+        self.assertNotEqual(User.objects.get(pk=self.user.pk).role_version, key_before)
+
+
+class SurveyProgressStreamTests(TransactionTestCase):
+    # Поток сам освобождает соединение с БД - без общей транзакции TestCase
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.rater_user = User.objects.create_user('rater', 'rater@example.com', 'password')
+        # Приглашения уже разосланы - сохранение не ставит рассылку в очередь
+        self.survey = Survey.objects.create(
+            name='Опрос', start_date=date.today(), end_date=date.today(), created_by=self.admin,
+            status='active', invitations_enqueued_at=timezone.now()
+        )
+        self.respondent = Respondent.objects.create(survey=self.survey, user=self.admin)
+        self.rater = Rater.objects.create(respondent=self.respondent, user=self.rater_user, relationship_type='peer')
+
+    async def get(self, user, survey_id):
+        await self.async_client.aforce_login(user)
+        return await self.async_client.get(reverse('survey_progress', args=[survey_id]))
+
+    @staticmethod
+    def parse_event(chunk):
+        event, data = chunk.decode().strip().split('\n')
+        return event.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+
+    async def test_snapshot_then_progress_events(self):
+        response = await self.get(self.admin, self.survey.pk)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        try:
+            event, data = self.parse_event(await anext(events))
+            self.assertEqual(event, 'snapshot')
+            self.assertEqual(data['respondents'][0]['progress'], {'peer': {'total': 1, 'completed': 0}})
+
+            await Rater.objects.filter(pk=self.rater.pk).aupdate(status='completed')
+            await sync_to_async(publish_progress)(self.survey.pk, [self.respondent.pk])
+            event, data = self.parse_event(await anext(events))
+            self.assertEqual(event, 'progress')
+            self.assertEqual(data['respondents'], [
+                {'id': self.respondent.pk, 'progress': {'peer': {'total': 1, 'completed': 1}}}
+            ])
+        finally:
+            await events.aclose()
+
+    async def test_access_checks(self):
+        self.assertEqual((await self.get(self.rater_user, self.survey.pk)).status_code, 403)
+        self.assertEqual((await self.get(self.admin, self.survey.pk + 1)).status_code, 404)
+
+    def test_survey_page_subscribes_to_stream(self):
+        url = reverse('survey_detail', args=[self.survey.pk])
+        self.client.force_login(self.admin)
+        response = self.client.get(url)
+        self.assertContains(response, 'id="survey-progress"')
+        self.assertContains(response, f'data-stream-url="{reverse("survey_progress", args=[self.survey.pk])}"')
+
+        # Без прав поток отвечает 403 - карточка прогресса не выводится
+        self.client.force_login(self.rater_user)
+        response = self.client.get(url)
+        self.assertContains(response, self.survey.name)
+        self.assertNotContains(response, 'id="survey-progress"')
+
+
+class RaterTokenTests(SurveyDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def rater_form(self, token):
+        return self.client.get(reverse('rater_form', args=[token]))
+
+    def test_valid_token_opens_form_without_login(self):
+        response = self.rater_form(make_rater_token(self.rater, self.survey))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.scale_question.text)
+
+    def test_tampered_token_rejected(self):
+        token = make_rater_token(self.rater, self.survey)
+        self.assertEqual(self.rater_form(token[:-2] + 'xx').status_code, 404)
+        self.assertEqual(self.rater_form('garbage').status_code, 404)
+
+    def test_expired_token_rejected(self):
+        ended = Survey(pk=self.survey.pk, end_date=date.today() - timedelta(days=2))
+        self.assertEqual(self.rater_form(make_rater_token(self.rater, ended)).status_code, 404)
+
+    def test_token_for_other_survey_rejected(self):
+        other = Survey(pk=self.survey.pk + 1, end_date=self.survey.end_date)
+        self.assertEqual(self.rater_form(make_rater_token(self.rater, other)).status_code, 404)
+
+    def test_form_prefilled_with_saved_answers(self):
+        token = make_rater_token(self.rater, self.survey)
+        with CaptureQueriesContext(connection) as empty:
+            self.assertNotContains(self.rater_form(token), ' checked>')
+
+        payload = {'answers': [
+            {'question': self.scale_question.pk, 'value': 4},
+            {'question': self.text_question.pk, 'text': 'Черновик <ответа>'},
+        ]}
+        url = reverse('rater_token_answers', args=[token])
+        self.client.post(url, json.dumps(payload), content_type='application/json')
+
+        with CaptureQueriesContext(connection) as draft:
+            response = self.rater_form(token)
+        self.assertContains(response, 'value="4" checked>', count=1)
+        self.assertContains(response, '>Черновик &lt;ответа&gt;</textarea>')
+        # Ответы приходят вместе с вопросами, без отдельного запроса
+        self.assertEqual(len(draft), len(empty))
+
+    def test_answers_saved_by_token(self):
+        url = reverse('rater_token_answers', args=[make_rater_token(self.rater, self.survey)])
+        payload = {'answers': [{'question': self.scale_question.pk, 'value': 4}]}
+        response = self.client.post(url, json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Response.objects.get().rater, self.rater)
+
+
+@override_settings(PROFILING_SAMPLE_RATE=1)
+class ProfilingMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def test_server_timing_and_log(self):
+        self.client.force_login(self.admin)
+        with self.assertLogs('feedback360.profiling', 'INFO') as logs:
+            response = self.client.get(reverse('template_list'))
+        self.assertEqual(response.status_code, 200)
+        timings = dict(part.strip().split(';', 1)[0:2] for part in response['Server-Timing'].split(','))
+        self.assertEqual(timings.keys(), {'db', 'view', 'render', 'total'})
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['view'], record['status']), ('template_list', 200))
+        self.assertIn(f'SQL x{record["sql_count"]}', timings['db'])
+        self.assertGreater(record['sql_count'], 0)
+
+    @override_settings(PROFILING_SAMPLE_RATE=0)
+    def test_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('login')))
+
+
+@mock.patch('feedback360.routers.get_replica_alias', return_value='replica')
+class ReplicaRouterTests(SimpleTestCase):
+    router = ReplicaRouter()
+
+    def test_reads_routed_only_inside_block(self, alias):
+        self.assertIsNone(self.router.db_for_read(Survey))
+        with read_from_replica():
+            self.assertEqual(self.router.db_for_read(Survey), 'replica')
+        self.assertIsNone(self.router.db_for_read(Survey))
+
+    def test_reads_return_to_primary_after_write(self, alias):
+        with read_from_replica():
+            self.assertEqual(self.router.db_for_write(Survey), DEFAULT_DB_ALIAS)
+            self.assertIsNone(self.router.db_for_read(Survey))
+        with read_from_replica():
+            self.assertEqual(self.router.db_for_read(Survey), 'replica')
+
+    def test_reads_stay_on_primary_inside_transaction(self, alias):
+        with read_from_replica(), mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', True):
+            self.assertIsNone(self.router.db_for_read(Survey))
+
+    def test_no_replica_configured(self, alias):
+        alias.return_value = None
+        with read_from_replica():
+            self.assertIsNone(self.router.db_for_read(Survey))
+
+    def test_replica_not_migrated(self, alias):
+        self.assertFalse(self.router.allow_migrate('replica', 'feedback360'))
+        self.assertTrue(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'feedback360'))
+
+
+class InvitationEnqueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        # Задачи Celery подменяются модулем, который запоминает постановку в очередь
+        self.enqueued = []
+        tasks = types.ModuleType('feedback360.tasks')
+        tasks.send_survey_emails = types.SimpleNamespace(delay=self.enqueued.append)
+        patcher = mock.patch.dict(sys.modules, {'feedback360.tasks': tasks})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tasks = tasks
+
+    def create_survey(self, **fields):
+        fields = {
+            'name': 'Опрос', 'start_date': date.today(), 'end_date': date.today(),
+            'created_by': self.admin, **fields
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            return Survey.objects.create(**fields)
+
+    def save(self, survey, **fields):
+        for name, value in fields.items():
+            setattr(survey, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            survey.save()
+
+    def test_enqueued_once_on_draft_to_active(self):
+        survey = self.create_survey()
+        self.save(Survey.objects.get(pk=survey.pk), name='Черновик')
+        self.assertEqual(self.enqueued, [])
+
+        survey = Survey.objects.get(pk=survey.pk)
+        self.save(survey, status='active')
+        self.assertEqual(self.enqueued, [survey.pk])
+        self.assertIsNotNone(Survey.objects.get(pk=survey.pk).invitations_enqueued_at)
+
+        # Правки активного опроса рассылку не повторяют
+        self.save(survey, description='Правка')
+        self.save(Survey.objects.get(pk=survey.pk), name='Ещё правка')
+        self.assertEqual(self.enqueued, [survey.pk])
+
+    def test_concurrent_activation_enqueued_once(self):
+        survey = self.create_survey()
+        first, second = Survey.objects.get(pk=survey.pk), Survey.objects.get(pk=survey.pk)
+        self.save(first, status='active')
+        self.save(second, status='active')
+        self.assertEqual(self.enqueued, [survey.pk])
+
+    def test_rolled_back_activation_not_enqueued(self):
+        survey = Survey.objects.get(pk=self.create_survey().pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                survey.status = 'active'
+                survey.save()
+                raise RuntimeError
+        self.assertEqual(self.enqueued, [])
+
+    def test_created_active_enqueued(self):
+        survey = self.create_survey(status='active')
+        self.assertEqual(self.enqueued, [survey.pk])
+        self.create_survey(status='active', invitations_enqueued_at=timezone.now())
+        self.assertEqual(self.enqueued, [survey.pk])
+
+    def test_reactivation_after_draft_enqueued_again(self):
+        survey = self.create_survey(status='active')
+        survey = Survey.objects.get(pk=survey.pk)
+        self.save(survey, status='draft')
+        self.save(survey, status='active')
+        self.assertEqual(self.enqueued, [survey.pk, survey.pk])
+
+    def test_queue_failure_releases_claim(self):
+        self.tasks.send_survey_emails = types.SimpleNamespace(delay=mock.Mock(side_effect=ConnectionError))
+        with self.assertLogs('feedback360.mailing', 'ERROR'):
+            survey = self.create_survey(status='active')
+        self.assertIsNone(Survey.objects.get(pk=survey.pk).invitations_enqueued_at)
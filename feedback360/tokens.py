@@ -0,0 +1,44 @@
+import time
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+
+RATER_TOKEN_SALT = 'feedback360.rater-access'
+
+
+def get_token_expiry(survey):
+    """Ссылка действует до конца дня окончания опроса (UTC)"""
+    expires = datetime.combine(survey.end_date + timedelta(days=1), dt_time.min, tzinfo=dt_timezone.utc)
+    return int(expires.timestamp())
+
+
+def make_rater_token(rater, survey):
+    """Подписанный токен доступа оценивающего: id оценивающего, опроса и срок действия"""
+    return signing.dumps(
+        {'r': rater.pk, 's': survey.pk, 'e': get_token_expiry(survey)},
+        salt=RATER_TOKEN_SALT,
+        compress=True
+    )
+
+
+def read_rater_token(token):
+    """Проверяет подпись и срок действия без обращения к БД.
+
+    Возвращает (rater_id, survey_id); при ошибке выбрасывает
+    signing.BadSignature (или её подкласс SignatureExpired).
+    """
+    data = signing.loads(token, salt=RATER_TOKEN_SALT)
+    try:
+        rater_id, survey_id, expires = int(data['r']), int(data['s']), int(data['e'])
+    except (KeyError, TypeError, ValueError):
+        raise signing.BadSignature('Некорректное содержимое токена')
+    if time.time() > expires:
+        raise signing.SignatureExpired('Срок действия ссылки истёк')
+    return rater_id, survey_id
+
+
+def build_rater_access_url(rater, survey):
+    path = reverse('rater_form', kwargs={'token': make_rater_token(rater, survey)})
+    return f"{settings.SITE_URL.rstrip('/')}{path}"
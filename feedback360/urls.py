@@ -13,6 +13,8 @@ urlpatterns = [
     path('template/create/', views.TemplateCreateView.as_view(), name='template_create'),
     path('surveys/create/', views.SurveyCreateView.as_view(), name='survey_create'),
     path('surveys/<int:pk>/', views.SurveyDetailView.as_view(), name='survey_detail'),
+    path('surveys/<int:pk>/scores/', views.SurveyScoresView.as_view(), name='survey_scores'),
+    path('surveys/<int:pk>/progress/', views.SurveyProgressStreamView.as_view(), name='survey_progress'),
     path('surveys/<int:pk>/add-question/', views.QuestionCreateView.as_view(), name='add_question'),
     path('leader/survey/create/', views.LeaderSurveyCreateView.as_view(), name='leader_survey_create'),
     path('leader/survey/<int:pk>/edit/', views.LeaderSurveyUpdateView.as_view(), name='leader_survey_edit'),
@@ -20,8 +22,14 @@ urlpatterns = [
     path('templates/', views.TemplateListView.as_view(), name='template_list'),
     path('templates/<int:pk>/edit/', views.TemplateUpdateView.as_view(), name='template_edit'),
     path('template/<int:pk>/delete/', views.TemplateDeleteView.as_view(), name='template_delete'),
+    path('templates/<int:pk>/questions/', views.TemplateQuestionsView.as_view(), name='template_questions'),
     path('templates/<int:template_pk>/questions/<int:question_pk>/delete/', views.QuestionDeleteView.as_view(), name='template_question_delete'),
     path('surveys/get-template-questions/<int:template_id>/', views.get_template_questions, name='get_template_questions'),
+    path('users/search/', views.UserSearchView.as_view(), name='user_search'),
+    path('reports/<int:pk>/', views.ReportDetailView.as_view(), name='report'),
+    path('raters/<int:pk>/answers/', views.RaterAnswersView.as_view(), name='rater_answers'),
+    path('rate/<str:token>/', views.RaterFormView.as_view(), name='rater_form'),
+    path('rate/<str:token>/answers/', views.RaterTokenAnswersView.as_view(), name='rater_token_answers'),
 
 ]
 
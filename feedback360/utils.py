@@ -1,59 +1,114 @@
-from django.core.mail import send_mail
+import re
+
+from django.core.mail import send_mail, EmailMultiAlternatives
+from django.utils.html import conditional_escape
 from django.template.loader import render_to_string
 from django.conf import settings
-from .models import Survey, Question
+from .models import Survey
 
 
 def copy_questions_from_template(survey):
+    """Привязывает опрос к замороженной версии шаблона вместо копирования вопросов"""
     template = survey.template
     if not template:
         return
 
-    # Создаем независимые копии вопросов
-    for template_question in template.template_questions.all():
-        Question.objects.create(
-            survey=survey,
-            text=template_question.text,
-            answer_type=template_question.answer_type,
-            scale_min=template_question.scale_min,
-            scale_max=template_question.scale_max,
-            sort_order=template_question.sort_order
-        )
+    survey.template_version = template.freeze()
+    Survey.objects.filter(pk=survey.pk).update(template_version=survey.template_version)
 
 
-def send_survey_invitation(survey, user):
-    subject = f'Приглашение к участию в опросе: {survey.name}'
-    message = render_to_string('feedback360/email/survey_invitation.html', {
-        'user': user,
-        'survey': survey,
-        'start_date': survey.start_date,
-        'end_date': survey.end_date
-    })
-    send_mail(
-        subject,
-        message,
-        settings.DEFAULT_FROM_EMAIL,
-        [user.email],
-        fail_silently=False,
-        html_message=message
-    )
+RECIPIENT_MARKER = '\x1f'
+RECIPIENT_FIELD_RE = re.compile(f'{RECIPIENT_MARKER}([\\w.]+){RECIPIENT_MARKER}')
 
 
-def copy_template_to_survey(survey):
-    if not survey.template:
-        return
+def _recipient_marker(path):
+    return f'{RECIPIENT_MARKER}{path}{RECIPIENT_MARKER}'
+
+
+class _RecipientPlaceholder:
+    """Подставляется вместо получателя при предварительном рендеринге письма"""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return _recipient_marker(f'{self._name}.{name}')
 
-    # Копируем вопросы напрямую без компетенций
-    for question in survey.template.template_questions.all():
-        Question.objects.create(
-            text=question.text,
-            survey=survey,
-            answer_type=question.answer_type,
-            scale_min=question.scale_min,
-            scale_max=question.scale_max,
-            is_required=question.is_required,
-            sort_order=question.sort_order
+
+class InvitationRenderer:
+    """Рендерит приглашение опроса один раз и подставляет только данные получателя.
+
+    Шаблоны рендерятся с заглушками вместо пользователя и его ссылки доступа;
+    каждое обращение {{ user.<поле> }} или {{ access_url }} превращается в
+    маркер, который при отправке заменяется значением конкретного получателя.
+    Фильтры, применённые к этим переменным, при этом не поддерживаются.
+    """
+    html_template_name = 'feedback360/email/survey_invitation.html'
+    text_template_name = 'feedback360/email/survey_invitation.txt'
+
+    def __init__(self, survey):
+        self.survey = survey
+        self.subject = f'Приглашение к участию в опросе: {survey.name}'
+        context = {
+            'user': _RecipientPlaceholder('user'),
+            'access_url': _recipient_marker('access_url'),
+            'survey': survey,
+            'start_date': survey.start_date,
+            'end_date': survey.end_date
+        }
+        self._html = RECIPIENT_FIELD_RE.split(render_to_string(self.html_template_name, context))
+        self._text = RECIPIENT_FIELD_RE.split(render_to_string(self.text_template_name, context))
+
+    @staticmethod
+    def _fill(parts, values, html):
+        # Чётные элементы - готовый текст, нечётные - пути к данным получателя
+        chunks = []
+        for index, part in enumerate(parts):
+            if index % 2 == 0:
+                chunks.append(part)
+                continue
+            name, *attrs = part.split('.')
+            value = values.get(name, '')
+            for attr in attrs:
+                value = getattr(value, attr, '')
+                if callable(value):
+                    value = value()
+            if value is None:
+                value = ''
+            chunks.append(conditional_escape(value) if html else str(value))
+        return ''.join(chunks)
+
+    def render(self, user, access_url=''):
+        """Возвращает (текст, html) письма для получателя"""
+        values = {'user': user, 'access_url': access_url}
+        return self._fill(self._text, values, html=False), self._fill(self._html, values, html=True)
+
+    def build_message(self, user, connection=None, access_url=''):
+        text, html = self.render(user, access_url)
+        email = EmailMultiAlternatives(
+            self.subject,
+            text,
+            settings.DEFAULT_FROM_EMAIL,
+            [user.email],
+            connection=connection
         )
+        email.attach_alternative(html, 'text/html')
+        return email
+
+
+def build_survey_invitation(survey, user, connection=None, access_url=''):
+    return InvitationRenderer(survey).build_message(user, connection, access_url)
+
+
+def send_survey_invitation(survey, user, access_url=''):
+    build_survey_invitation(survey, user, access_url=access_url).send(fail_silently=False)
+
+
+def copy_template_to_survey(survey):
+    # Вопросы больше не копируются - опрос ссылается на версию шаблона
+    copy_questions_from_template(survey)
 
 
 def send_access_notification(admin, requester):
@@ -1,5 +1,13 @@
-from django.db import transaction
-from django.db.models import ProtectedError
+import asyncio
+import json
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import sync_to_async
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, FilteredRelation, OuterRef, ProtectedError, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.views.generic import (
     ListView, DetailView, CreateView,
     UpdateView, TemplateView, DeleteView
@@ -8,14 +16,27 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.contrib import messages
 from django.utils import timezone
-from .models import Survey, Respondent, Question, User, Rater, SurveyTemplate
-from .forms import SurveyForm, QuestionForm, QuestionFormSet, RespondentFormSet, SurveyTemplateForm
+from .models import Survey, Respondent, Question, Rater, SurveyTemplate, Response, Report, allocate_sort_orders
+from .forms import SurveyForm, QuestionForm, QuestionFormSet, RespondentFormSet, SurveyTemplateForm, TemplateQuestionForm
 from django.contrib.auth.decorators import login_required
-from .mixins import LeaderRequiredMixin, AdminRequiredMixin, user_has_admin_access
+from .caching import cache_public_page, get_cache_version
+from .catalogue import catalogue_stamp, render_template_catalogue
+from .mixins import (
+    LeaderRequiredMixin, AdminRequiredMixin, ConditionalGetMixin, KeysetPaginationMixin, ReplicaReadMixin,
+    user_has_admin_access
+)
+from .progress import (
+    PROGRESS_KEEPALIVE, broker, format_event, progress_namespace, publish_progress_on_commit, survey_progress
+)
+from .scores import apply_score_changes, survey_scores
+from .search import search_users, user_label
+from .tokens import read_rater_token
 from .utils import copy_questions_from_template
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.urls import reverse_lazy
 from django.views import View
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.contrib.auth.mixins import LoginRequiredMixin
 
 
@@ -24,6 +45,10 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 import logging
 logger = logging.getLogger(__name__)
 
+# Точность хранения ответа по шкале (Response.answer_value)
+ANSWER_DECIMAL_PLACES = Response._meta.get_field('answer_value').decimal_places
+ANSWER_VALUE_STEP = Decimal(1).scaleb(-ANSWER_DECIMAL_PLACES)
+
 
 @login_required
 def profile(request):
@@ -46,60 +71,67 @@ class SurveyCreateView(LeaderRequiredMixin, CreateView):
     form_class = SurveyForm
     template_name = 'feedback360/survey_create.html'
 
+    def get_formsets(self):
+        """Формсеты строятся и валидируются один раз за запрос"""
+        if not hasattr(self, '_formsets'):
+            data = self.request.POST if self.request.method == 'POST' else None
+            self._formsets = (
+                RespondentFormSet(
+                    data,
+                    prefix='respondents',
+                    queryset=Respondent.objects.none()
+                ),
+                QuestionFormSet(
+                    data,
+                    prefix='questions',
+                    queryset=Question.objects.none()
+                ),
+            )
+        return self._formsets
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['available_templates'] = SurveyTemplate.objects.filter(is_active=True)
         context['is_admin'] = user_has_admin_access(self.request.user)
-
-        if self.request.POST:
-            context['respondents_formset'] = RespondentFormSet(
-                self.request.POST,
-                prefix='respondents'
-            )
-            context['questions_formset'] = QuestionFormSet(
-                self.request.POST,
-                prefix='questions',
-                queryset=Question.objects.none()
-            )
-        else:
-            context['respondents_formset'] = RespondentFormSet(
-                prefix='respondents',
-                queryset=Respondent.objects.none()
-            )
-            context['questions_formset'] = QuestionFormSet(
-                prefix='questions',
-                queryset=Question.objects.none()
-            )
-
+        context['respondents_formset'], context['questions_formset'] = self.get_formsets()
         return context
 
     def form_valid(self, form):
-        survey = form.save(commit=False)
-        survey.created_by = self.request.user
-        survey.save()
-
-        # Обработка участников
-        respondents_formset = self.get_context_data()['respondents_formset']
-        if respondents_formset.is_valid():
-            respondents = respondents_formset.save(commit=False)
-            for respondent in respondents:
-                respondent.survey = survey
-                respondent.save()
-
-        # Обработка вопросов
-        questions_formset = self.get_context_data()['questions_formset']
-        if questions_formset.is_valid():
+        respondents_formset, questions_formset = self.get_formsets()
+        if not (respondents_formset.is_valid() and questions_formset.is_valid()):
+            return self.form_invalid(form)
+
+        with transaction.atomic():
+            survey = form.save(commit=False)
+            survey.created_by = self.request.user
+
+            # Опрос ссылается на версию шаблона; вопросы копируются в опрос,
+            # только если пользователь изменил набор вопросов шаблона
             questions = questions_formset.save(commit=False)
-            for idx, question in enumerate(questions, start=1):
+            if survey.template:
+                version = survey.template.freeze()
+                if not questions or version.matches(questions):
+                    survey.template_version = version
+                    questions = []
+            survey.save()
+            self.object = survey
+
+            # Обработка участников: один INSERT на всех, дубликаты отбрасываем
+            respondents_formset.instance = survey
+            respondents = {}
+            for respondent in respondents_formset.save(commit=False):
+                respondents.setdefault(respondent.user_id, respondent)
+            Respondent.objects.bulk_create(respondents.values())
+
+            # Обработка вопросов: номера резервируются одним блоком на всю вставку
+            sort_orders = allocate_sort_orders(len(questions), survey_id=survey.pk)
+            for question, sort_order in zip(questions, sort_orders):
                 question.survey = survey
-                question.sort_order = idx
-                question.save()
-
-        # Копирование из шаблона (если выбран)
-        if survey.template:
-            Question.copy_from_template(survey.template, survey)
+                question.template = None
+                question.sort_order = sort_order
+            Question.objects.bulk_create(questions)
 
-        return super().form_valid(form)
+        return redirect(self.get_success_url())
 
     def get_success_url(self):
         return reverse('survey_detail', kwargs={'pk': self.object.pk})
@@ -111,36 +143,73 @@ class SurveyCreateView(LeaderRequiredMixin, CreateView):
 
 
 
-class SurveyListView(LoginRequiredMixin, ListView):
+class SurveyListView(ReplicaReadMixin, LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Survey
     template_name = 'feedback360/survey_list.html'
     context_object_name = 'surveys'
-    paginate_by = 10
 
     def get_queryset(self):
         user = self.request.user
-        if user_has_admin_access(user):
-            return Survey.objects.all().order_by('-created_at')
-        return Survey.objects.none()
+        if not user_has_admin_access(user):
+            return Survey.objects.none()
+        return self.with_stats(Survey.objects.all())
+
+    @staticmethod
+    def with_stats(queryset):
+        """Всё, что выводит строка таблицы, считается в том же SQL-запросе.
+
+        Счётчики - коррелированные подзапросы, а не JOIN с GROUP BY: так БД
+        идёт по индексу сортировки и считает их только для строк страницы,
+        читая индексы участников и оценивающих без обращения к таблицам.
+        """
+        latest_report = Report.objects.filter(survey=OuterRef('pk')).order_by('-generated_at', '-pk')
+        respondents = Respondent.objects.filter(survey=OuterRef('pk')).order_by().values('survey')
+        raters = Rater.objects.filter(respondent__survey=OuterRef('pk')).order_by().values('respondent__survey')
+        return queryset.annotate(
+            latest_report_id=Subquery(latest_report.values('pk')[:1]),
+            respondent_count=Coalesce(Subquery(respondents.annotate(n=Count('pk')).values('n')), 0),
+            rater_count=Coalesce(Subquery(raters.annotate(n=Count('pk')).values('n')), 0),
+            completed_count=Coalesce(
+                Subquery(raters.filter(status='completed').annotate(n=Count('pk')).values('n')), 0
+            ),
+        )
 
     def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+        page = self.paginate_by_cursor(self.object_list)
+        kwargs[self.context_object_name] = page['object_list']
+        context = super().get_context_data(object_list=page['object_list'], **kwargs)
+        context['next_cursor'] = page['next_cursor']
+        context['previous_cursor'] = page['previous_cursor']
         context['is_admin'] = user_has_admin_access(self.request.user)
         return context
 
 
-class SurveyDetailView(LoginRequiredMixin, DetailView):
+class SurveyDetailView(LoginRequiredMixin, ConditionalGetMixin, DetailView):
     model = Survey
     template_name = 'feedback360/survey_detail.html'
     context_object_name = 'survey'
 
+    def get_stamp(self):
+        if not hasattr(self, '_stamp'):
+            self._stamp = Survey.objects.filter(pk=self.kwargs['pk']).values('version', 'updated_at').first()
+        return self._stamp
+
+    def get_version_stamp(self):
+        stamp = self.get_stamp()
+        if stamp is None:
+            return None
+        return f"survey-{self.kwargs['pk']}-{stamp['version']}-{int(user_has_admin_access(self.request.user))}"
+
+    def get_last_modified(self):
+        stamp = self.get_stamp()
+        return stamp['updated_at'] if stamp else None
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         survey = self.object
 
-        # Для администраторов показываем всех пользователей кроме уже добавленных
-        existing_users = survey.respondents.values_list('user_id', flat=True)
-        context['available_users'] = User.objects.exclude(id__in=existing_users)
+        # Живой прогресс: partials/survey_progress.html подписывается на этот поток
+        context['progress_stream_url'] = reverse('survey_progress', args=[survey.pk])
 
         # Добавляем флаг администратора в контекст
         context['is_admin'] = user_has_admin_access(self.request.user)
@@ -149,6 +218,196 @@ class SurveyDetailView(LoginRequiredMixin, DetailView):
 
 
 
+class SurveyProgressStreamView(View):
+    """Живой прогресс опроса (server-sent events) для администраторов и руководителей.
+
+    Сначала отправляется полный срез (событие snapshot), затем счётчики
+    участников по событиям отправки оценок (progress) - таблица Rater не
+    опрашивается. Асинхронное представление: под ASGI (survey360.asgi)
+    открытый поток не занимает рабочий поток сервера.
+
+    request_finished, закрывающий соединение с БД, придёт только в конце
+    потока, поэтому после каждого чтения соединение освобождается по
+    CONN_MAX_AGE (под ASGI по умолчанию 0) и не висит между событиями.
+    """
+
+    async def get(self, request, pk):
+        user = await request.auser()
+        if not await sync_to_async(user_has_admin_access)(user):
+            return JsonResponse(
+                {'status': 'error', 'message': 'Доступ только для администраторов и руководителей'},
+                status=403
+            )
+        if not await Survey.objects.filter(pk=pk).aexists():
+            return JsonResponse({'status': 'error', 'message': 'Опрос не найден'}, status=404)
+
+        response = StreamingHttpResponse(self.stream(pk), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Без буферизации событий в nginx
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @staticmethod
+    def read_progress(survey_id):
+        try:
+            return survey_progress(survey_id)
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    async def stream(survey_id):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        namespace = progress_namespace(survey_id)
+        # Подписка до среза: изменения между ними не теряются
+        broker.subscribe(survey_id, loop, queue)
+        try:
+            version = await sync_to_async(get_cache_version)(namespace)
+            yield format_event('snapshot', await sync_to_async(SurveyProgressStreamView.read_progress)(survey_id))
+            local_events = 0
+            check_at = loop.time() + PROGRESS_KEEPALIVE
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), max(check_at - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    # Версия сдвинулась больше, чем на число своих событий -
+                    # оценки менялись в другом процессе
+                    current = await sync_to_async(get_cache_version)(namespace)
+                    if current != version + local_events:
+                        yield format_event(
+                            'snapshot', await sync_to_async(SurveyProgressStreamView.read_progress)(survey_id)
+                        )
+                    else:
+                        yield ': keepalive\n\n'
+                    version, local_events = current, 0
+                    check_at = loop.time() + PROGRESS_KEEPALIVE
+                    continue
+                local_events += 1
+                yield format_event('progress', event)
+        finally:
+            broker.unsubscribe(survey_id, loop, queue)
+
+
+class UserSearchView(ReplicaReadMixin, LoginRequiredMixin, View):
+    """Поиск пользователей по префиксу ФИО, логина, должности или отдела.
+
+    Отдаёт JSON постранично, чтобы страницы опросов не грузили весь
+    справочник сотрудников в <select>.
+    """
+    page_size = 20
+
+    def get(self, request, *args, **kwargs):
+        if not user_has_admin_access(request.user):
+            return JsonResponse(
+                {'status': 'error', 'message': 'Недостаточно прав'},
+                status=403
+            )
+
+        page = request.GET.get('page', '1')
+        page = int(page) if page.isdigit() and int(page) > 0 else 1
+        users = search_users(request.GET.get('q', ''))
+        exclude_survey = request.GET.get('exclude_survey', '')
+        if exclude_survey.isdigit():
+            users = users.exclude(respondent_surveys__survey_id=int(exclude_survey))
+
+        offset = (page - 1) * self.page_size
+        found = list(users.only(
+            'id', 'username', 'first_name', 'last_name', 'position', 'department'
+        )[offset:offset + self.page_size + 1])
+
+        return JsonResponse({
+            'status': 'success',
+            'results': [
+                {
+                    'id': user.id,
+                    'username': user.username,
+                    'name': user_label(user),
+                    'department': user.department or '',
+                }
+                for user in found[:self.page_size]
+            ],
+            'page': page,
+            'has_more': len(found) > self.page_size,
+        })
+
+
+class SurveyScoresView(ReplicaReadMixin, LoginRequiredMixin, View):
+    """Текущие оценки опроса по вопросам (JSON) из накопительных сумм ScoreAggregate.
+
+    Доступны до генерации отчётов и не читают сырые ответы; ?respondent=<id>
+    ограничивает статистику одним участником.
+    """
+
+    def get(self, request, pk):
+        if not user_has_admin_access(request.user):
+            return JsonResponse(
+                {'status': 'error', 'message': 'Недостаточно прав'},
+                status=403
+            )
+        if not Survey.objects.filter(pk=pk).exists():
+            return JsonResponse({'status': 'error', 'message': 'Опрос не найден'}, status=404)
+
+        respondent = request.GET.get('respondent', '')
+        scores = survey_scores(pk, int(respondent) if respondent.isdigit() else None)
+        return JsonResponse({
+            'status': 'success',
+            'questions': [
+                {'question': question_id, **stats}
+                for question_id, stats in sorted(scores.items())
+            ],
+        })
+
+
+class ReportDetailView(ReplicaReadMixin, LoginRequiredMixin, DetailView):
+    """Отчёт по участнику строится только из материализованных ReportScore"""
+    model = Report
+    template_name = 'feedback360/report_detail.html'
+    context_object_name = 'report'
+
+    def get_queryset(self):
+        if user_has_admin_access(self.request.user):
+            return Report.objects.select_related('survey', 'respondent__user')
+        return Report.objects.none()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        relationship_types = dict(Rater.RELATIONSHIP_TYPES)
+
+        rows = {}
+        groups = {}
+        scores = self.object.scores.select_related('question', 'rater_group').order_by(
+            'question__sort_order', 'question_id'
+        )
+        for score in scores:
+            row = rows.setdefault(score.question_id, {
+                'question': score.question,
+                'total': None,
+                'by_relationship': {},
+                'by_group': {},
+            })
+            if score.relationship_type:
+                row['by_relationship'][score.relationship_type] = score
+            elif score.rater_group_id:
+                groups[score.rater_group_id] = score.rater_group
+                row['by_group'][score.rater_group_id] = score
+            else:
+                row['total'] = score
+
+        used_types = [
+            code for code in relationship_types
+            if any(code in row['by_relationship'] for row in rows.values())
+        ]
+        for row in rows.values():
+            row['relationship_cells'] = [row['by_relationship'].get(code) for code in used_types]
+            row['group_cells'] = [row['by_group'].get(group_id) for group_id in groups]
+
+        context['rows'] = list(rows.values())
+        context['relationship_columns'] = [relationship_types[code] for code in used_types]
+        context['group_columns'] = list(groups.values())
+        context['summary'] = self.object.report_data
+        return context
+
+
 class QuestionCreateView(LoginRequiredMixin, CreateView):
     model = Question
     form_class = QuestionForm
@@ -156,6 +415,7 @@ class QuestionCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         survey = get_object_or_404(Survey, pk=self.kwargs['pk'])
+        survey.customize_questions()
         form.instance.survey = survey
         messages.success(self.request, "Вопрос успешно добавлен!")
         return super().form_valid(form)
@@ -188,6 +448,25 @@ class LeaderSurveyUpdateView(LeaderRequiredMixin, UpdateView):
         return super().get_queryset().filter(created_by=self.request.user)
 
 
+def _template_stamp(request, template_id):
+    """Версия шаблона, прочитанная один раз на запрос для ETag и Last-Modified"""
+    stamps = request.__dict__.setdefault('_template_stamps', {})
+    if template_id not in stamps:
+        stamps[template_id] = SurveyTemplate.objects.filter(pk=template_id).values('version', 'updated_at').first()
+    return stamps[template_id]
+
+
+def _template_questions_etag(request, template_id):
+    stamp = _template_stamp(request, template_id)
+    return f"template-{template_id}-{stamp['version']}" if stamp else None
+
+
+def _template_questions_last_modified(request, template_id):
+    stamp = _template_stamp(request, template_id)
+    return stamp['updated_at'] if stamp else None
+
+
+@condition(etag_func=_template_questions_etag, last_modified_func=_template_questions_last_modified)
 def get_template_questions(request, template_id):
     try:
         template = SurveyTemplate.objects.get(pk=template_id)
@@ -206,13 +485,26 @@ def get_template_questions(request, template_id):
 
 
 
-class TemplateListView(AdminRequiredMixin, ListView):
-    model = SurveyTemplate
+class TemplateListView(AdminRequiredMixin, ConditionalGetMixin, TemplateView):
     template_name = 'feedback360/template_list.html'
-    context_object_name = 'templates'
 
-    def get_queryset(self):
-        return SurveyTemplate.objects.all().prefetch_related('template_questions')
+    def get_stamp(self):
+        if not hasattr(self, '_stamp'):
+            self._stamp = catalogue_stamp()
+        return self._stamp
+
+    def get_version_stamp(self):
+        # Last-Modified не отдаём: по нему удаление шаблона не было бы видно
+        can_manage = self.request.user.has_perm('feedback360.can_manage_templates')
+        return f"templates-{self.get_stamp()}-{int(can_manage)}"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['catalogue'] = render_template_catalogue(
+            self.request.user.has_perm('feedback360.can_manage_templates'),
+            self.get_stamp()
+        )
+        return context
 
 
 class TemplateDeleteView(AdminRequiredMixin, DeleteView):
@@ -220,11 +512,11 @@ class TemplateDeleteView(AdminRequiredMixin, DeleteView):
     template_name = 'feedback360/surveytemplate_confirm_delete.html'
     success_url = reverse_lazy('template_list')
 
-    def delete(self, request, *args, **kwargs):
+    def form_valid(self, form):
         try:
-            return super().delete(request, *args, **kwargs)
+            return super().form_valid(form)
         except ProtectedError:
-            messages.error(request, "Невозможно удалить шаблон, так как он используется в опросах")
+            messages.error(self.request, "Невозможно удалить шаблон, так как он используется в опросах")
             return redirect('template_list')
 
 
@@ -288,8 +580,6 @@ class TemplateUpdateView(AdminRequiredMixin, UpdateView):
 
         self.object = form.save()
 
-        # Получаем все существующие вопросы
-        existing_questions = list(self.object.template_questions.all())
         questions_to_keep = []
 
         # Обрабатываем каждую форму
@@ -301,10 +591,12 @@ class TemplateUpdateView(AdminRequiredMixin, UpdateView):
             else:
                 instance = form.save(commit=False)
                 instance.template = self.object
-                questions_to_keep.append(instance)
+                questions_to_keep.append((instance, form.has_changed()))
 
-        # Обновляем порядок вопросов
-        for i, question in enumerate(questions_to_keep):
+        # Обновляем порядок вопросов, сохраняя только новые и изменённые
+        for i, (question, changed) in enumerate(questions_to_keep):
+            if question.pk and not changed and question.sort_order == i + 1:
+                continue
             question.sort_order = i + 1
             question.save()
 
@@ -329,4 +621,350 @@ class QuestionDeleteView(AdminRequiredMixin, View):
             return JsonResponse(
                 {'status': 'error', 'message': str(e)},
                 status=500
-            )
\ No newline at end of file
+            )
+
+class TemplateQuestionsView(AdminRequiredMixin, View):
+    """Точечные изменения вопросов шаблона без повторной отправки всего формсета.
+
+    Принимает JSON с полем action:
+    {"action": "reorder", "order": [id, ...]} - новый порядок всех вопросов;
+    {"action": "add", "question": {...}, "position": 3} - новый вопрос (position необязателен);
+    {"action": "edit", "id": id, "question": {...}} - изменение части полей;
+    {"action": "delete", "id": id} - удаление вопроса.
+    Меняются только затронутые строки.
+    """
+
+    def post(self, request, pk, *args, **kwargs):
+        template = get_object_or_404(SurveyTemplate, pk=pk)
+        try:
+            payload = json.loads(request.body)
+            action = payload['action']
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse(
+                {'status': 'error', 'message': 'Некорректный формат запроса'},
+                status=400
+            )
+
+        handler = getattr(self, f'handle_{action}', None) if isinstance(action, str) else None
+        if handler is None:
+            return JsonResponse(
+                {'status': 'error', 'message': 'Неизвестное действие'},
+                status=400
+            )
+        try:
+            return handler(template, payload)
+        except Question.DoesNotExist:
+            return JsonResponse(
+                {'status': 'error', 'message': 'Вопрос не найден'},
+                status=404
+            )
+        except (ValidationError, KeyError, TypeError, ValueError) as e:
+            message = e.messages[0] if isinstance(e, ValidationError) else 'Некорректные данные'
+            return JsonResponse({'status': 'error', 'message': message}, status=400)
+
+    @staticmethod
+    def question_data(question):
+        return {
+            'id': question.id,
+            'text': question.text,
+            'answer_type': question.answer_type,
+            'is_required': question.is_required,
+            'sort_order': question.sort_order,
+        }
+
+    def get_question(self, template, payload):
+        return Question.objects.get(pk=int(payload['id']), template=template)
+
+    def handle_reorder(self, template, payload):
+        order = [int(question_id) for question_id in payload['order']]
+        updated = template.reorder_questions(order)
+        return JsonResponse({'status': 'success', 'updated': updated})
+
+    def handle_add(self, template, payload):
+        form = TemplateQuestionForm(payload.get('question') or {})
+        if not form.is_valid():
+            return JsonResponse(
+                {'status': 'error', 'message': 'Ошибки в вопросе', 'errors': form.errors},
+                status=400
+            )
+
+        position = payload.get('position')
+        question = form.save(commit=False)
+        question.template = template
+        with transaction.atomic():
+            template.lock()
+            if position is not None:
+                # Освобождаем место одним UPDATE для всех следующих вопросов
+                position = max(int(position), 1)
+                template.template_questions.filter(sort_order__gte=position).update(
+                    sort_order=F('sort_order') + 1
+                )
+                question.sort_order = position
+            question.save()
+        return JsonResponse({'status': 'success', 'question': self.question_data(question)})
+
+    def handle_edit(self, template, payload):
+        question = self.get_question(template, payload)
+        data = {field: getattr(question, field) for field in TemplateQuestionForm._meta.fields}
+        data.update(payload.get('question') or {})
+        form = TemplateQuestionForm(data, instance=question)
+        if not form.is_valid():
+            return JsonResponse(
+                {'status': 'error', 'message': 'Ошибки в вопросе', 'errors': form.errors},
+                status=400
+            )
+        if form.has_changed():
+            form.save()
+        return JsonResponse({'status': 'success', 'question': self.question_data(question)})
+
+    def handle_delete(self, template, payload):
+        question = self.get_question(template, payload)
+        # Пропуск в нумерации не мешает сортировке, остальные строки не трогаем
+        question.delete()
+        return JsonResponse({'status': 'success'})
+
+
+class BaseRaterAnswersView(View):
+    """Приём всех ответов оценивающего одним запросом.
+
+    Ожидает JSON вида {"answers": [{"question": id, "value": 4, "text": "..."}],
+    "complete": true}. Вопросы опроса загружаются одним запросом, ответы
+    записываются одним идемпотентным upsert по (rater, question), статус
+    оценивающего и накопительные суммы оценок обновляются в той же транзакции.
+    """
+
+    def get_rater(self):
+        raise NotImplementedError
+
+    def post(self, request, *args, **kwargs):
+        rater = self.get_rater()
+        if rater is None:
+            return JsonResponse(
+                {'status': 'error', 'message': 'Оценивающий не найден'},
+                status=404
+            )
+
+        survey = rater.respondent.survey
+        if survey.status != 'active':
+            return JsonResponse(
+                {'status': 'error', 'message': 'Опрос не активен'},
+                status=400
+            )
+
+        try:
+            payload = json.loads(request.body)
+            answers = payload['answers']
+            complete = payload.get('complete', False)
+            if not isinstance(answers, list) or not all(isinstance(answer, dict) for answer in answers):
+                raise TypeError('answers должен быть списком объектов')
+            # bool("false") - истина: строки и числа вместо true/false не принимаем
+            if not isinstance(complete, bool):
+                raise TypeError('complete должен быть true или false')
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return JsonResponse(
+                {'status': 'error', 'message': 'Некорректный формат запроса'},
+                status=400
+            )
+
+        questions = {question.id: question for question in survey.get_questions()}
+        responses, errors = self.clean_answers(rater, questions, answers, complete)
+        if errors:
+            return JsonResponse(
+                {'status': 'error', 'message': 'Ошибки в ответах', 'errors': errors},
+                status=400
+            )
+
+        previous_status = rater.status
+        with transaction.atomic():
+            # Промежуточное сохранение не откатывает уже завершённую оценку
+            if complete:
+                rater.status = 'completed'
+                rater.completed_at = timezone.now()
+            elif rater.status == 'pending':
+                rater.status = 'started'
+            # Обновление строки оценивающего идёт первым и блокирует её до конца
+            # транзакции, так что параллельные отправки не теряют дельты агрегатов
+            Rater.objects.filter(pk=rater.pk).update(
+                status=rater.status,
+                completed_at=rater.completed_at
+            )
+            previous = dict(
+                Response.objects.filter(
+                    rater=rater,
+                    question_id__in=[response.question_id for response in responses]
+                ).values_list('question_id', 'answer_value')
+            )
+            Response.objects.bulk_create(
+                responses,
+                update_conflicts=True,
+                unique_fields=['rater', 'question'],
+                update_fields=['answer_value', 'answer_text']
+            )
+            apply_score_changes(
+                survey.id,
+                rater.respondent_id,
+                rater.relationship_type,
+                [
+                    (response.question_id, previous.get(response.question_id), response.answer_value)
+                    for response in responses
+                ]
+            )
+            if rater.status != previous_status:
+                publish_progress_on_commit(survey.id, [rater.respondent_id])
+
+        return JsonResponse({
+            'status': 'success',
+            'saved': len(responses),
+            'rater_status': rater.status
+        })
+
+    @staticmethod
+    def clean_answers(rater, questions, answers, complete):
+        responses = {}
+        errors = {}
+
+        for answer in answers:
+            question_id = str(answer.get('question'))
+            question = questions.get(int(question_id)) if question_id and question_id.isdigit() else None
+            if question is None:
+                errors[str(question_id)] = 'Вопрос не относится к опросу'
+                continue
+
+            value = answer.get('value')
+            text = answer.get('text')
+            if text is not None and not isinstance(text, str):
+                errors[str(question.id)] = 'Текст ответа должен быть строкой'
+                continue
+            text = text or None
+            if question.answer_type == 'scale':
+                if value in (None, ''):
+                    if question.is_required:
+                        errors[str(question.id)] = 'Выберите значение шкалы'
+                    continue
+                try:
+                    value = Decimal(str(value))
+                except InvalidOperation:
+                    value = None
+                # NaN и Infinity разбираются без ошибки, но не сравниваются с границами шкалы
+                if value is None or not value.is_finite():
+                    errors[str(question.id)] = 'Значение шкалы должно быть числом'
+                    continue
+                scale_min, scale_max = question.get_scale_bounds()
+                if not scale_min <= value <= scale_max:
+                    errors[str(question.id)] = f'Значение должно быть от {scale_min} до {scale_max}'
+                    continue
+                # Лишние знаки попали бы в суммы оценок, а в ответе округлились бы
+                if value != value.quantize(ANSWER_VALUE_STEP):
+                    errors[str(question.id)] = f'Не больше {ANSWER_DECIMAL_PLACES} знака после запятой'
+                    continue
+                value = value.quantize(ANSWER_VALUE_STEP)
+            else:
+                value = None
+                if not text and question.is_required:
+                    errors[str(question.id)] = 'Введите ответ'
+                    continue
+
+            responses[question.id] = Response(
+                rater=rater,
+                question=question,
+                answer_value=value,
+                answer_text=text
+            )
+
+        if complete:
+            for question in questions.values():
+                if question.is_required and question.id not in responses and str(question.id) not in errors:
+                    errors[str(question.id)] = 'Обязательный вопрос без ответа'
+
+        return list(responses.values()), errors
+
+
+class RaterAnswersView(LoginRequiredMixin, BaseRaterAnswersView):
+    def get_rater(self):
+        return Rater.objects.select_related('respondent__survey').filter(
+            pk=self.kwargs['pk'],
+            user=self.request.user
+        ).first()
+
+
+def _token_rater(request, token):
+    """Оценивающий по ссылке, прочитанный один раз на запрос для кэша и представления"""
+    raters = request.__dict__.setdefault('_token_raters', {})
+    if token not in raters:
+        try:
+            rater_id, survey_id = read_rater_token(token)
+        except signing.BadSignature:
+            raters[token] = None
+        else:
+            # Подпись проверена без БД; оценивающий, участник и опрос - одним запросом
+            raters[token] = Rater.objects.select_related(
+                'respondent__survey', 'respondent__user'
+            ).filter(pk=rater_id, respondent__survey_id=survey_id).first()
+    return raters[token]
+
+
+class RaterTokenMixin:
+    """Доступ оценивающего по подписанной ссылке из приглашения, без входа в систему"""
+
+    def get_rater(self):
+        return _token_rater(self.request, self.kwargs['token'])
+
+
+class RaterTokenAnswersView(RaterTokenMixin, BaseRaterAnswersView):
+    pass
+
+
+def rater_form_stamp(request, token):
+    """Отметка формы оценки для кэша: статус оценивающего и версия опроса.
+
+    Кэшируется только форма без ответов (статус pending): после сохранения
+    черновика форма показывает ответы и строится заново.
+    """
+    rater = _token_rater(request, token)
+    if rater is None or rater.status != 'pending':
+        return None
+    return f'rater-form-{rater.pk}-{rater.respondent.survey.version}'
+
+
+# Ссылку из приглашения открывают без входа в систему и часто повторно
+@method_decorator(cache_public_page(rater_form_stamp), name='dispatch')
+class RaterFormView(RaterTokenMixin, TemplateView):
+    template_name = 'feedback360/rater_form.html'
+
+    def get(self, request, *args, **kwargs):
+        self.rater = self.get_rater()
+        if self.rater is None:
+            return render(request, 'feedback360/404.html', status=404)
+        return super().get(request, *args, **kwargs)
+
+    def get_questions(self):
+        """Вопросы опроса вместе с уже сохранёнными ответами оценивающего.
+
+        Ответы присоединяются к вопросам в том же запросе (LEFT JOIN по
+        уникальной паре rater, question), поэтому форма с черновиком
+        строится тем же числом запросов, что и пустая.
+        """
+        questions = list(self.rater.respondent.survey.get_questions().annotate(
+            saved=FilteredRelation('responses', condition=Q(responses__rater=self.rater)),
+            saved_value=F('saved__answer_value'),
+            saved_text=F('saved__answer_text'),
+        ))
+        for question in questions:
+            # Значения шкалы в SCALE_CHOICES - строки '1'..'5'
+            value = question.saved_value
+            question.saved_choice = None
+            if value is not None and value == value.to_integral_value():
+                question.saved_choice = str(int(value))
+        return questions
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        survey = self.rater.respondent.survey
+        context.update({
+            'rater': self.rater,
+            'respondent': self.rater.respondent,
+            'survey': survey,
+            'questions': self.get_questions(),
+            'answers_url': reverse('rater_token_answers', kwargs={'token': self.kwargs['token']}),
+        })
+        return context
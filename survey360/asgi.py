@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Поток прогресса опроса (feedback360.views.SurveyProgressStreamView) держит
+соединение открытым; под ASGI-сервером (uvicorn survey360.asgi:application)
+он не занимает рабочий поток, в отличие от WSGI.
 """
 
 import os
@@ -12,5 +16,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'survey360.settings')
+# Под ASGI постоянные соединения с БД не переиспользуются между запросами
+# (каждый запрос работает в своём потоке), а долгие потоки событий держали
+# бы их открытыми - по умолчанию соединение закрывается после запроса
+os.environ.setdefault('DATABASE_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'feedback360.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,6 +58,13 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Доля запросов, профилируемых ProfilingMiddleware (0 - выключено, 1 - все):
+# заголовок Server-Timing и строка JSON в логгер feedback360.profiling.
+# По умолчанию выключено; включается переменной окружения, например 0.01
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+if not 0 <= PROFILING_SAMPLE_RATE <= 1:
+    raise ImproperlyConfigured('PROFILING_SAMPLE_RATE должен быть от 0 до 1')
+
 ROOT_URLCONF = 'survey360.urls'
 
 TEMPLATES = [
@@ -78,13 +88,71 @@ WSGI_APPLICATION = 'survey360.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Постоянные соединения: не открываем новое соединение на каждый запрос.
+# survey360.asgi по умолчанию выставляет 0 - под ASGI они не переиспользуются
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', 60))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'sqlite3.db',
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Реплика только для чтения для отчётов и страниц без записи
+# (feedback360.routers.ReplicaRouter). Локально это копия sqlite3.db:
+#   cp sqlite3.db replica.db && REPLICA_DATABASE=replica.db python manage.py runserver
+REPLICA_DATABASE_ALIAS = 'replica'
+if os.environ.get('REPLICA_DATABASE'):
+    DATABASES[REPLICA_DATABASE_ALIAS] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['REPLICA_DATABASE'],
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['feedback360.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# CACHE_BACKEND=locmem - кэш в памяти процесса (по умолчанию, для разработки),
+# CACHE_BACKEND=file - файлы в CACHE_LOCATION, общие для всех процессов сервера
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'survey360',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', BASE_DIR / 'cache'),
+    },
+}
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+if CACHE_BACKEND not in CACHE_BACKENDS:
+    raise ImproperlyConfigured(
+        f"CACHE_BACKEND должен быть одним из: {', '.join(CACHE_BACKENDS)}"
+    )
+
+CACHES = {
+    'default': {
+        **CACHE_BACKENDS[CACHE_BACKEND],
+        'TIMEOUT': 60 * 60,
+        'KEY_PREFIX': 'survey360',
+        # Стандартных 300 записей не хватает даже на подписи пользователей
+        # одного опроса: при переполнении кэш выбрасывает треть записей
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }
+}
+
+# Время жизни страниц, кэшируемых для анонимных пользователей
+# (feedback360.caching.cache_public_page)
+CACHE_MIDDLEWARE_SECONDS = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -138,6 +206,17 @@ LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'login'
 
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'feedback360.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 # Настройки почты
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.yandex.ru'
@@ -150,3 +229,13 @@ DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
+
+# Формсет участников опроса на несколько тысяч сотрудников превышает
+# стандартный лимит Django в 1000 полей POST
+DATA_UPLOAD_MAX_NUMBER_FIELDS = 20000
+
+# Сколько приглашений отправляется через одно SMTP-соединение
+INVITATION_BATCH_SIZE = 200
+
+# Адрес сайта для ссылок в письмах
+SITE_URL = 'http://localhost:8000'